@@ -0,0 +1,64 @@
+"""
+Offline gazetteer vs remote ArcGIS geocoding.
+
+    python -m benchmarks.bench_gazetteer            # local + remote (needs network)
+    python -m benchmarks.bench_gazetteer --local    # local only
+"""
+import sys
+import time
+import random
+import statistics
+import geocoder
+
+from services import gazetteer
+
+CITIES = ["Tokyo", "東京", "Osaka", "大阪市", "Kyoto", "Sapporo", "Paris", "New York", "São Paulo", "Vellore"]
+POINTS = [(35.6762, 139.6503), (34.6937, 135.5023), (43.0618, 141.3545), (48.8566, 2.3522),
+          (40.7128, -74.0060), (12.9165, 79.1325), (51.5072, -0.1276), (-33.8688, 151.2093)]
+
+
+def _time_per_call(fn, args_list, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for args in args_list:
+            fn(*args)
+    return (time.perf_counter() - start) / (repeat * len(args_list))
+
+
+def bench_local(repeat=2000):
+    start = time.perf_counter()
+    gazetteer.build_binary()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    gaz = gazetteer.Gazetteer(gazetteer.BIN_PATH)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    random.seed(0)
+    random_points = [(random.uniform(-55, 70), random.uniform(-180, 180)) for _ in range(200)]
+    print(f"records:            {gaz.size}")
+    print(f"build binary:       {build_ms:8.1f} ms")
+    print(f"mmap load:          {load_ms:8.3f} ms")
+    print(f"forward lookup:     {_time_per_call(gaz.forward, [(c,) for c in CITIES], repeat) * 1e6:8.1f} µs")
+    print(f"reverse (cities):   {_time_per_call(gaz.reverse, POINTS, repeat) * 1e6:8.1f} µs")
+    print(f"reverse (random):   {_time_per_call(gaz.reverse, random_points, repeat // 20) * 1e6:8.1f} µs")
+
+
+def bench_remote():
+    fwd, rev = [], []
+    for city in CITIES:
+        start = time.perf_counter()
+        geocoder.arcgis(city)
+        fwd.append(time.perf_counter() - start)
+    for lat, lon in POINTS:
+        start = time.perf_counter()
+        geocoder.arcgis([lat, lon], method="reverse")
+        rev.append(time.perf_counter() - start)
+    print(f"arcgis forward:     {statistics.median(fwd) * 1e3:8.1f} ms (median of {len(fwd)})")
+    print(f"arcgis reverse:     {statistics.median(rev) * 1e3:8.1f} ms (median of {len(rev)})")
+
+
+if __name__ == "__main__":
+    bench_local()
+    if "--local" not in sys.argv:
+        bench_remote()
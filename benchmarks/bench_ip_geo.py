@@ -0,0 +1,102 @@
+"""
+Local IP geolocation index (services.ip_geo): build time, load time and lookups/second.
+
+    python -m benchmarks.bench_ip_geo [ipv4 ranges] [ipv6 ranges]
+
+Generates a synthetic GeoLite2-City-style database (blocks + locations CSVs; the real
+IPv4 file has ~3M networks) in a temp directory, builds the index from it and measures:
+cold lookups (random public IPs, LRU bypassed), hot lookups (a Zipf-distributed set of
+client IPs through the LRU) and misses. For comparison, a remote ipinfo lookup is one
+HTTP round trip (~50-300 ms) in a geocoder worker thread.
+"""
+import os
+import csv
+import sys
+import time
+import random
+import tempfile
+import ipaddress
+
+from services import ip_geo
+
+
+def _write_geolite(directory: str, n4: int, n6: int, rng: random.Random):
+    locations_path = os.path.join(directory, "locations.csv")
+    with open(locations_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["geoname_id", "locale_code", "continent_code", "continent_name", "country_iso_code",
+                         "country_name", "subdivision_1_iso_code", "subdivision_1_name", "subdivision_2_iso_code",
+                         "subdivision_2_name", "city_name", "metro_code", "time_zone", "is_in_european_union"])
+        for gid in range(1, 20001):
+            writer.writerow([gid, "en", "AS", "Asia", "JP", "Japan", "", "", "", "", f"City {gid}", "", "", 0])
+
+    header = ["network", "geoname_id", "registered_country_geoname_id", "represented_country_geoname_id",
+              "is_anonymous_proxy", "is_satellite_provider", "postal_code", "latitude", "longitude", "accuracy_radius"]
+    paths = []
+    for version, n, space, min_prefix, max_prefix in ((4, n4, 32, 20, 28), (6, n6, 128, 29, 48)):
+        path = os.path.join(directory, f"blocks-ipv{version}.csv")
+        # Evenly spaced networks over the public space, each a random size
+        step = ((1 << space) - (1 << (space - 2))) // max(n, 1)
+        base = 1 << (space - 2) if version == 6 else 1 << 24
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for i in range(n):
+                prefix = rng.randint(min_prefix, max_prefix)
+                start = (base + i * step) >> (space - prefix) << (space - prefix)
+                network = ipaddress.ip_network((start, prefix))
+                writer.writerow([network, rng.randint(1, 20000), "", "", 0, 0, "",
+                                 round(rng.uniform(-60, 70), 4), round(rng.uniform(-180, 180), 4), 100])
+        paths.append(path)
+    return paths, locations_path
+
+
+def _per_second(fn, ips):
+    start = time.perf_counter()
+    for ip in ips:
+        fn(ip)
+    return len(ips) / (time.perf_counter() - start)
+
+
+def main(n4: int, n6: int):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        blocks, locations = _write_geolite(directory, n4, n6, rng)
+        print(f"synthetic CSVs:      {n4} IPv4 + {n6} IPv6 networks ({time.perf_counter() - start:.1f} s)")
+
+        out = os.path.join(directory, "ipgeo.bin")
+        start = time.perf_counter()
+        built4, built6 = ip_geo.build_index(blocks, locations, out)
+        print(f"build index:         {time.perf_counter() - start:8.2f} s  ({built4} + {built6} ranges, "
+              f"{os.path.getsize(out) / 1e6:.1f} MB)")
+
+        start = time.perf_counter()
+        index = ip_geo.IPIndex(out)
+        print(f"load (mmap):         {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+        # Addresses inside known networks, and public addresses anywhere (mostly misses)
+        v4 = index._ranges[4][0]
+        inside = [str(ipaddress.IPv4Address(v4[rng.randrange(len(v4))] + rng.randint(0, 15))) for _ in range(50000)]
+        anywhere = [str(ipaddress.IPv4Address(rng.randint(1 << 24, (223 << 24)))) for _ in range(50000)]
+        v6 = [str(ipaddress.IPv6Address(rng.getrandbits(126) | (1 << 125))) for _ in range(20000)]
+        hits = sum(1 for ip in inside if index.lookup(ip))
+        print(f"cold lookups (v4):   {_per_second(index.lookup, inside):10,.0f} /s  ({hits / len(inside):.0%} found)")
+        print(f"random public v4:    {_per_second(index.lookup, anywhere):10,.0f} /s")
+        print(f"random v6:           {_per_second(index.lookup, v6):10,.0f} /s")
+
+        # Hot client IPs through the LRU (the path resolve_coordinates takes)
+        ip_geo._index, ip_geo._index_loaded = index, True
+        clients = inside[:2000]
+        weights = [1 / (rank + 1) for rank in range(len(clients))]
+        hot = rng.choices(clients, weights, k=100000)
+        ip_geo._cached_lookup.cache_clear()
+        rate = _per_second(ip_geo.lookup_ip, hot)
+        cache = ip_geo._cached_lookup.cache_info()
+        print(f"hot lookups (LRU):   {rate:10,.0f} /s  (cache hit ratio {cache.hits / (cache.hits + cache.misses):.1%})")
+
+
+if __name__ == "__main__":
+    n4 = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n6 = int(sys.argv[2]) if len(sys.argv) > 2 else 200_000
+    main(n4, n6)
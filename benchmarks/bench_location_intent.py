@@ -0,0 +1,116 @@
+"""
+Precision / recall of the local location-intent detector on a labeled sample.
+
+    python -m benchmarks.bench_location_intent
+
+AMBIGUOUS results are counted as deferred to the LLM (not as errors); precision and
+recall are computed over the messages the detector settled locally.
+"""
+import time
+
+from services.location_intent import detect_location_locally, get_automaton, MATCH, AMBIGUOUS
+
+# (message, expected canonical location or None)
+SAMPLES = [
+    ("What's the weather in Tokyo?", "Tokyo"),
+    ("weather tokyo", "Tokyo"),
+    ("Is it raining in Osaka right now?", "Osaka"),
+    ("How about Kyoto tomorrow?", "Kyoto"),
+    ("I'm flying to Sapporo next week, what should I pack?", "Sapporo"),
+    ("What's it like in New York?", "New York City"),
+    ("How hot is it in São Paulo", "São Paulo"),
+    ("weather in sao paulo", "São Paulo"),
+    ("Any good museums in Paris if it rains?", "Paris"),
+    ("Tell me about London", "London"),
+    ("Should I bring an umbrella to Fukuoka?", "Fukuoka"),
+    ("Is Yokohama windy today?", "Yokohama"),
+    ("What's the forecast for Nagoya?", "Nagoya"),
+    ("I'm going to Nice", "Nice"),
+    ("Let's go to Kyoto", "Kyoto"),
+    ("What is the weather like in France?", "France"),
+    ("How cold is Canada right now", "Canada"),
+    ("Will it snow in Hokkaido?", "Hokkaido"),
+    ("Good places to run in Berlin?", "Berlin"),
+    ("Weather in Vellore please", "Vellore"),
+    ("Is Singapore humid today?", "Singapore"),
+    ("Recommend a jazz club in Chicago", "Chicago"),
+    ("東京の天気は？", "Tokyo"),
+    ("大阪に行きたい", "Osaka"),
+    ("京都は雨ですか", "Kyoto"),
+    ("札幌の気温を教えて", "Sapporo"),
+    ("パリの天気", "Paris"),
+    ("ニューヨークは寒い？", "New York City"),
+    ("フランスの天気", "France"),
+    ("沖縄に旅行したい", "Okinawa"),
+    ("福岡で傘は必要？", "Fukuoka"),
+    ("名古屋の明日の天気", "Nagoya"),
+    ("What should I wear today?", None),
+    ("Is it going to rain in the evening?", None),
+    ("Thanks!", None),
+    ("That's nice!", None),
+    ("What about tomorrow?", None),
+    ("Should I bring an umbrella?", None),
+    ("Tell me a fun activity for this weekend", None),
+    ("How's the weather?", None),
+    ("Any outdoor sports I can do here?", None),
+    ("What's a good outfit in this heat?", None),
+    ("I feel cold, any advice?", None),
+    ("Recommend some music for a rainy day", None),
+    ("Is it a good day for a picnic in the park?", None),
+    ("ping", None),
+    ("明日の天気は？", None),
+    ("今日は何を着ればいい？", None),
+    ("傘は必要ですか", None),
+    ("ありがとう！", None),
+    ("週末の天気はどう？", None),
+    ("おすすめの音楽は？", None),
+    ("近くの公園に行きたい", None),
+    ("今夜は寒い？", None),
+    ("Should I visit Hogsmeade?", "Hogsmeade"),
+    ("ニセコの天気", "Niseko"),
+    ("Nice weather today", None),
+    ("Tokyo or Osaka this weekend?", "Tokyo"),
+    # Abbreviations and "the <Place>" references the automaton doesn't know
+    ("What about LA?", "Los Angeles"),
+    ("NYC?", "New York City"),
+    ("Is SF foggy today?", "San Francisco"),
+    ("I'm heading to the Alps", "Alps"),
+    ("Any hikes in the Lake District?", "Lake District"),
+    ("Is the UV index high today?", None),
+    ("OK, thanks!", None),
+    ("What about the weekend?", None),
+    ("WHAT SHOULD I WEAR TODAY?", None),
+]
+
+
+def main():
+    get_automaton()
+    tp = fp = fn = tn = deferred = 0
+    start = time.perf_counter()
+    for message, expected in SAMPLES:
+        status, name = detect_location_locally(message)
+        if status == AMBIGUOUS:
+            deferred += 1
+        elif status == MATCH and name == expected:
+            tp += 1
+        elif status == MATCH:
+            fp += 1
+            print(f"  wrong:  {message!r} -> {name!r} (expected {expected!r})")
+        elif expected is None:
+            tn += 1
+        else:
+            fn += 1
+            print(f"  missed: {message!r} (expected {expected!r})")
+    per_msg_us = (time.perf_counter() - start) / len(SAMPLES) * 1e6
+
+    settled = len(SAMPLES) - deferred
+    print(f"samples:            {len(SAMPLES)}")
+    print(f"settled locally:    {settled} ({settled / len(SAMPLES):.0%}), deferred to LLM: {deferred}")
+    print(f"precision:          {tp / (tp + fp) if tp + fp else 0:.3f}")
+    print(f"recall:             {tp / (tp + fn) if tp + fn else 0:.3f}")
+    print(f"true negatives:     {tn}")
+    print(f"latency:            {per_msg_us:.1f} µs / message")
+
+
+if __name__ == "__main__":
+    main()
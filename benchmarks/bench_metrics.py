@@ -0,0 +1,107 @@
+"""
+Hot-path cost of the instrumentation layer (services.metrics).
+
+    python -m benchmarks.bench_metrics [iterations]
+
+Measures a bare span() (outside a request), a span inside a request (also collected for
+Server-Timing), Histogram.observe, and a full request through MetricsMiddleware vs. the
+same trivial ASGI app without it. Also checks the bucket quantile estimates against
+exact percentiles of a log-normal sample.
+"""
+import sys
+import time
+import random
+import asyncio
+
+from services import metrics
+
+
+def _per_call_ns(fn, n):
+    start = time.perf_counter_ns()
+    fn(n)
+    return (time.perf_counter_ns() - start) / n
+
+
+def _loop_empty(n):
+    for _ in range(n):
+        pass
+
+
+def _loop_span(n):
+    for _ in range(n):
+        with metrics.span("bench"):
+            pass
+
+
+def _loop_observe(n):
+    hist = metrics.Histogram()
+    for i in range(n):
+        hist.observe(0.0001 * (i % 5000))
+
+
+async def _asgi_ns(app, n):
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        await app(scope, receive, send)
+    return (time.perf_counter_ns() - start) / n
+
+
+async def _trivial_app(scope, receive, send):
+    with metrics.span("stage"):
+        pass
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _quantile_accuracy():
+    rng = random.Random(1)
+    samples = [rng.lognormvariate(-1.0, 0.8) for _ in range(100_000)]
+    hist = metrics.Histogram()
+    for s in samples:
+        hist.observe(s)
+    samples.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = samples[int(q * len(samples)) - 1]
+        estimate = hist.quantile(q)
+        print(f"  p{int(q * 100):<3} exact {exact * 1000:8.1f} ms   estimate {estimate * 1000:8.1f} ms   "
+              f"error {abs(estimate - exact) / exact * 100:4.1f}%")
+
+
+def main(n):
+    empty = _per_call_ns(_loop_empty, n)
+    print(f"span() outside a request : {_per_call_ns(_loop_span, n) - empty:7.0f} ns/call")
+
+    token = metrics._current.set([])
+    try:
+        # The span list grows like a very long request; clear it now and then
+        def in_request(k):
+            for start in range(0, k, 1000):
+                metrics._current.get().clear()
+                _loop_span(min(1000, k - start))
+        print(f"span() inside a request  : {_per_call_ns(in_request, n) - empty:7.0f} ns/call")
+    finally:
+        metrics._current.reset(token)
+
+    print(f"Histogram.observe        : {_per_call_ns(_loop_observe, n) - empty:7.0f} ns/call")
+
+    requests = max(n // 20, 1000)
+    bare = asyncio.run(_asgi_ns(_trivial_app, requests))
+    wrapped = asyncio.run(_asgi_ns(metrics.MetricsMiddleware(_trivial_app), requests))
+    print(f"MetricsMiddleware        : {wrapped - bare:7.0f} ns/request "
+          f"({bare:.0f} ns bare -> {wrapped:.0f} ns wrapped)")
+    print(f"  = {(wrapped - bare) / 1e6 / 1000 * 100:.4f}% of a 1 s /chat request\n")
+
+    print("Quantile estimates (100k log-normal samples):")
+    _quantile_accuracy()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
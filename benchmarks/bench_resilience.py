@@ -0,0 +1,97 @@
+"""
+Upstream admission control (services.resilience) under an outage and a traffic spike,
+against a local Open-Meteo stand-in.
+
+    python -m benchmarks.bench_resilience [spike requests]
+
+- outage: Open-Meteo answers 503 to everything; 60 lookups of expired cells, one after
+  another. Without a breaker every lookup pays the retries; with it the circuit opens
+  after BREAKER_FAILURES and the rest are answered from the stale cache immediately.
+- spike: `spike requests` concurrent lookups of distinct cells while Open-Meteo takes
+  ~250 ms. Without limits they all pile onto the connection pool; with the concurrency
+  limit and bounded queue the excess is refused at once (503 upstream) and the admitted
+  ones keep a bounded latency.
+"""
+import os
+import sys
+import time
+import asyncio
+
+from benchmarks.fake_upstreams import fake_open_meteo_server, LatencyModel
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] if values else float("nan")
+
+
+async def _run(server, spike: int):
+    # Imported after OPEN_METEO_URL points at the stand-in
+    from services import weather_service, resilience
+    from services.http_client import start_http_clients, close_http_clients
+
+    await start_http_clients()
+    upstream = resilience._upstreams["open_meteo"]
+    limits = (upstream.bucket, upstream.capacity)
+
+    def configure(protected: bool):
+        resilience.BREAKER_FAILURES = 5 if protected else 10 ** 9
+        upstream.breaker = resilience.CircuitBreaker()
+        upstream.bucket, upstream.capacity = limits if protected else (None, None)
+        upstream.semaphore = None
+        weather_service._weather_cache.clear()
+
+    async def timed(lat, lon):
+        start = time.perf_counter()
+        try:
+            await weather_service.get_current_weather(lat, lon)
+            ok = True
+        except resilience.UpstreamUnavailableError:
+            ok = None   # Refused before reaching the upstream
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    print(f"{'scenario':22} {'ok':>5} {'stale':>6} {'refused':>8} {'failed':>7} {'p50 ms':>8} {'p99 ms':>8} {'wall s':>7}")
+    try:
+        for protected in (False, True):
+            label = "protected" if protected else "unprotected"
+
+            # Outage: every cell was fetched before and has just expired
+            configure(protected)
+            cells = [(10 + i * 0.5, 20.0) for i in range(60)]
+            for lat, lon in cells:
+                weather_service._weather_cache[weather_service.snap_to_grid(lat, lon)] = (time.time() - 600, {"current": {}})
+            server.latency.base_ms, server.latency.error_rate = 20, 1.0
+            stale_before = weather_service._cache_stats["stale_on_error"]
+            start = time.perf_counter()
+            results = [await timed(lat, lon) for lat, lon in cells]
+            _report(f"outage ({label})", results, time.perf_counter() - start,
+                    weather_service._cache_stats["stale_on_error"] - stale_before)
+
+            # Spike: distinct cold cells at once, slow but healthy upstream
+            configure(protected)
+            server.latency.base_ms, server.latency.error_rate = 250, 0.0
+            start = time.perf_counter()
+            results = await asyncio.gather(*(timed(-40 + i * 0.1, 100.0) for i in range(spike)))
+            _report(f"spike ({label})", results, time.perf_counter() - start, 0)
+    finally:
+        await close_http_clients()
+        server.stop()
+
+
+def _report(name, results, wall, stale):
+    latencies = [seconds * 1000 for ok, seconds in results if ok]
+    refused = sum(1 for ok, _ in results if ok is None)
+    failed = sum(1 for ok, _ in results if ok is False)
+    print(f"{name:22} {len(latencies):5} {stale:6} {refused:8} {failed:7} "
+          f"{_quantile(latencies, 0.5):8.1f} {_quantile(latencies, 0.99):8.1f} {wall:7.2f}")
+
+
+if __name__ == "__main__":
+    spike = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    server = fake_open_meteo_server(LatencyModel(base_ms=20, jitter=0.2, seed=3)).start()
+    os.environ["OPEN_METEO_URL"] = server.url
+    # Rate limit out of the way (spike cells are distinct); the concurrency limit applies
+    os.environ.setdefault("OPEN_METEO_RPS", "100000")
+    asyncio.run(_run(server, spike))
@@ -0,0 +1,83 @@
+"""
+Per-request latency, CPU and memory of /transcribe's audio conversion:
+pre-spawned ffmpeg pipe -> raw LINEAR16 (services.transcoder) vs. the old pydub path
+(ffmpeg subprocess -> AudioSegment resample -> in-memory WAV export -> getvalue()).
+
+    python -m benchmarks.bench_transcode path/to/clip.webm [requests]
+
+Needs ffmpeg on PATH; the pydub baseline also needs `pip install pydub`.
+"""
+import io
+import sys
+import time
+import asyncio
+import resource
+import statistics
+import tracemalloc
+
+from services import transcoder
+
+
+def _cpu_seconds():
+    """CPU used by this process and its (reaped) children, e.g. ffmpeg"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def _pydub_convert(data: bytes) -> bytes:
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(io.BytesIO(data))
+    audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
+    wav_io = io.BytesIO()
+    audio.export(wav_io, format="wav")
+    return wav_io.getvalue()
+
+
+async def _run(name, convert, data, requests, gap=0.05):
+    latencies = []
+    tracemalloc.start()
+    own0, child0 = _cpu_seconds()
+    for _ in range(requests):
+        start = time.perf_counter()
+        await convert(data)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(gap)  # idle gap between requests (lets the pool refill, as in production)
+    own1, child1 = _cpu_seconds()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latencies.sort()
+    print(f"{name:22} p50 {statistics.median(latencies) * 1000:7.1f} ms   "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f} ms   "
+          f"CPU/req in-process {(own1 - own0) / requests * 1000:6.1f} ms, ffmpeg {(child1 - child0) / requests * 1000:6.1f} ms   "
+          f"peak Python alloc {peak / 1024:8.0f} KiB")
+
+
+async def main(path, requests):
+    with open(path, "rb") as f:
+        data = f.read()
+    print(f"input: {path} ({len(data) / 1024:.0f} KiB), {requests} sequential requests\n")
+
+    await transcoder.start_transcoder()
+    await asyncio.sleep(0.5)  # let the pool finish spawning
+
+    await _run("ffmpeg pipe (pooled)", transcoder.to_linear16, data, requests)
+
+    async def pydub_convert(d):
+        return _pydub_convert(d)  # the old path ran this on the event loop
+
+    try:
+        await _run("pydub (old path)", pydub_convert, data, requests)
+    except (ImportError, FileNotFoundError) as e:
+        tracemalloc.stop()
+        print(f"pydub baseline skipped: {e}")
+    await transcoder.stop_transcoder()
+    print(f"\n{transcoder.get_transcoder_stats()}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 20))
@@ -0,0 +1,100 @@
+"""
+End-of-speech -> transcript latency: POST /transcribe (upload the whole recording after
+the user stops) vs. the /transcribe/stream WebSocket (audio sent while recording).
+
+    python -m benchmarks.bench_transcribe_stream path/to/clip.webm [runs]
+
+The clip is sent in real time, in 250 ms MediaRecorder-sized chunks. Runs against the
+local stand-in speech server (benchmarks.fake_upstreams.FakeSTT); needs ffmpeg on PATH.
+"""
+import os
+import sys
+import time
+import threading
+import statistics
+import subprocess
+
+from benchmarks.fake_upstreams import FakeSTT
+
+CHUNK_SECONDS = 0.25
+
+
+def _duration(path):
+    """Clip length in seconds, from decoding it once"""
+    from services.transcoder import FFMPEG_BIN, FFMPEG_ARGS
+
+    with open(path, "rb") as f:
+        pcm = subprocess.run([FFMPEG_BIN, *FFMPEG_ARGS], input=f.read(), capture_output=True, check=True).stdout
+    return len(pcm) / 32000
+
+
+def _one_shot(client, data):
+    start = time.perf_counter()
+    response = client.post("/transcribe", files={"file": ("clip.webm", data, "audio/webm")})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def _streamed(client, data, duration):
+    n_chunks = max(1, int(duration / CHUNK_SECONDS))
+    size = len(data) // n_chunks + 1
+    first_interim = None
+    marks = {}
+    with client.websocket_connect("/transcribe/stream") as ws:
+
+        def record():
+            marks["started"] = time.perf_counter()
+            for i in range(0, len(data), size):
+                ws.send_bytes(data[i:i + size])
+                time.sleep(CHUNK_SECONDS)  # the user is still talking
+            marks["stopped"] = time.perf_counter()
+            ws.send_text("stop")
+
+        recorder = threading.Thread(target=record)
+        recorder.start()
+        while True:
+            message = ws.receive_json()
+            if message["type"] == "interim" and first_interim is None:
+                first_interim = time.perf_counter() - marks["started"]
+            if message["type"] in ("done", "error"):
+                break
+        finished = time.perf_counter()
+        recorder.join()
+    if message["type"] == "error":
+        raise RuntimeError(message.get("detail"))
+    return finished - marks["stopped"], first_interim
+
+
+def main(path, runs):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with open(path, "rb") as f:
+        data = f.read()
+    duration = _duration(path)
+    print(f"input: {path} ({len(data) / 1024:.0f} KiB, {duration:.1f}s of audio), {runs} runs\n")
+
+    with TestClient(app) as client:
+        one_shot = [_one_shot(client, data) for _ in range(runs)]
+        streamed = [_streamed(client, data, duration) for _ in range(runs)]
+
+    after_stop = [s for s, _ in streamed]
+    interims = [i for _, i in streamed if i is not None]
+    print(f"POST /transcribe       stop -> transcript p50 {statistics.median(one_shot) * 1000:7.0f} ms "
+          f"(+ upload time on a real network)")
+    print(f"WS /transcribe/stream  stop -> transcript p50 {statistics.median(after_stop) * 1000:7.0f} ms")
+    if interims:
+        print(f"WS /transcribe/stream  first interim after {statistics.median(interims) * 1000:.0f} ms of speech")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    stt = FakeSTT().start()
+    os.environ["GOOGLE_STT_ENDPOINT"] = stt.endpoint
+    os.environ.setdefault("GOOGLE_TTS_ENDPOINT", "http://127.0.0.1:9")  # Not used; avoids needing credentials
+    try:
+        main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    finally:
+        stt.stop()
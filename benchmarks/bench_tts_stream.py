@@ -0,0 +1,70 @@
+"""
+Time-to-first-audio of /tts streaming vs. one-shot synthesis, by text length.
+
+    python -m benchmarks.bench_tts_stream
+
+Runs against the local stand-in TTS server (benchmarks.fake_upstreams), whose latency
+grows with text length like the real API. Every sentence is unique per run so the TTS
+disk cache never hits.
+"""
+import os
+import time
+import asyncio
+import tempfile
+
+from benchmarks.fake_upstreams import fake_tts_server
+
+SENTENCES_EN = [
+    "It is sunny in Tokyo right now.", "The temperature is twenty two degrees.",
+    "Humidity is around sixty percent.", "A light breeze is coming from the south.",
+    "Tomorrow looks a little cloudier.", "You might want a light jacket tonight.",
+    "Ueno Park is lovely in this weather.", "Enjoy your walk!",
+]
+SENTENCES_JA = [
+    "今日の東京は晴れです。", "気温は二十二度です。", "湿度は六十パーセントくらいです。", "南から弱い風が吹いています。",
+    "明日は少し曇りそうです。", "夜は薄手の上着があると安心です。", "上野公園がおすすめです。", "楽しんでください！",
+]
+
+
+def _text(sentences, n, run_id):
+    # Tag every sentence with the run id so no chunk is already in the disk cache
+    picked = [f"{s[:-1]} {run_id}-{i}{s[-1]}" for i, s in enumerate(sentences[i % len(sentences)] for i in range(n))]
+    return (" " if sentences is SENTENCES_EN else "").join(picked)
+
+
+async def _measure(audio_service, text, lang):
+    start = time.perf_counter()
+    await audio_service.generate_tts(text, lang)
+    one_shot = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first = None
+    async for _chunk in audio_service.stream_tts(text + " ", lang):
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return one_shot, first, total
+
+
+async def main():
+    from services import audio_service
+
+    print(f"{'lang':4} {'sentences':>9} {'chars':>6} {'one-shot':>10} {'stream TTFA':>12} {'stream total':>13}")
+    run = 0
+    for lang, sentences in (("en", SENTENCES_EN), ("ja", SENTENCES_JA)):
+        for n in (1, 2, 4, 8, 16):
+            run += 1
+            text = _text(sentences, n, run)
+            one_shot, first, total = await _measure(audio_service, text, lang)
+            print(f"{lang:4} {n:9d} {len(text):6d} {one_shot * 1000:8.0f}ms {first * 1000:10.0f}ms {total * 1000:11.0f}ms")
+
+
+if __name__ == "__main__":
+    server = fake_tts_server().start()
+    os.environ["GOOGLE_TTS_ENDPOINT"] = server.url
+    os.environ.setdefault("GOOGLE_STT_ENDPOINT", "127.0.0.1:9")  # Not used; avoids needing credentials
+    os.environ["TTS_CACHE_DIR"] = tempfile.mkdtemp(prefix="tts_bench_")
+    try:
+        asyncio.run(main())
+    finally:
+        server.stop()
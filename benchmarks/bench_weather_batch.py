@@ -0,0 +1,60 @@
+"""
+Batch weather vs. one request per place (services.weather_service), against a local
+Open-Meteo stand-in with realistic latency.
+
+    python -m benchmarks.bench_weather_batch [places] [rounds]
+
+For each round, a fresh cache is asked for `places` cities (a multi-city view or a
+comparison question): sequentially, concurrently, and with get_weather_batch. Reports
+wall time and upstream requests per round.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+
+from benchmarks.fake_upstreams import fake_open_meteo_server, LatencyModel
+
+
+async def _run(server, places: int, rounds: int):
+    # Imported after OPEN_METEO_URL points at the stand-in
+    from services import weather_service
+    from services.http_client import start_http_clients, close_http_clients
+
+    await start_http_clients()
+
+    async def sequential(locations):
+        return [await weather_service.get_current_weather(lat, lon) for lat, lon in locations]
+
+    async def concurrent(locations):
+        return await asyncio.gather(*(weather_service.get_current_weather(lat, lon) for lat, lon in locations))
+
+    async def batch(locations):
+        return await weather_service.get_weather_batch(locations)
+
+    rng = random.Random(7)
+    print(f"{places} places, {rounds} rounds (cold cache each round)\n")
+    print(f"{'mode':12} {'ms/round':>10} {'requests/round':>15}")
+    try:
+        for name, fn in (("sequential", sequential), ("concurrent", concurrent), ("batch", batch)):
+            elapsed, requests = 0.0, server.requests
+            for _ in range(rounds):
+                weather_service._weather_cache.clear()
+                locations = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(places)]
+                start = time.perf_counter()
+                results = await fn(locations)
+                elapsed += time.perf_counter() - start
+                assert all(r and r.get("current") for r in results)
+            print(f"{name:12} {elapsed / rounds * 1000:10.1f} {(server.requests - requests) / rounds:15.1f}")
+    finally:
+        await close_http_clients()
+        server.stop()
+
+
+if __name__ == "__main__":
+    places = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    server = fake_open_meteo_server(LatencyModel(base_ms=60, jitter=0.3, seed=1)).start()
+    os.environ["OPEN_METEO_URL"] = server.url
+    asyncio.run(_run(server, places, rounds))
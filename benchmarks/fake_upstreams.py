@@ -0,0 +1,379 @@
+"""
+Local stand-ins for the external upstreams, for benchmarks and load tests.
+
+Each fake runs a plain HTTP server (or a gRPC server, for streaming speech recognition)
+on a background thread with a configurable latency distribution and error rate. Point the services at them through the *_ENDPOINT /
+*_URL environment variables (see each factory's docstring).
+"""
+import json
+import time
+import base64
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class LatencyModel:
+    """Log-normal-ish latency: base + per_unit * units, with multiplicative jitter"""
+
+    def __init__(self, base_ms: float = 50.0, per_unit_ms: float = 0.0, jitter: float = 0.2,
+                 error_rate: float = 0.0, seed: int = None):
+        self.base_ms = base_ms
+        self.per_unit_ms = per_unit_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, units: float = 0.0) -> float:
+        """Seconds to wait before answering"""
+        with self._lock:
+            factor = self._rng.lognormvariate(0.0, self.jitter) if self.jitter else 1.0
+        return (self.base_ms + self.per_unit_ms * units) * factor / 1000.0
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+
+class FakeServer:
+    """
+    Threaded HTTP server. `routes` maps (method, path) -> handler(query, body) returning
+    (status, payload, units): payload is a dict (sent as JSON), bytes, or an iterator of
+    bytes (sent chunked, for streaming APIs), and `units` feeds the latency model (e.g.
+    characters of text to synthesize).
+    """
+
+    def __init__(self, name: str, routes: dict, latency: LatencyModel):
+        self.name = name
+        self.routes = routes
+        self.latency = latency
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                server.requests += 1
+                route = server.routes.get((method, parsed.path))
+                if route is None:
+                    return self._send(404, {"error": {"code": 404, "message": f"no route {method} {parsed.path}"}})
+                status, payload, units = route(parse_qs(parsed.query), body)
+                time.sleep(server.latency.sample(units))
+                if server.latency.should_fail():
+                    return self._send(503, {"error": {"code": 503, "message": "injected failure"}})
+                self._send(status, payload)
+
+            def _send(self, status, payload):
+                if not isinstance(payload, (bytes, dict, list)):
+                    return self._send_chunked(status, payload)
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream" if isinstance(payload, bytes)
+                                 else "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_chunked(self, status, chunks):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=f"fake-{name}", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+# --- Google Cloud Text-to-Speech (REST: POST /v1/text:synthesize) ---
+
+def fake_mp3(n_bytes: int) -> bytes:
+    """Bytes shaped like an MP3 frame stream (frame sync headers), not playable audio"""
+    frame = b"\xff\xfb\x90\x64" + b"\x00" * 413
+    return (frame * (n_bytes // len(frame) + 1))[:n_bytes]
+
+
+def fake_tts_server(latency: LatencyModel = None) -> FakeServer:
+    """Set GOOGLE_TTS_ENDPOINT=<server.url>. Latency scales with text length."""
+
+    def synthesize(query, body):
+        text = json.loads(body)["input"].get("text", "")
+        audio = fake_mp3(len(text.encode("utf-8")) * 120)  # ~1 KB of MP3 per ~8 chars
+        return 200, {"audioContent": base64.b64encode(audio).decode("ascii")}, len(text)
+
+    return FakeServer("tts", {("POST", "/v1/text:synthesize"): synthesize},
+                      latency or LatencyModel(base_ms=150, per_unit_ms=4, jitter=0.15))
+
+
+# --- Open-Meteo (GET /v1/forecast) ---
+
+def _pseudo(lat: float, lon: float, salt: int) -> float:
+    """Deterministic 0..1 value per location, so a place always has the same weather"""
+    return random.Random(hash((round(lat, 2), round(lon, 2), salt))).random()
+
+
+def fake_weather(lat: float, lon: float) -> dict:
+    codes = [0, 1, 2, 3, 45, 61, 63, 80, 95, 71]
+    temperature = round(30 - abs(lat) * 0.5 + _pseudo(lat, lon, 1) * 8, 1)
+    code = codes[int(_pseudo(lat, lon, 2) * len(codes))]
+    return {
+        "current": {
+            "time": time.strftime("%Y-%m-%dT%H:%M"), "interval": 900,
+            "temperature_2m": temperature, "relative_humidity_2m": int(40 + _pseudo(lat, lon, 3) * 50),
+            "is_day": 1, "precipitation": 1.2 if code >= 61 else 0.0, "weather_code": code,
+            "wind_speed_10m": round(_pseudo(lat, lon, 4) * 25, 1),
+        },
+        "daily": {
+            "time": [time.strftime("%Y-%m-%d"), time.strftime("%Y-%m-%d", time.localtime(time.time() + 86400))],
+            "temperature_2m_max": [temperature + 4, temperature + 2], "temperature_2m_min": [temperature - 5, temperature - 6],
+            "precipitation_sum": [0.0, round(_pseudo(lat, lon, 5) * 8, 1)], "weather_code": [code, codes[int(_pseudo(lat, lon, 6) * len(codes))]],
+            "wind_speed_10m_max": [20.0, 25.5],
+        },
+    }
+
+
+def fake_open_meteo_server(latency: LatencyModel = None) -> FakeServer:
+    """Set OPEN_METEO_URL=<server.url>."""
+
+    def forecast(query, body):
+        # Comma-separated coordinate lists -> one result per location, as a list
+        lats = [float(v) for v in query["latitude"][0].split(",")]
+        lons = [float(v) for v in query["longitude"][0].split(",")]
+        results = [{"latitude": lat, "longitude": lon, **fake_weather(lat, lon)} for lat, lon in zip(lats, lons)]
+        return 200, results if len(results) > 1 else results[0], len(results) - 1
+
+    return FakeServer("open_meteo", {("GET", "/v1/forecast"): forecast},
+                      latency or LatencyModel(base_ms=60, jitter=0.3))
+
+
+# --- ArcGIS geocoding (GET .../GeocodeServer/find and /reverseGeocode) ---
+
+def fake_arcgis_server(latency: LatencyModel = None) -> FakeServer:
+    """Set ARCGIS_URL=<server.url>. Any name resolves; reverse lookups name a grid cell."""
+    base = "/arcgis/rest/services/World/GeocodeServer"
+
+    def find(query, body):
+        text = query.get("text", [""])[0]
+        lat, lon = _pseudo(0, 0, hash(text)) * 120 - 60, _pseudo(0, 0, hash(text) + 1) * 360 - 180
+        return 200, {"locations": [{
+            "name": text, "extent": {},
+            "feature": {"geometry": {"x": lon, "y": lat}, "attributes": {"Score": 100, "Addr_Type": "Locality"}},
+        }]}, 0
+
+    def reverse(query, body):
+        lon, lat = (float(v) for v in query["location"][0].split(","))
+        city = f"Cell {round(lat, 1)}/{round(lon, 1)}"
+        return 200, {"address": {"City": city, "Match_addr": city, "CountryCode": "ZZ"},
+                     "location": {"x": lon, "y": lat}}, 0
+
+    return FakeServer("arcgis", {("GET", f"{base}/find"): find, ("GET", f"{base}/reverseGeocode"): reverse},
+                      latency or LatencyModel(base_ms=180, jitter=0.3))
+
+
+# --- ipinfo (GET /<ip>/json) ---
+
+class _AnyPath(dict):
+    """Routes table answering every (method, path) with one handler"""
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+
+    def get(self, key, default=None):
+        return self.handler
+
+
+def fake_ipinfo_server(latency: LatencyModel = None) -> FakeServer:
+    """Set IPINFO_URL=<server.url>. Every IP is placed in a pseudo-random big city."""
+    cities = [("Tokyo", "35.6895,139.6917"), ("Osaka", "34.6937,135.5023"), ("London", "51.5085,-0.1257"),
+              ("New York", "40.7143,-74.0060"), ("Chennai", "13.0878,80.2785")]
+
+    def lookup(query, body):
+        city, loc = random.choice(cities)
+        return 200, {"ip": "203.0.113.7", "city": city, "region": city, "country": "ZZ", "loc": loc}, 0
+
+    return FakeServer("ipinfo", _AnyPath(lookup), latency or LatencyModel(base_ms=90, jitter=0.3))
+
+
+# --- Gemini (REST: models/<model>:generateContent and :streamGenerateContent) ---
+
+def fake_chat_answer(context: str) -> str:
+    """A JSON answer shaped and sized like a real one (avatar_state / hex_color are decided locally)"""
+    city = "Tokyo"
+    for line in context.splitlines():
+        if line.startswith("Location: "):
+            city = line[len("Location: "):].split(" (")[0]
+    return json.dumps({
+        "english_text": f"It's a lovely day in {city}! " + "The weather is pleasant with a light breeze. " * 5,
+        "japanese_text": f"{city}は良い天気です！" + "そよ風が吹いていて過ごしやすいです。" * 5,
+        "summary": f"In {city} (friendly theme), the user asked about the weather.",
+    }, ensure_ascii=False)
+
+
+def fake_gemini_server(latency: LatencyModel = None, model: str = "gemini-2.5-flash-lite",
+                       chunks: int = 8, chunk_ms: float = 40.0) -> FakeServer:
+    """
+    Set GEMINI_ENDPOINT=<server.url>. Chat prompts (with a system instruction) get a JSON
+    answer; other prompts (location detection) get "None". The latency model covers
+    time-to-first-token; streamed answers then arrive in `chunks` pieces `chunk_ms` apart.
+    """
+    path = f"/v1beta/models/{model}"
+
+    def respond(body):
+        request = json.loads(body)
+        prompt = "".join(p.get("text", "") for c in request.get("contents", []) for p in c.get("parts", []))
+        text = fake_chat_answer(prompt) if request.get("systemInstruction") else "None"
+        prompt_tokens = (len(prompt) + len(json.dumps(request.get("systemInstruction", "")))) // 4
+        return text, {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(text) // 4,
+                      "totalTokenCount": prompt_tokens + len(text) // 4}
+
+    def candidate(text, finished):
+        out = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        if finished:
+            out["finishReason"] = "STOP"
+        return out
+
+    def generate(query, body):
+        text, usage = respond(body)
+        return 200, {"candidates": [candidate(text, True)], "usageMetadata": usage}, 0
+
+    def stream(query, body):
+        text, usage = respond(body)
+        size = len(text) // chunks + 1
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+        def body_chunks():
+            yield b"["
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(chunk_ms / 1000.0)
+                last = i == len(pieces) - 1
+                event = {"candidates": [candidate(piece, last)]}
+                if last:
+                    event["usageMetadata"] = usage
+                yield (b",\r\n" if i else b"") + json.dumps(event, ensure_ascii=False).encode("utf-8")
+            yield b"]"
+
+        return 200, body_chunks(), 0
+
+    return FakeServer("gemini", {("POST", f"{path}:generateContent"): generate,
+                                 ("POST", f"{path}:streamGenerateContent"): stream},
+                      latency or LatencyModel(base_ms=450, jitter=0.25))
+
+
+# --- Google Cloud Speech-to-Text (gRPC: Speech/Recognize and Speech/StreamingRecognize) ---
+
+class FakeSTT:
+    """
+    gRPC server for Recognize and StreamingRecognize. Set GOOGLE_STT_ENDPOINT=<server.endpoint>.
+    Recognize answers after `latency` plus `per_second_ms` per second of 16 kHz audio.
+    StreamingRecognize emits an interim result every `interim_every` bytes of audio and a
+    final result every `final_every` bytes (plus one when the client half-closes).
+    """
+
+    def __init__(self, latency: LatencyModel = None, per_second_ms: float = 60.0,
+                 interim_every: int = 16000, final_every: int = 96000):
+        import grpc
+        from concurrent import futures
+        from google.cloud import speech
+
+        self.latency = latency or LatencyModel(base_ms=80, jitter=0.2)
+        self.per_second_ms = per_second_ms
+        self.interim_every = interim_every
+        self.final_every = final_every
+        self.streams = 0
+        self.audio_bytes = 0
+
+        def result(text, is_final):
+            return speech.StreamingRecognizeResponse(results=[speech.StreamingRecognitionResult(
+                alternatives=[speech.SpeechRecognitionAlternative(transcript=text, confidence=0.9 if is_final else 0.0)],
+                is_final=is_final, stability=0.0 if is_final else 0.8, language_code="ja-jp",
+            )])
+
+        def recognize(request, context):
+            seconds = len(request.audio.content) / 32000
+            time.sleep(self.latency.sample() + self.per_second_ms * seconds / 1000.0)
+            words = " ".join(f"単語{i + 1}" for i in range(max(1, int(seconds))))
+            return speech.RecognizeResponse(results=[speech.SpeechRecognitionResult(
+                alternatives=[speech.SpeechRecognitionAlternative(transcript=words, confidence=0.9)],
+                language_code="ja-jp",
+            )])
+
+        def streaming_recognize(request_iterator, context):
+            self.streams += 1
+            words, since_interim, since_final = [], 0, 0
+            for request in request_iterator:
+                n = len(request.audio_content)
+                self.audio_bytes += n
+                since_interim += n
+                since_final += n
+                if since_interim >= self.interim_every:
+                    since_interim = 0
+                    words.append(f"単語{len(words) + 1}")
+                    time.sleep(self.latency.sample())
+                    yield result(" ".join(words), False)
+                if since_final >= self.final_every and words:
+                    since_final = 0
+                    yield result(" ".join(words), True)
+                    words = []
+            if words:
+                time.sleep(self.latency.sample())
+                yield result(" ".join(words), True)
+
+        handler = grpc.method_handlers_generic_handler("google.cloud.speech.v1.Speech", {
+            "Recognize": grpc.unary_unary_rpc_method_handler(
+                recognize,
+                request_deserializer=speech.RecognizeRequest.deserialize,
+                response_serializer=speech.RecognizeResponse.serialize,
+            ),
+            "StreamingRecognize": grpc.stream_stream_rpc_method_handler(
+                streaming_recognize,
+                request_deserializer=speech.StreamingRecognizeRequest.deserialize,
+                response_serializer=speech.StreamingRecognizeResponse.serialize,
+            ),
+        })
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=32))
+        self._server.add_generic_rpc_handlers((handler,))
+        self._port = self._server.add_insecure_port("127.0.0.1:0")
+
+    @property
+    def endpoint(self) -> str:
+        return f"127.0.0.1:{self._port}"
+
+    def start(self):
+        self._server.start()
+        return self
+
+    def stop(self):
+        self._server.stop(grace=None)
@@ -0,0 +1,348 @@
+"""
+Offline load test: the real app against local stand-ins for every upstream.
+
+    python -m benchmarks.loadtest [--scenarios chat,tts,transcribe,location]
+                                  [--concurrency 16] [--duration 20] [--error-rate 0.0]
+                                  [--latency-scale 1.0] [--no-chat-cache] [--clip audio.webm]
+                                  [--out results.json] [--compare baseline.json] [--max-regression 0.15]
+
+For each scenario a fresh server (uvicorn, separate process) is started with Open-Meteo,
+ArcGIS, ipinfo, Gemini, Cloud TTS and Cloud STT all pointed at the fakes in
+benchmarks.fake_upstreams, then driven by a closed loop of `concurrency` clients for
+`duration` seconds. Reported per scenario: throughput, client-side latency percentiles,
+status codes, and the server's own stage percentiles and event-loop lag (/metrics/latency).
+
+Results are written as JSON (default: benchmarks/results/<timestamp>.json). With
+--compare, throughput and p95 are checked against a previous run and the exit code is 1
+if either regressed by more than --max-regression.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+import httpx
+
+from benchmarks.fake_upstreams import (
+    LatencyModel, FakeSTT, fake_open_meteo_server, fake_arcgis_server, fake_ipinfo_server,
+    fake_gemini_server, fake_tts_server,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CITIES = [
+    ("Tokyo", 35.6895, 139.6917), ("Osaka", 34.6937, 135.5023), ("Sapporo", 43.0642, 141.3469),
+    ("London", 51.5085, -0.1257), ("New York", 40.7143, -74.0060), ("Chennai", 13.0878, 80.2785),
+    ("Sydney", -33.8679, 151.2073), ("Paris", 48.8534, 2.3488),
+]
+MESSAGES = [
+    "What's the weather like?", "Should I bring an umbrella today?", "What should I wear tomorrow?",
+    "Any good places to visit?", "Is it a good day for a run?", "How about the weather in {city}?",
+    "今日の天気は？", "{city}の明日の天気はどう？", "Recommend something fun to do this evening.",
+]
+THEMES = ["General", "Travel", "Music", "Fashion", "Sports"]
+PHRASES = [
+    "It is sunny in Tokyo right now.", "Don't forget your umbrella!", "今日は晴れです。",
+    "Tomorrow looks a little cloudier.", "Enjoy your walk!", "夜は少し冷えます。",
+]
+
+
+# --- Request mixes ---
+
+def _chat_request(rng, use_cache):
+    city, lat, lon = rng.choice(CITIES)
+    body = {
+        "user_message": rng.choice(MESSAGES).format(city=rng.choice(CITIES)[0]),
+        "latitude": lat, "longitude": lon, "theme": rng.choice(THEMES),
+        "chat_summary": rng.choice(["No previous context.", f"In {city} (friendly theme), the user asked about the weather."]),
+        "use_cache": use_cache,
+    }
+    return {"method": "POST", "url": "/chat", "json": body}
+
+
+def _tts_request(rng, run_id):
+    # Half stock phrases (cache hits after the first), half unique text
+    text = rng.choice(PHRASES) if rng.random() < 0.5 else f"{rng.choice(PHRASES)} {run_id}-{rng.getrandbits(32)}"
+    return {"method": "POST", "url": "/tts", "json": {"text": text, "language": "ja" if rng.random() < 0.5 else "en"}}
+
+
+def _location_request(rng):
+    if rng.random() < 0.7:
+        _city, lat, lon = rng.choice(CITIES)
+        lat, lon = lat + rng.uniform(-0.2, 0.2), lon + rng.uniform(-0.2, 0.2)
+    else:  # Anywhere (oceans and small towns miss the gazetteer -> ArcGIS)
+        lat, lon = rng.uniform(-60, 70), rng.uniform(-180, 180)
+    return {"method": "GET", "url": "/location", "params": {"lat": round(lat, 4), "lon": round(lon, 4)}}
+
+
+def _transcribe_request(clip):
+    return {"method": "POST", "url": "/transcribe", "files": {"file": ("clip.webm", clip, "audio/webm")}}
+
+
+def _make_clip(path):
+    """3 s Opus/WebM test tone (what MediaRecorder uploads), made with ffmpeg"""
+    from services.transcoder import FFMPEG_BIN
+
+    subprocess.run([FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+                    "-i", "sine=frequency=440:duration=3", "-c:a", "libopus", path], check=True)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# --- Fakes and server ---
+
+class Upstreams:
+    def __init__(self, error_rate: float, scale: float):
+        def model(base_ms, **kw):
+            return LatencyModel(base_ms=base_ms * scale, error_rate=error_rate, **kw)
+
+        self.fakes = {
+            "open_meteo": fake_open_meteo_server(model(60, jitter=0.3)),
+            "arcgis": fake_arcgis_server(model(180, jitter=0.3)),
+            "ipinfo": fake_ipinfo_server(model(90, jitter=0.3)),
+            "gemini": fake_gemini_server(model(450, jitter=0.25)),
+            "tts": fake_tts_server(model(150, per_unit_ms=4 * scale, jitter=0.15)),
+        }
+        self.stt = FakeSTT(model(80, jitter=0.2), per_second_ms=60 * scale)
+
+    def start(self):
+        for fake in self.fakes.values():
+            fake.start()
+        self.stt.start()
+        return self
+
+    def stop(self):
+        for fake in self.fakes.values():
+            fake.stop()
+        self.stt.stop()
+
+    def env(self) -> dict:
+        return {
+            "OPEN_METEO_URL": self.fakes["open_meteo"].url,
+            "ARCGIS_URL": self.fakes["arcgis"].url,
+            "IPINFO_URL": self.fakes["ipinfo"].url,
+            "GEMINI_ENDPOINT": self.fakes["gemini"].url,
+            "GOOGLE_TTS_ENDPOINT": self.fakes["tts"].url,
+            "GOOGLE_STT_ENDPOINT": self.stt.endpoint,
+        }
+
+    def request_counts(self) -> dict:
+        return {**{name: fake.requests for name, fake in self.fakes.items()}, "stt_streams": self.stt.streams}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(env: dict, log_path: str):
+    port = _free_port()
+    log = open(log_path, "a", encoding="utf-8")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}, see {log_path}")
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=1.0).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"server did not become ready, see {log_path}")
+
+
+# --- Load generation ---
+
+async def drive(base_url: str, make_request, concurrency: int, duration: float):
+    latencies, statuses = [], {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker(seed):
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                request = make_request(rng)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(**request)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def summarize(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    ok = sum(n for status, n in statuses.items() if status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "ok": ok,
+        "error_ratio": round(1 - ok / len(latencies), 4) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+            **{f"p{int(q * 100)}": round(_percentile(latencies, q) * 1000, 1) for q in (0.5, 0.95, 0.99)},
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "statuses": statuses,
+    }
+
+
+async def run_scenario(name, base_url, make_request, args):
+    # Short warm-up (pools, caches, pre-spawned ffmpeg), not counted
+    await drive(base_url, make_request, min(args.concurrency, 4), min(2.0, args.duration / 5))
+    latencies, statuses, elapsed = await drive(base_url, make_request, args.concurrency, args.duration)
+    result = summarize(latencies, statuses, elapsed)
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        server = (await client.get("/metrics/latency")).json()
+    result["server_stages"] = server["stages"]
+    result["event_loop_lag_ms"] = server["stages"].get("event_loop.lag", {})
+    return result
+
+
+# --- Reporting ---
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    print(f"\n{'scenario':11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'loop lag p99':>13}")
+    for name, r in results["scenarios"].items():
+        lag = r["event_loop_lag_ms"].get("p99_ms", 0.0)
+        print(f"{name:11} {r['throughput_rps']:8.1f} {r['latency_ms']['p50']:8.1f} {r['latency_ms']['p95']:8.1f} "
+              f"{r['latency_ms']['p99']:8.1f} {r['error_ratio'] * 100:6.1f}% {lag:10.1f} ms")
+
+
+def compare(results, baseline, max_regression):
+    """Prints deltas against a previous run; True if nothing regressed beyond the threshold"""
+    ok = True
+    print(f"\nvs. {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for name, r in results["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if not old:
+            continue
+        rps = r["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0.0
+        p95 = r["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1 if old["latency_ms"]["p95"] else 0.0
+        regressed = rps < -max_regression or p95 > max_regression
+        ok = ok and not regressed
+        print(f"  {name:11} throughput {rps * 100:+6.1f}%   p95 {p95 * 100:+6.1f}%{'   REGRESSION' if regressed else ''}")
+    return ok
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="tenki_loadtest_")
+    clip = None
+    if "transcribe" in args.scenarios:
+        if args.clip:
+            with open(args.clip, "rb") as f:
+                clip = f.read()
+        else:
+            clip = _make_clip(os.path.join(workdir, "clip.webm"))
+
+    run_id = int(time.time())
+    makers = {
+        "chat": lambda rng: _chat_request(rng, not args.no_chat_cache),
+        "tts": lambda rng: _tts_request(rng, run_id),
+        "transcribe": lambda rng: _transcribe_request(clip),
+        "location": _location_request,
+    }
+
+    upstreams = Upstreams(args.error_rate, args.latency_scale).start()
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": _git_commit(),
+            "python": platform.python_version(), "cpus": os.cpu_count(),
+            "concurrency": args.concurrency, "duration_s": args.duration,
+            "error_rate": args.error_rate, "latency_scale": args.latency_scale,
+            "chat_cache": not args.no_chat_cache,
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenarios:
+            env = {**upstreams.env(), "GEMINI_API_KEY": "local",
+                   "TTS_CACHE_DIR": os.path.join(workdir, f"tts_cache_{name}")}
+            log_path = os.path.join(workdir, f"server_{name}.log")
+            proc, base_url = start_server(env, log_path)
+            print(f"▶ {name}: {args.concurrency} clients for {args.duration:.0f}s ({base_url}, log: {log_path})")
+            before = upstreams.request_counts()
+            try:
+                results["scenarios"][name] = await run_scenario(name, base_url, makers[name], args)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+            after = upstreams.request_counts()
+            results["scenarios"][name]["upstream_requests"] = {k: after[k] - before[k] for k in after if after[k] != before[k]}
+    finally:
+        upstreams.stop()
+
+    print_report(results)
+    out = args.out or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResults: {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            if not compare(results, json.load(f), args.max_regression):
+                return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against local upstream stand-ins")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=["chat", "tts", "transcribe", "location"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected upstream failure ratio")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplies every fake's latency")
+    parser.add_argument("--no-chat-cache", action="store_true", help="send use_cache=false on /chat")
+    parser.add_argument("--clip", help="audio file for /transcribe (default: generated 3 s tone)")
+    parser.add_argument("--out", help="results JSON path")
+    parser.add_argument("--compare", help="previous results JSON to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - {"chat", "tts", "transcribe", "location"}
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -2,9 +2,12 @@
 # exit on error
 set -o errexit
 
-# Install ffmpeg (required for pydub)
+# Install ffmpeg (required for audio transcoding)
 apt-get update && apt-get install -y ffmpeg
 
 # Install Python dependencies
 pip install --upgrade pip
 pip install -r requirements.txt
+
+# Prebuild the memory-mapped offline gazetteer
+python -m services.gazetteer build
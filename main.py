@@ -3,19 +3,58 @@ load_dotenv()
 
 import json
 import re
+import secrets
 import uvicorn
 import asyncio
 import httpx
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, UploadFile, File, Request, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, Request, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
 
 
-from schemas import ChatRequest, ChatResponse, TTSRequest
+from schemas import ChatRequest, ChatResponse, TTSRequest, WeatherBatchRequest
 from services.location_service import resolve_coordinates, get_location_name, get_coordinates_from_city
-from services.llm_service import chat_with_gemini, detect_target_location
-from services.audio_service import transcribe_audio, generate_tts
+from services.location_service import FALLBACK_LAT, FALLBACK_LON, FALLBACK_CITY, warm_up_geocoder
+from services.llm_service import chat_with_gemini, chat_with_gemini_stream, detect_target_location, warm_up_models
+from services.audio_service import transcribe_audio, stream_transcription, generate_tts_cached, stream_tts
+from services.audio_service import get_stt_client, get_tts_client
+from services.tts_cache import get_tts_cache_stats, load_index as load_tts_index
+from services.transcoder import start_transcoder, stop_transcoder, get_transcoder_stats
+from services.weather_service import get_weather_cache_stats, get_current_weather, get_weather_batch
+from services.weather_service import peek_weather, prime_weather, snap_to_grid
+from services.http_client import start_http_clients, close_http_clients
+from services.executor import shutdown_executors, get_executor_stats
+from services.resilience import UpstreamUnavailableError, LoadShedMiddleware, get_resilience_stats
+from services.gazetteer import get_gazetteer
+from services.ip_geo import get_ip_index, get_ipgeo_stats
+from services.location_intent import get_automaton, get_intent_stats, mentioned_places
+from services.location_intent import detect_location_locally, MATCH, AMBIGUOUS
+from services.session_store import Session, get_session_store, get_session_stats
+from services.pipeline import StageGraph
+from services.json_stream import IncrementalJSONParser
+from services.prompt_builder import get_prompt_stats
+from services.chat_cache import get_chat_cache_stats
+from services.appearance import resolve_appearance
+from services.metrics import MetricsMiddleware, span, register_stats, render_prometheus, get_latency_summary
+from services.metrics import start_profiler, stop_profiler, start_loop_monitor
+from services.startup import start_warm_up, is_live, readiness, warmed
+from services.warmup import ActivityMiddleware, start_warmup_scheduler, run_probes, record_location, get_warmup_stats
+
+
+# Per-stage deadlines for /chat location resolution (seconds)
+INTENT_DEADLINE = 4.0
+GEOCODE_DEADLINE = 4.0
+DEVICE_DEADLINE = 5.0
+WEATHER_DEADLINE = 6.0
+
+# Other places named in a chat turn ("Tokyo or Osaka?") whose weather goes into the prompt
+MAX_EXTRA_PLACES = 3
+
+# Fields streamed to /chat/stream clients character by character as Gemini writes them
+STREAMED_FIELDS = {"english_text", "japanese_text"}
+# Decided locally from the weather (services.appearance), not passed through from Gemini
+APPEARANCE_FIELDS = {"avatar_state", "hex_color"}
 
 
 def extract_location_from_summary(summary: str) -> str:
@@ -28,57 +67,47 @@ def extract_location_from_summary(summary: str) -> str:
     return None
 
 
-# Background task for keep-alive
-async def keepalive_task():
-    """Background task that keeps the service active and Gemini warm"""
-    await asyncio.sleep(60)  # Wait 1 minute before starting
-    
-    gemini_counter = 0
-    
-    while True:
-        try:
-            # Self-ping every minute to keep Render awake
-            print("🔄 Self-ping to stay active...")
-            
-            # Every 10 minutes, also ping Gemini to keep it warm
-            if gemini_counter >= 10:
-                print("🔄 Pinging Gemini API...")
-                await chat_with_gemini(
-                    message="ping",
-                    history_summary="",
-                    city_name="Tokyo",
-                    lat=35.6762,
-                    lon=139.6503,
-                    theme="friendly"
-                )
-                print("✅ Gemini keep-alive successful")
-                gemini_counter = 0
-            else:
-                print("✅ Self-ping successful")
-                gemini_counter += 1
-            
-        except Exception as e:
-            print(f"⚠️ Keep-alive failed: {e}")
-        
-        # Wait 1 minute before next ping
-        await asyncio.sleep(60)
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager to run background tasks"""
-    # Start the keep-alive task
-    task = asyncio.create_task(keepalive_task())
-    print("🚀 Keep-alive background task started")
+    # Shared outbound connection pools
+    await start_http_clients()
+    # Everything heavy warms up in the background once the port is bound (see /readyz);
+    # each part also initializes lazily if a request needs it first
+    warm_up = start_warm_up({
+        "gazetteer": get_gazetteer,        # offline lookup tables
+        "intent": get_automaton,
+        "ipgeo": get_ip_index,
+        "sessions": get_session_store,
+        "transcoder": start_transcoder,    # pre-spawned ffmpeg workers for /transcribe
+        "gemini": warm_up_models,          # SDK import + one model per theme
+        "stt": get_stt_client,
+        "tts": get_tts_client,
+        "tts_cache": load_tts_index,       # disk cache index (directory scan)
+        "geocoder": warm_up_geocoder,
+    })
+    # Slow-request sampling profiler (only if SLOW_REQUEST_MS is set) and loop-lag sampling
+    start_profiler()
+    lag_monitor = start_loop_monitor()
+    # Probes and prefetches popular places only after real idle periods
+    scheduler = start_warmup_scheduler()
     yield
     # Cleanup on shutdown
-    task.cancel()
-    print("🛑 Keep-alive background task stopped")
+    warm_up.cancel()
+    scheduler.cancel()
+    lag_monitor.cancel()
+    print("🛑 Idle warm-up scheduler stopped")
+    await close_http_clients()
+    await stop_transcoder()
+    stop_profiler()
+    shutdown_executors()
 
 
 app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for React (Vite usually runs on 5173)
+# Innermost of these: CORS wraps it, so shed 503s carry CORS headers
+app.add_middleware(LoadShedMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], # For dev, allow all. Lock down for prod.
@@ -86,36 +115,160 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ActivityMiddleware)
+# Outermost, so request timings include every other middleware
+app.add_middleware(MetricsMiddleware)
+
+# Existing counters, exported as gauges on /metrics
+register_stats("weather_cache", get_weather_cache_stats)
+register_stats("tts_cache", get_tts_cache_stats)
+register_stats("chat_cache", get_chat_cache_stats)
+register_stats("prompt", get_prompt_stats)
+register_stats("intent", get_intent_stats)
+register_stats("executor", get_executor_stats)
+register_stats("transcoder", get_transcoder_stats)
+register_stats("warmup", get_warmup_stats)
+register_stats("ipgeo", get_ipgeo_stats)
+register_stats("sessions", get_session_stats)
+register_stats("resilience", get_resilience_stats)
+
+@app.exception_handler(UpstreamUnavailableError)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailableError):
+    """Worker pool full, rate limit reached or circuit open -> shed load instead of queueing forever"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
 
 @app.get("/")
 def health_check():
     return {"status": "ok", "message": "TenkiGuide Backend is Running"}
 
+@app.get("/healthz")
+def liveness():
+    """Liveness: the process is up and serving (never waits for the warm-up)"""
+    return {"status": "ok" if is_live() else "down"}
+
+@app.get("/readyz")
+def readiness_check():
+    """Readiness: 200 once the background warm-up has finished, 503 while it is running"""
+    ready, details = readiness()
+    return JSONResponse(status_code=200 if ready else 503, content=details)
+
 @app.get("/keepalive")
 async def keepalive():
-    """Health check endpoint that also pings Gemini to keep it active"""
+    """On-demand warm-up probes: connection-pool pings and a 1-token Gemini call (no chat generation)"""
+    probes = await run_probes()
+    gemini_ok = probes.get("gemini") == "ok"
+    return {
+        "status": "ok",
+        "message": "Backend and Gemini API are active" if gemini_ok else "Backend is active",
+        "gemini_responsive": gemini_ok,
+        "probes": probes,
+    }
+
+@app.get("/warmup")
+def warmup_stats():
+    """Idle warm-up scheduler: rounds, last probe results and the most requested places"""
+    return get_warmup_stats()
+
+@app.post("/weather/batch")
+async def weather_batch_endpoint(request: WeatherBatchRequest):
+    """
+    Weather for several places in one call (one Open-Meteo request for all uncached cells).
+    Each location is coordinates or a city name; results come back in the same order.
+    """
+    async def place(location):
+        if location.latitude is not None and location.longitude is not None:
+            return location.latitude, location.longitude, None
+        if location.city:
+            return await _geocode_city(location.city)
+        return None
+
+    places = await asyncio.gather(*(place(loc) for loc in request.locations))
+    resolved = [p for p in places if p]
+    with span("weather.batch"):
+        weathers = iter(await get_weather_batch([(lat, lon) for lat, lon, _ in resolved]))
+    results = []
+    for location, resolved_place in zip(request.locations, places):
+        if resolved_place is None:
+            results.append({"city": location.city, "error": "location not found"})
+            continue
+        lat, lon, name = resolved_place
+        weather = next(weathers)
+        if weather is None:
+            results.append({"latitude": lat, "longitude": lon, "name": name, "error": "weather unavailable"})
+        else:
+            results.append({"latitude": lat, "longitude": lon, "name": name, **weather})
+    return {"results": results}
+
+@app.get("/weather/cache")
+def weather_cache_stats():
+    """Weather cache counters (hits / misses / coalesced) for sizing the grid"""
+    return get_weather_cache_stats()
+
+@app.post("/tts/stream")
+async def tts_stream_endpoint(request: TTSRequest):
+    """Streams MP3 audio sentence by sentence so playback can start before synthesis ends"""
+    stream = stream_tts(request.text, request.language)
     try:
-        # Simple ping to Gemini to keep it warm
-        test_response = await chat_with_gemini(
-            message="ping",
-            history_summary="",
-            city_name="Tokyo",
-            lat=35.6762,
-            lon=139.6503,
-            theme="friendly"
-        )
-        return {
-            "status": "ok",
-            "message": "Backend and Gemini API are active",
-            "gemini_responsive": True
-        }
+        # Fail with a proper status if even the first sentence can't be synthesized
+        first_chunk = await stream.__anext__()
+    except StopAsyncIteration:
+        first_chunk = b""
+    except UpstreamUnavailableError:
+        await stream.aclose()
+        raise
     except Exception as e:
-        return {
-            "status": "ok",
-            "message": "Backend is active",
-            "gemini_responsive": False,
-            "error": str(e)
-        }
+        await stream.aclose()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        yield first_chunk
+        try:
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            print(f"TTS STREAM ERROR: {e}")
+
+    return StreamingResponse(body(), media_type="audio/mpeg")
+
+@app.get("/tts/cache")
+def tts_cache_stats():
+    """TTS disk cache counters (hits / misses / evictions / size)"""
+    return get_tts_cache_stats()
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: stage/route latency histograms (+ p50/p95/p99) and cache counters"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/latency")
+def latency_summary():
+    """p50/p95/p99 per stage and route, as JSON"""
+    return get_latency_summary()
+
+@app.get("/ipgeo/stats")
+def ipgeo_stats():
+    """Local IP geolocation: index hits / misses, LRU counters, range counts"""
+    return get_ipgeo_stats()
+
+@app.get("/chat/cache")
+def chat_cache_stats():
+    """Chat response cache counters (hits / misses / coalesced / bypassed / evictions)"""
+    return get_chat_cache_stats()
+
+@app.get("/chat/sessions")
+def chat_session_stats():
+    """Session store counters (hits / misses / expired / evictions, backend)"""
+    return get_session_stats()
+
+@app.get("/resilience")
+def resilience_stats():
+    """Circuit breaker state, rate limiting and load shedding counters per upstream"""
+    return get_resilience_stats()
+
+@app.get("/prompt/stats")
+def prompt_stats():
+    """Gemini token usage of chat prompts (per request averages, system instruction sizes)"""
+    return get_prompt_stats()
 
 @app.get("/location")
 async def location_endpoint(lat: float = Query(...), lon: float = Query(...)):
@@ -123,9 +276,12 @@ async def location_endpoint(lat: float = Query(...), lon: float = Query(...)):
     try:
         # Use the same logic as in chat endpoint
         client_ip = None  # No IP for this endpoint
-        resolved_lat, resolved_lon = resolve_coordinates(lat, lon, client_ip)
+        resolved_lat, resolved_lon = await resolve_coordinates(lat, lon, client_ip)
         location_name = await get_location_name(resolved_lat, resolved_lon)
+        record_location(resolved_lat, resolved_lon, location_name)
         return {"location_name": location_name}
+    except UpstreamUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -136,73 +292,308 @@ async def transcribe_endpoint(file: UploadFile = File(...)):
         content = await file.read()
         text = await transcribe_audio(content)
         return {"transcript": text}
+    except UpstreamUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.websocket("/transcribe/stream")
+async def transcribe_stream_endpoint(websocket: WebSocket):
+    """
+    Live transcription while the user is still speaking.
+    Client -> binary audio chunks (e.g. MediaRecorder WebM/Opus), then the text message "stop".
+    Server -> {"type": "interim" | "final", "transcript": ...} as results arrive,
+              then {"type": "done", "transcript": <all finals concatenated>} (or {"type": "error"}).
+    """
+    await websocket.accept()
+
+    async def audio_chunks():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                yield message["bytes"]
+            elif message.get("text") == "stop":
+                return
+
+    finals = []
+    try:
+        async for is_final, transcript in stream_transcription(audio_chunks()):
+            if is_final:
+                finals.append(transcript)
+            await websocket.send_json({"type": "final" if is_final else "interim", "transcript": transcript})
+        await websocket.send_json({"type": "done", "transcript": "".join(finals).strip()})
+        await websocket.close()
+    except WebSocketDisconnect:
+        print("🎙️ Transcription stream closed by client")
+    except Exception as e:
+        print(f"❌ Streaming STT Error: {e}")
+        busy = isinstance(e, UpstreamUnavailableError)
+        try:
+            await websocket.send_json({"type": "error", "detail": str(e),
+                                       **({"retry_after": e.retry_after} if busy else {})})
+            await websocket.close(code=1013 if busy else 1011)  # 1013: try again later
+        except Exception:
+            pass
+
+async def _geocode_city(city: str):
+    """(lat, lon, name) for a city name, or None if it could not be resolved"""
+    lat, lon, name = await get_coordinates_from_city(city)
+    return (lat, lon, name) if lat is not None else None
+
+
+async def _extra_places(message: str):
+    """[(name, lat, lon)] for every place the message names, for comparison turns"""
+    await warmed("intent", get_automaton)
+    names = mentioned_places(message)
+    if len(names) < 2:
+        return []
+    places = await asyncio.gather(*(_geocode_city(name) for name in names[:MAX_EXTRA_PLACES + 1]))
+    return [(name, lat, lon) for lat, lon, name in filter(None, places)]
+
+
+def _others(places, location_name: str):
+    others = [p for p in places if p[0].lower() != (location_name or "").lower()]
+    return others[:MAX_EXTRA_PLACES] or None
+
+
+async def _device_location(request: ChatRequest, client_ip: str):
+    """GPS/IP location with its reverse-geocoded name"""
+    lat, lon = await resolve_coordinates(request.latitude, request.longitude, client_ip)
+    return lat, lon, await get_location_name(lat, lon)
+
+
+async def resolve_chat_location(request: ChatRequest, client_ip: str):
+    """
+    Resolves (lat, lon, location_name) for a chat turn.
+    Priority 1: city mentioned in the message, 2: city from the summary, 3: GPS/IP.
+    All three branches (plus a weather prefetch for each) start at once; the highest
+    priority branch that succeeds wins and the others are cancelled. A branch that misses
+    its deadline is treated as failed, so the worst case is the fallback location.
+    """
+    summary_location = extract_location_from_summary(request.chat_summary)
+    graph = StageGraph("chat")
+    graph.add("intent", lambda: detect_target_location(request.user_message), deadline=INTENT_DEADLINE)
+    graph.add("intent_geo", _geocode_city, deps=["intent"], deadline=GEOCODE_DEADLINE)
+    if summary_location:
+        graph.add("summary_geo", lambda: _geocode_city(summary_location), deadline=GEOCODE_DEADLINE)
+    graph.add("device", lambda: _device_location(request, client_ip), deadline=DEVICE_DEADLINE)
+    # Speculative weather prefetch: fills the weather cache before chat_with_gemini asks
+    for branch in ("intent_geo", "summary_geo", "device") if summary_location else ("intent_geo", "device"):
+        graph.add(f"{branch}_weather", lambda loc: get_current_weather(loc[0], loc[1]),
+                  deps=[branch], deadline=WEATHER_DEADLINE)
+    graph.start()
+
+    try:
+        target_city = await graph.result("intent")
+        if target_city:
+            print(f"🎯 User explicitly mentioned: {target_city}")
+            graph.cancel("summary_geo", "summary_geo_weather")
+            location = await graph.result("intent_geo")
+            if location:
+                graph.cancel("device", "device_weather")
+                return location
+        else:
+            graph.cancel("intent_geo", "intent_geo_weather")
+            if summary_location:
+                print(f"📝 Using location from summary: {summary_location}")
+                location = await graph.result("summary_geo")
+                if location:
+                    graph.cancel("device", "device_weather")
+                    return location
+            else:
+                print(f"📍 Using GPS/IP location")
+
+        # Fallback branch (already running since the start)
+        location = await graph.result("device")
+        if location:
+            return location
+        print("Using Fallback: Vellore")
+        return FALLBACK_LAT, FALLBACK_LON, FALLBACK_CITY
+    finally:
+        # Let the winner's weather prefetch finish; everything else still running is a loser
+        graph.cancel("intent", "intent_geo", "summary_geo", "device")
+
+
+def _device_cell(request: ChatRequest):
+    """Grid cell of the request's GPS, or None without GPS"""
+    if request.latitude is None or request.longitude is None:
+        return None
+    return snap_to_grid(request.latitude, request.longitude)
+
+
+async def _session_location(request: ChatRequest):
+    """
+    The session's (lat, lon, location_name) for a follow-up turn, or None to resolve as usual:
+    no session yet, the device's GPS has moved to another grid cell since the last turn, or the
+    message names another place (or might: ambiguous). Resolving as usual saves over the session.
+    Sets request.session_id to the id the response hands back.
+    """
+    store = await warmed("sessions", get_session_store)
+    if store is None:
+        request.session_id = None
+        return None
+    session = await store.load(request.session_id) if request.session_id else None
+    if session is None:
+        # No id, or one we don't know: issue a new one (ids are never chosen by the client)
+        request.session_id = secrets.token_urlsafe(24)
+        return None
+    cell = _device_cell(request)
+    if cell is not None and session.device_cell is not None and cell != session.device_cell:
+        store.record_use(False)
+        return None
+    await warmed("intent", get_automaton)
+    status, place = detect_location_locally(request.user_message)
+    if status == AMBIGUOUS or (status == MATCH and place.lower() != session.location_name.lower()):
+        store.record_use(False)
+        return None
+    store.record_use(True)
+    if session.weather:
+        # Another worker may have saved it: saves this one the Open-Meteo fetch
+        prime_weather(session.lat, session.lon, session.weather, session.weather_expires_at)
+    return session.lat, session.lon, session.location_name
+
+
+async def _save_session(request: ChatRequest, lat: float, lon: float, location_name: str):
+    store = await warmed("sessions", get_session_store)
+    if store is None or not request.session_id:
+        return
+    snapshot = peek_weather(lat, lon)
+    await store.save(Session(request.session_id, lat, lon, location_name, request.theme,
+                             snapshot[1] if snapshot else None, snapshot[0] if snapshot else 0.0,
+                             _device_cell(request)))
+
+
+async def _chat_location(request: ChatRequest, client_ip: str):
+    """(lat, lon, location_name, other places) from the session, or resolved concurrently"""
+    location = await _session_location(request)
+    if location:
+        return (*location, [])
+    (lat, lon, location_name), places = await asyncio.gather(
+        resolve_chat_location(request, client_ip), _extra_places(request.user_message))
+    return lat, lon, location_name, places
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest, req: Request):
     
-    # Priority 1: Check if user explicitly mentioned a city in current message
-    target_city = await detect_target_location(request.user_message)
-    
-    if target_city:
-        print(f"🎯 User explicitly mentioned: {target_city}")
-        new_lat, new_lon, new_name = await get_coordinates_from_city(target_city)
-        if new_lat is not None:
-            lat = new_lat
-            lon = new_lon
-            location_name = new_name
-        else:
-            # Fallback if city lookup fails
-            client_ip = req.client.host
-            lat, lon = resolve_coordinates(request.latitude, request.longitude, client_ip)
-            location_name = await get_location_name(lat, lon)
-    else:
-        # Priority 2: Check summary for previous location (context continuity)
-        summary_location = extract_location_from_summary(request.chat_summary)
-        if summary_location:
-            print(f"📝 Using location from summary: {summary_location}")
-            new_lat, new_lon, new_name = await get_coordinates_from_city(summary_location)
-            if new_lat is not None:
-                lat = new_lat
-                lon = new_lon
-                location_name = new_name
-            else:
-                # Fallback if summary city lookup fails
-                client_ip = req.client.host
-                lat, lon = resolve_coordinates(request.latitude, request.longitude, client_ip)
-                location_name = await get_location_name(lat, lon)
-        else:
-            # Priority 3: Fall back to GPS/IP location (initial default)
-            print(f"📍 Using GPS/IP location")
-            client_ip = req.client.host
-            lat, lon = resolve_coordinates(request.latitude, request.longitude, client_ip)
-            location_name = await get_location_name(lat, lon)
+    # 1-2. Resolve the location (message city > summary city > GPS/IP), concurrently
+    with span("location"):
+        lat, lon, location_name, places = await _chat_location(request, req.client.host)
+    record_location(lat, lon, location_name)
             
     # 3. Call Gemini (Now passing the CORRECT location's coords)
-    raw_response = await chat_with_gemini(
-        message=request.user_message,
-        history_summary=request.chat_summary,
-        city_name=location_name, # Passed to prompt
-        lat=lat,                 # Passed to weather service
-        lon=lon,                 # Passed to weather service
-        theme=request.theme
-    )
+    try:
+        raw_response = await chat_with_gemini(
+            message=request.user_message,
+            history_summary=request.chat_summary,
+            city_name=location_name, # Passed to prompt
+            lat=lat,                 # Passed to weather service
+            lon=lon,                 # Passed to weather service
+            theme=request.theme,
+            use_cache=request.use_cache is not False,
+            extra_places=_others(places, location_name)
+        )
+    except UpstreamUnavailableError:
+        raise  # 503 + Retry-After
+    except Exception as e:
+        print(f"Gemini Error: {e}")
+        raise HTTPException(status_code=502, detail="AI service error")
     
     # 4. Parse and Return
     try:
-        data = json.loads(raw_response)
+        with span("json.parse"):
+            data = json.loads(raw_response)
         data["location_name"] = location_name 
+        data["session_id"] = request.session_id
+        await _save_session(request, lat, lon, location_name)
         return data
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Failed to parse AI response")
 
+async def _weather_or_empty(lat: float, lon: float):
+    """Weather for the avatar (normally a cache hit: the location stage prefetched it)"""
+    try:
+        return await get_current_weather(lat, lon)
+    except Exception:
+        return {}
+
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, req: Request):
+    """
+    Streaming variant of /chat (NDJSON, one event per line):
+    - {"event": "location", "location_name": ...}
+    - {"event": "delta", "field": "english_text" | "japanese_text", "text": ...}
+    - {"event": "field", "field": "avatar_state" | "hex_color" | "summary", "value": ...}
+      (avatar_state and hex_color come first, from the weather, and again if Gemini
+      signals an emotional override)
+    - {"event": "final", "data": <ChatResponse>} or {"event": "error", "detail": ...}
+      (with "retry_after" seconds when an upstream is shedding load)
+    """
+    client_ip = req.client.host
+
+    async def events():
+        try:
+            with span("location"):
+                lat, lon, location_name, places = await _chat_location(request, client_ip)
+            record_location(lat, lon, location_name)
+            yield _ndjson({"event": "location", "location_name": location_name})
+
+            weather = await _weather_or_empty(lat, lon)
+            avatar_state, hex_color = resolve_appearance(weather)
+            yield _ndjson({"event": "field", "field": "avatar_state", "value": avatar_state})
+            yield _ndjson({"event": "field", "field": "hex_color", "value": hex_color})
+
+            parser = IncrementalJSONParser()
+            async for chunk in chat_with_gemini_stream(
+                message=request.user_message,
+                history_summary=request.chat_summary,
+                city_name=location_name,
+                lat=lat,
+                lon=lon,
+                theme=request.theme,
+                use_cache=request.use_cache is not False,
+                extra_places=_others(places, location_name)
+            ):
+                for kind, field, value in parser.feed(chunk):
+                    if kind == "delta" and field in STREAMED_FIELDS:
+                        yield _ndjson({"event": "delta", "field": field, "text": value})
+                    elif kind == "field" and field == "avatar_state":
+                        override = resolve_appearance(weather, value)
+                        if override != (avatar_state, hex_color):
+                            avatar_state, hex_color = override
+                            yield _ndjson({"event": "field", "field": "avatar_state", "value": avatar_state})
+                            yield _ndjson({"event": "field", "field": "hex_color", "value": hex_color})
+                    elif kind == "field" and field not in STREAMED_FIELDS | APPEARANCE_FIELDS:
+                        yield _ndjson({"event": "field", "field": field, "value": value})
+
+            if not parser.done:
+                raise ValueError("Failed to parse AI response")
+            final = ChatResponse(**{**parser.result, "avatar_state": avatar_state, "hex_color": hex_color,
+                                    "location_name": location_name, "session_id": request.session_id})
+            await _save_session(request, lat, lon, location_name)
+            yield _ndjson({"event": "final", "data": final.model_dump()})
+        except UpstreamUnavailableError as e:
+            yield _ndjson({"event": "error", "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield _ndjson({"event": "error", "detail": str(e)})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
 @app.post("/tts")
 async def tts_endpoint(request: TTSRequest):
     """Generates Audio on demand"""
     try:
-        audio_content = await generate_tts(request.text, request.language)
-        return Response(content=audio_content, media_type="audio/mpeg")
+        # Served straight from the cache file (no bytes held in Python memory)
+        audio_path = await generate_tts_cached(request.text, request.language)
+        return FileResponse(audio_path, media_type="audio/mpeg")
+    except UpstreamUnavailableError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
 # Frontend sends this to get a response
@@ -8,12 +8,25 @@ class ChatRequest(BaseModel):
     longitude: Optional[float] = None
     chat_summary: Optional[str] = "No previous context."
     theme: Optional[str] = "General"
+    use_cache: Optional[bool] = True  # False forces a fresh Gemini answer
+    # Issued by the server (ChatResponse.session_id); send it back so follow-ups reuse the resolved place
+    session_id: Optional[str] = Field(None, min_length=16, max_length=128, pattern=r"^[A-Za-z0-9_-]+$")
 
 # Frontend sends this to get Audio
 class TTSRequest(BaseModel):
     text: str
     language: str  # "en" or "ja"
 
+# One place for /weather/batch: coordinates, or a city name to geocode
+class WeatherLocation(BaseModel):
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+    city: Optional[str] = None
+
+# Frontend sends this to get the weather for several places at once
+class WeatherBatchRequest(BaseModel):
+    locations: List[WeatherLocation] = Field(..., min_length=1, max_length=50)
+
 # Backend sends this back to Frontend (The LLM Structure)
 class ChatResponse(BaseModel):
     english_text: str
@@ -21,4 +34,5 @@ class ChatResponse(BaseModel):
     summary: str
     hex_color: str
     avatar_state: str
-    location_name: str
\ No newline at end of file
+    location_name: str
+    session_id: Optional[str] = None  # Echo on the next turn (None with SESSION_STORE=off)
\ No newline at end of file
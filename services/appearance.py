@@ -0,0 +1,111 @@
+import math
+
+# Avatar state and colour, decided locally
+# Both follow from the weather we already fetched for the prompt (WMO weather_code,
+# temperature, is_day, precipitation), so they no longer cost prompt or output tokens and
+# are always valid ChatResponse values. Gemini may still send an "avatar_state" when the
+# user's emotional context calls for it (good or bad news); only EMOTIONAL_STATES are
+# accepted as overrides. Colours come from a fixed palette that respects the brightness
+# rule (no dark colours, no dark colours with a dominant blue channel).
+
+AVATAR_STATES = ("neutral", "happy", "sad", "surprised", "wearing_sunglasses", "wearing_scarf",
+                 "holding_umbrella", "shivering", "sweating")
+EMOTIONAL_STATES = {"happy", "sad", "surprised"}
+DEFAULT_STATE = "neutral"
+DEFAULT_COLOR = "#CFD8DC"
+
+# WMO code groups (Open-Meteo `weather_code`)
+CLEAR_CODES = {0, 1}
+FOG_CODES = {45, 48}
+RAIN_CODES = {51, 53, 55, 56, 57, 61, 63, 65, 66, 67, 80, 81, 82}
+SNOW_CODES = {71, 73, 75, 77, 85, 86}
+STORM_CODES = {95, 96, 99}
+
+# Temperature thresholds (°C)
+FREEZING_C = -5.0
+COLD_C = 5.0
+COOL_C = 12.0
+WARM_C = 20.0
+HOT_C = 30.0
+WET_MM = 0.5   # current precipitation that calls for an umbrella whatever the code says
+
+# Palette: state (and a few weather variants) -> bright colour
+PALETTE = {
+    "holding_umbrella": "#8EC9E8",
+    "storm": "#B39DDB",
+    "snow": "#E0F7FA",
+    "shivering": "#B3E5FC",
+    "wearing_scarf": "#FFCC80",
+    "sweating": "#FF8A65",
+    "wearing_sunglasses": "#FFD54F",
+    "happy": "#FFE082",
+    "sad": "#B0BEC5",
+    "surprised": "#F48FB1",
+    "neutral": "#CFD8DC",
+    "fog": "#E0E0E0",
+    "night": "#C5CAE9",
+}
+
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return float(value)
+
+
+def _conditions(weather: dict):
+    """(weather_code, temperature, is_day, precipitation) from Open-Meteo "current"; None if missing"""
+    current = (weather or {}).get("current") or {}
+    code = _number(current.get("weather_code"))
+    is_day = current.get("is_day")
+    return (int(code) if code is not None else None, _number(current.get("temperature_2m")),
+            bool(is_day) if is_day is not None else None, _number(current.get("precipitation")) or 0.0)
+
+
+def weather_avatar(weather: dict) -> str:
+    """Avatar state that fits the current weather"""
+    code, temperature, is_day, precipitation = _conditions(weather)
+    if code is None and temperature is None:
+        return DEFAULT_STATE
+    if code in SNOW_CODES:
+        return "shivering" if temperature is not None and temperature <= FREEZING_C else "wearing_scarf"
+    if code in RAIN_CODES or code in STORM_CODES or precipitation >= WET_MM:
+        return "holding_umbrella"
+    if temperature is not None:
+        if temperature <= COLD_C:
+            return "shivering"
+        if temperature <= COOL_C:
+            return "wearing_scarf"
+        if temperature >= HOT_C:
+            return "sweating"
+    if code in CLEAR_CODES and is_day is not False:
+        return "wearing_sunglasses" if temperature is not None and temperature >= WARM_C else "happy"
+    return DEFAULT_STATE
+
+
+def color_for(avatar_state: str, weather: dict) -> str:
+    """Palette colour for the final avatar state, with weather variants for neutral/umbrella"""
+    code, _temperature, is_day, _precipitation = _conditions(weather)
+    if avatar_state == "holding_umbrella" and code in STORM_CODES:
+        return PALETTE["storm"]
+    if avatar_state in ("wearing_scarf", "shivering") and code in SNOW_CODES:
+        return PALETTE["snow"]
+    if avatar_state == DEFAULT_STATE:
+        if code in FOG_CODES:
+            return PALETTE["fog"]
+        if is_day is False:
+            return PALETTE["night"]
+    return PALETTE.get(avatar_state, DEFAULT_COLOR)
+
+
+def resolve_appearance(weather: dict, override: str = None):
+    """(avatar_state, hex_color): the weather's, unless the LLM flagged an emotional state"""
+    state = override if override in EMOTIONAL_STATES else weather_avatar(weather)
+    return state, color_for(state, weather)
+
+
+def apply_appearance(data: dict, weather: dict) -> dict:
+    """Fills avatar_state / hex_color of a parsed chat answer in place"""
+    data["avatar_state"], data["hex_color"] = resolve_appearance(weather, data.get("avatar_state"))
+    return data
+
@@ -1,9 +1,16 @@
 import os
+import re
 import json
-from google.cloud import speech, texttospeech
-from pydub import AudioSegment
-import io
+import queue
+import asyncio
+import functools
+import threading
 import traceback
+from .executor import run_blocking, iterate_blocking
+from .resilience import UpstreamUnavailableError
+from .metrics import span
+from .tts_cache import cache_key, get_or_synthesize, forget
+from .transcoder import to_linear16, acquire_ffmpeg, TranscodeError, SAMPLE_RATE
 
 # Setup Google Cloud credentials
 # If GOOGLE_APPLICATION_CREDENTIALS contains JSON string instead of file path,
@@ -27,42 +34,87 @@ if creds_env:
 else:
     print("⚠️ WARNING: GOOGLE_APPLICATION_CREDENTIALS not set!")
 
+def _google_client(client_cls, endpoint_env: str):
+    """
+    Builds a Google Cloud client. If `endpoint_env` is set, the client talks to that
+    local stand-in instead (benchmarks / load tests): plaintext and unauthenticated,
+    over REST for http:// endpoints and gRPC for host:port endpoints.
+    """
+    endpoint = os.getenv(endpoint_env)
+    if not endpoint:
+        return client_cls()
+    from google.auth.credentials import AnonymousCredentials
+    print(f"🧪 {client_cls.__name__} -> {endpoint}")
+    if endpoint.startswith("http"):
+        return client_cls(transport="rest", client_options={"api_endpoint": endpoint},
+                          credentials=AnonymousCredentials())
+    import grpc
+    transport_cls = client_cls.get_transport_class("grpc")
+    return client_cls(transport=transport_cls(channel=grpc.insecure_channel(endpoint)))
+
+# The Google Cloud SDKs and clients are loaded on first use (or by the startup warm-up),
+# always from a worker thread: importing them and discovering credentials takes seconds
+# on a cold start and must not hold up the port or the event loop.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _speech():
+    from google.cloud import speech
+    return speech
+
+def _texttospeech():
+    from google.cloud import texttospeech
+    return texttospeech
+
+def _client(name: str, build):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = build()
+    return client
+
 # Setup clients (Auth is handled via GOOGLE_APPLICATION_CREDENTIALS env var)
-stt_client = speech.SpeechClient()
-tts_client = texttospeech.TextToSpeechClient()
+def get_stt_client():
+    return _client("stt", lambda: _google_client(_speech().SpeechClient, "GOOGLE_STT_ENDPOINT"))
+
+def get_tts_client():
+    return _client("tts", lambda: _google_client(_texttospeech().TextToSpeechClient, "GOOGLE_TTS_ENDPOINT"))
 
 # In backend/services/audio_service.py
 
+# Shared by /transcribe and /transcribe/stream
+@functools.cache
+def recognition_config():
+    speech = _speech()
+    return speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+        sample_rate_hertz=SAMPLE_RATE,
+        language_code="ja-JP", 
+        alternative_language_codes=["en-US"],
+        enable_automatic_punctuation=True,
+    )
+
+@functools.cache
+def streaming_config():
+    return _speech().StreamingRecognitionConfig(config=recognition_config(), interim_results=True)
+
+STREAM_PCM_CHUNK = SAMPLE_RATE * 2 // 10   # 100 ms of 16-bit mono audio per request
+STREAM_MAX_SECONDS = 290.0                 # Google caps a streaming session at ~5 minutes
+
 async def transcribe_audio(file_bytes: bytes) -> str:
     try:
-        # On Windows development, use local ffmpeg.exe if available
-        # On Linux (Render/Production), it uses system-installed ffmpeg
-        if os.path.exists("ffmpeg.exe"):
-             AudioSegment.converter = os.path.abspath("ffmpeg.exe")
-        
-        # 1. Convert WebM -> WAV (16-bit, 16kHz, Mono)
-        audio = AudioSegment.from_file(io.BytesIO(file_bytes))
-        
-        # --- THE FIX IS IN THIS LINE BELOW ---
-        # .set_sample_width(2) forces it to be 16-bit (2 bytes)
-        audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-        # -------------------------------------
-
-        wav_io = io.BytesIO()
-        audio.export(wav_io, format="wav")
-        wav_content = wav_io.getvalue()
+        # 1. Convert WebM -> raw LINEAR16 (16-bit, 16kHz, Mono) in a pre-spawned ffmpeg
+        with span("transcode"):
+            pcm_content = await to_linear16(file_bytes)
 
         # 2. Call Google Cloud STT
-        audio_api = speech.RecognitionAudio(content=wav_content)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,
-            language_code="ja-JP", 
-            alternative_language_codes=["en-US"],
-            enable_automatic_punctuation=True,
-        )
-
-        response = stt_client.recognize(config=config, audio=audio_api)
+        def recognize():
+            audio_api = _speech().RecognitionAudio(content=pcm_content)
+            return get_stt_client().recognize(config=recognition_config(), audio=audio_api)
+
+        response = await run_blocking("stt", recognize)
         
         transcript = ""
         for result in response.results:
@@ -70,35 +122,168 @@ async def transcribe_audio(file_bytes: bytes) -> str:
             
         return transcript
 
+    except UpstreamUnavailableError:
+        raise  # Shed (503), not an empty transcript
     except Exception as e:
         print("TRANSCRIPTION ERROR:", e)
         # return empty string so app doesn't crash, or raise e if you prefer
         return ""
 
+async def stream_transcription(chunks):
+    """
+    Streaming recognition for audio that is still being recorded.
+    `chunks` is an async iterator of encoded audio (e.g. WebM from MediaRecorder); it is
+    transcoded incrementally by one ffmpeg process and fed to Google's streaming API.
+    Yields (is_final, transcript) as interim and final results arrive.
+    """
+    proc = await acquire_ffmpeg("stream")
+    pcm_queue = queue.Queue()  # PCM for the gRPC request iterator (runs on an stt_stream thread)
+
+    async def feed_encoder():
+        try:
+            async for chunk in chunks:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        finally:
+            proc.stdin.close()
+
+    async def forward_pcm():
+        try:
+            while True:
+                pcm = await proc.stdout.read(STREAM_PCM_CHUNK)
+                if not pcm:
+                    break
+                pcm_queue.put(pcm)
+        finally:
+            pcm_queue.put(None)
+
+    def requests():
+        request_cls = _speech().StreamingRecognizeRequest
+        while True:
+            pcm = pcm_queue.get()
+            if pcm is None:
+                return
+            yield request_cls(audio_content=pcm)
+
+    def recognize():
+        return get_stt_client().streaming_recognize(config=streaming_config(), requests=requests())
+
+    tasks = [asyncio.create_task(feed_encoder()), asyncio.create_task(forward_pcm())]
+    try:
+        async for response in iterate_blocking("stt_stream", recognize, call_timeout=STREAM_MAX_SECONDS):
+            for result in response.results:
+                if result.alternatives:
+                    yield result.is_final, result.alternatives[0].transcript
+        if await proc.wait() != 0:
+            err = await proc.stderr.read()
+            raise TranscodeError(f"ffmpeg exited with {proc.returncode}: {err.decode(errors='replace').strip()}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        pcm_queue.put(None)  # Unblock the request iterator if recognition ended early
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+# Voice per UI language (Neural voices sound better)
+VOICES = {
+    "ja": ("ja-JP", "ja-JP-Neural2-B"),
+    "en": ("en-US", "en-US-Neural2-F"),
+}
+AUDIO_ENCODING = "MP3"
+
+def _voice_for(lang: str):
+    return VOICES["ja"] if lang == "ja" else VOICES["en"]
+
 async def generate_tts(text: str, lang: str):
     """Generates MP3 audio from text"""
     try:
-        synthesis_input = texttospeech.SynthesisInput(text=text)
-        
         # Select voice based on language
-        lang_code = "ja-JP" if lang == "ja" else "en-US"
-        voice_name = "ja-JP-Neural2-B" if lang == "ja" else "en-US-Neural2-F" # Neural voices sound better
+        lang_code, voice_name = _voice_for(lang)
+
+        def synthesize_speech():
+            texttospeech = _texttospeech()
+            synthesis_input = texttospeech.SynthesisInput(text=text)
 
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=lang_code,
-            name=voice_name
-        )
+            voice = texttospeech.VoiceSelectionParams(
+                language_code=lang_code,
+                name=voice_name
+            )
 
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
+            audio_config = texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding[AUDIO_ENCODING]
+            )
 
-        response = tts_client.synthesize_speech(
-            input=synthesis_input, voice=voice, audio_config=audio_config
-        )
+            return get_tts_client().synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
+
+        response = await run_blocking("tts", synthesize_speech)
 
         return response.audio_content
     
     except Exception as e:
         print(f"TTS ERROR: {e}")
-        raise e  # Re-raise so the endpoint returns proper error
\ No newline at end of file
+        raise e  # Re-raise so the endpoint returns proper error
+
+async def generate_tts_cached(text: str, lang: str) -> str:
+    """Path of the MP3 for text, served from the disk cache or synthesized once and stored"""
+    lang_code, voice_name = _voice_for(lang)
+    key = cache_key(text, lang_code, voice_name, {"audio_encoding": AUDIO_ENCODING})
+    path = await get_or_synthesize(key, lambda: generate_tts(text, lang))
+    if not await asyncio.to_thread(os.path.exists, path):
+        # Evicted (or unlinked by another worker) since the lookup: synthesize it again
+        forget(key)
+        path = await get_or_synthesize(key, lambda: generate_tts(text, lang))
+    return path
+
+# Streaming TTS: sentences are synthesized concurrently (bounded) and streamed in order
+TTS_STREAM_FANOUT = int(os.getenv("TTS_STREAM_FANOUT", "3"))
+TTS_MIN_CHUNK_CHARS = 40
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|(?<=[。！？])\s*")
+
+def _speech_len(text: str) -> int:
+    """Rough spoken length: a Japanese character takes about two Latin ones to say"""
+    return sum(1 if c.isascii() else 2 for c in text)
+
+def split_sentences(text: str, min_chars: int = TTS_MIN_CHUNK_CHARS):
+    """
+    Splits text at sentence ends (including 。！？). The first sentence is kept on its own
+    so playback can start early; later ones are merged up to min_chars to limit calls.
+    """
+    chunks = []
+    for sentence in (p.strip() for p in _SENTENCE_BREAK.split(text)):
+        if not sentence:
+            continue
+        if len(chunks) > 1 and _speech_len(chunks[-1]) < min_chars:
+            sep = " " if chunks[-1][-1].isascii() else ""
+            chunks[-1] = f"{chunks[-1]}{sep}{sentence}"
+        else:
+            chunks.append(sentence)
+    return chunks
+
+def _strip_id3(audio: bytes) -> bytes:
+    """Drops a leading ID3v2 tag so concatenated chunks form one MP3 frame stream"""
+    if audio[:3] != b"ID3" or len(audio) < 10:
+        return audio
+    size = (audio[6] << 21) | (audio[7] << 14) | (audio[8] << 7) | audio[9]
+    return audio[10 + size:]
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+async def stream_tts(text: str, lang: str):
+    """Yields MP3 bytes sentence by sentence, in order, as soon as each one is ready"""
+    semaphore = asyncio.Semaphore(TTS_STREAM_FANOUT)
+
+    async def synthesize(chunk):
+        async with semaphore:
+            return await generate_tts_cached(chunk, lang)
+
+    tasks = [asyncio.ensure_future(synthesize(chunk)) for chunk in split_sentences(text)]
+    try:
+        for i, task in enumerate(tasks):
+            audio = await asyncio.to_thread(_read_file, await task)
+            yield audio if i == 0 else _strip_id3(audio)
+    finally:
+        for task in tasks:
+            task.cancel()
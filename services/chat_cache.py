@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import unicodedata
+from collections import OrderedDict
+from .weather_service import snap_to_grid
+from .prompt_builder import theme_key
+
+# Chat response cache
+# Repeat turns ("what's the weather?" in the same place and theme, no prior context) get
+# the same answer while the weather hasn't materially changed. Keys combine the
+# normalized message, the weather grid cell, the theme, a hash of the summary and a
+# coarse weather fingerprint (temperature band, weather_code, is_day), so a new weather
+# situation naturally misses. Entries expire after CHAT_CACHE_TTL and the least recently
+# used ones are dropped beyond CHAT_CACHE_MAX_ENTRIES.
+
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "900"))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "2048"))
+TEMP_BAND_C = float(os.getenv("CHAT_CACHE_TEMP_BAND", "3"))
+
+# Summaries that mean "no context yet" (normalized ChatRequest default, empty)
+EMPTY_SUMMARIES = {"", "no previous context"}
+
+_PUNCT = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+_cache = OrderedDict()   # key -> (expires_at, text), least recently used first
+_inflight = {}           # key -> asyncio.Task
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "expired": 0, "evictions": 0}
+
+
+def normalize_message(text: str) -> str:
+    """Case, width, punctuation and whitespace-insensitive form of a message"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _SPACES.sub(" ", _PUNCT.sub(" ", text)).strip()
+
+
+def summary_hash(summary: str) -> str:
+    normalized = normalize_message(summary)
+    if normalized in EMPTY_SUMMARIES:
+        return ""
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def weather_fingerprint(weather: dict):
+    """(temperature band, weather_code, is_day), or None without current weather"""
+    current = (weather or {}).get("current") or {}
+    temperature = current.get("temperature_2m")
+    if temperature is None:
+        return None
+    return int(temperature // TEMP_BAND_C), current.get("weather_code"), current.get("is_day")
+
+
+def make_key(message: str, history_summary: str, city_name: str, lat: float, lon: float,
+             theme: str, weather: dict, extra_places=()):
+    """Cache key for a chat turn, or None if it shouldn't be cached (no weather to pin it to)"""
+    fingerprint = weather_fingerprint(weather)
+    if fingerprint is None:
+        return None
+    others = []
+    for name, place_lat, place_lon, place_weather in extra_places:
+        place_fingerprint = weather_fingerprint(place_weather)
+        if place_fingerprint is None:
+            return None
+        others.append([name, snap_to_grid(place_lat, place_lon), place_fingerprint])
+    payload = json.dumps([
+        normalize_message(message), snap_to_grid(lat, lon), city_name, theme_key(theme),
+        summary_hash(history_summary), fingerprint, *others,
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def lookup(key: str):
+    """Cached response text (marked as recently used), or None"""
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    expires_at, text = entry
+    if expires_at <= time.time():
+        del _cache[key]
+        _stats["expired"] += 1
+        return None
+    _cache.move_to_end(key)
+    return text
+
+
+def store(key: str, text: str):
+    _cache[key] = (time.time() + CHAT_CACHE_TTL, text)
+    _cache.move_to_end(key)
+    while len(_cache) > CHAT_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def cached_response(key: str):
+    """lookup() that counts towards the hit rate (for callers that generate themselves)"""
+    text = lookup(key)
+    _stats["hits" if text is not None else "misses"] += 1
+    return text
+
+
+def record_bypass():
+    _stats["bypassed"] += 1
+
+
+async def get_or_generate(key: str, generate):
+    """
+    Cached response for key, calling `await generate()` (-> (text, cacheable)) on a miss.
+    Concurrent misses for the same key share one generation.
+    """
+    text = lookup(key)
+    if text is not None:
+        _stats["hits"] += 1
+        return text
+
+    task = _inflight.get(key)
+    if task is not None:
+        _stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    _stats["misses"] += 1
+
+    async def fill():
+        text, cacheable = await generate()
+        if cacheable:
+            store(key, text)
+        return text
+
+    task = asyncio.ensure_future(fill())
+    _inflight[key] = task
+    task.add_done_callback(lambda t: _on_filled(key, t))
+    return await asyncio.shield(task)
+
+
+def _on_filled(key, task):
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # Mark as retrieved even if every waiter went away
+
+
+def get_chat_cache_stats():
+    lookups = _stats["hits"] + _stats["misses"] + _stats["coalesced"]
+    return {
+        **_stats,
+        "hit_ratio": round((_stats["hits"] + _stats["coalesced"]) / lookups, 4) if lookups else 0.0,
+        "entries": len(_cache),
+        "inflight": len(_inflight),
+        "max_entries": CHAT_CACHE_MAX_ENTRIES,
+        "ttl_seconds": CHAT_CACHE_TTL,
+    }
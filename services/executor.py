@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .metrics import span, observe
+from .resilience import guard, UpstreamUnavailableError
+
+# Blocking-call execution layer
+# The Gemini, Google Cloud and geocoder SDKs are synchronous. Each upstream gets its own
+# bounded thread pool so a slow backend can only exhaust its own workers, never the
+# event loop or another backend's threads. Calls are admitted through the upstream's
+# circuit breaker and rate limit first (services.resilience).
+
+BACKENDS = {
+    # name: worker threads, extra calls allowed to queue, per-call timeout (seconds),
+    # default upstream (resilience.UPSTREAMS; the geocoder pool serves arcgis and ipinfo)
+    "geocoder": {"workers": int(os.getenv("GEOCODER_WORKERS", "8")), "max_queue": 32, "timeout": 8.0,
+                 "upstream": "arcgis"},
+    "gemini": {"workers": int(os.getenv("GEMINI_WORKERS", "16")), "max_queue": 64, "timeout": 30.0},
+    "stt": {"workers": int(os.getenv("STT_WORKERS", "4")), "max_queue": 16, "timeout": 30.0},
+    # Streaming sessions hold a thread for as long as the user talks
+    "stt_stream": {"workers": int(os.getenv("STT_STREAM_WORKERS", "16")), "max_queue": 0, "timeout": 300.0,
+                   "upstream": "stt"},
+    "tts": {"workers": int(os.getenv("TTS_WORKERS", "4")), "max_queue": 16, "timeout": 20.0},
+}
+
+_executors = {}
+_pending = {name: 0 for name in BACKENDS}
+_pending_lock = threading.Lock()
+
+
+class BackendBusyError(UpstreamUnavailableError):
+    """Raised when a backend's queue is full; callers should shed load (503)"""
+
+    def __init__(self, backend: str):
+        super().__init__(backend, "saturated")
+        self.backend = backend
+
+
+def _upstream(backend: str, upstream: str = None) -> str:
+    return upstream or BACKENDS[backend].get("upstream", backend)
+
+
+def _get_executor(backend: str) -> ThreadPoolExecutor:
+    executor = _executors.get(backend)
+    if executor is None:
+        executor = _executors[backend] = ThreadPoolExecutor(
+            max_workers=BACKENDS[backend]["workers"], thread_name_prefix=f"{backend}-worker"
+        )
+    return executor
+
+
+def _release(backend: str):
+    with _pending_lock:
+        _pending[backend] -= 1
+
+
+def _submit(backend: str, fn, *args, **kwargs):
+    """Queues fn on the backend's pool, enforcing the queue-depth limit"""
+    cfg = BACKENDS[backend]
+    with _pending_lock:
+        if _pending[backend] >= cfg["workers"] + cfg["max_queue"]:
+            raise BackendBusyError(backend)
+        _pending[backend] += 1
+
+    try:
+        future = _get_executor(backend).submit(fn, *args, **kwargs)
+    except BaseException:
+        _release(backend)
+        raise
+    # Slot is freed when the thread actually finishes, not when the caller gives up
+    future.add_done_callback(lambda _: _release(backend))
+    return asyncio.wrap_future(future)
+
+
+async def run_blocking(backend: str, fn, *args, call_timeout: float = None, upstream: str = None, **kwargs):
+    """
+    Runs a blocking call on the backend's pool.
+    - Raises CircuitOpenError / RateLimitedError if the upstream doesn't admit the call
+    - Raises BackendBusyError when workers + queue are full (backpressure)
+    - Raises TimeoutError after the per-call timeout (the worker finishes in the background)
+    """
+    with span(f"{backend}.{getattr(fn, '__name__', 'call')}"):
+        async with guard(_upstream(backend, upstream)):
+            future = _submit(backend, fn, *args, **kwargs)
+            return await asyncio.wait_for(future, call_timeout or BACKENDS[backend]["timeout"])
+
+
+_END = object()
+
+
+async def iterate_blocking(backend: str, make_iter, *args, call_timeout: float = None, upstream: str = None,
+                           **kwargs):
+    """
+    Async-iterates a blocking iterator (e.g. a streaming SDK response) on the backend's pool.
+    Items are handed over as soon as the worker produces them. The timeout covers the whole
+    stream; leaving the loop early tells the worker to stop.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def push(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:  # loop already closed
+            stop.set()
+
+    def pump():
+        try:
+            for item in make_iter(*args, **kwargs):
+                if stop.is_set():
+                    return
+                push(item)
+        except Exception as e:
+            push(_END, e)
+            return
+        push(_END)
+
+    async with guard(_upstream(backend, upstream)):
+        future = _submit(backend, pump)
+        deadline = loop.time() + (call_timeout or BACKENDS[backend]["timeout"])
+        name = f"{backend}.{getattr(make_iter, '__name__', 'stream')}"
+        start = time.perf_counter()
+        first = True
+        try:
+            while True:
+                item, error = await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0))
+                if error is not None:
+                    raise error
+                if item is _END:
+                    return
+                if first:
+                    first = False
+                    observe(f"{name}.first_item", time.perf_counter() - start)
+                yield item
+        finally:
+            observe(name, time.perf_counter() - start)
+            stop.set()
+            if not future.done():
+                # The worker notices `stop` at its next item; don't leave the wrapper unobserved
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+def get_executor_stats():
+    """Current in-flight (running + queued) calls per backend"""
+    with _pending_lock:
+        return {
+            name: {"pending": _pending[name], "capacity": cfg["workers"] + cfg["max_queue"]}
+            for name, cfg in BACKENDS.items()
+        }
+
+
+def shutdown_executors():
+    """Stops all pools without waiting for stragglers (called from main.lifespan)"""
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
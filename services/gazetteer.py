@@ -0,0 +1,269 @@
+import os
+import sys
+import math
+import mmap
+import time
+import struct
+import bisect
+import threading
+import hashlib
+import unicodedata
+from array import array
+
+# Offline gazetteer
+# Bundled GeoNames cities (population >= 50k worldwide, every Japanese city >= 15k) with
+# Japanese alt-names. Records are stored as flat arrays in implicit KD-tree order (the
+# median of every sub-range is its split node), so reverse lookups walk the arrays
+# directly. Forward lookups binary-search a sorted array of normalized-name hashes.
+#
+# Prebuilt binary: `python -m services.gazetteer build` writes data/cities.bin, which is
+# memory-mapped at startup. Without it the TSV is parsed (and the binary written) on load.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+TSV_PATH = os.path.join(DATA_DIR, "cities.tsv")
+BIN_PATH = os.path.join(DATA_DIR, "cities.bin")
+
+REVERSE_MAX_KM = float(os.getenv("GAZETTEER_REVERSE_MAX_KM", "25"))
+# Wards and suburbs within this radius of a bigger city report the bigger city
+# (Suginami -> Tokyo), matching what ArcGIS returns as the city.
+CITY_MERGE_KM = float(os.getenv("GAZETTEER_CITY_MERGE_KM", "10"))
+_KM_PER_DEG = 111.195
+
+_MAGIC = b"GAZ1"
+_HEADER = struct.Struct("<4sBIII")  # magic, little-endian flag, records, keys, names blob size
+_NAME_SUFFIXES = (" city", "市", "都", "府", "県")
+
+
+def normalize_name(name: str) -> str:
+    """Case-folds, strips Latin accents and punctuation: 'São Paulo' -> 'sao paulo'"""
+    s = unicodedata.normalize("NFKC", name).casefold().strip()
+    stripped = "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+    if stripped.isascii():
+        # Only Latin text loses its accents; removing marks would break kana (ガ -> カ)
+        s = stripped
+    s = "".join(c if c.isalnum() else " " for c in s)
+    return " ".join(s.split())
+
+
+def _name_keys(name: str):
+    """Normalized lookup keys for a name, including the variant without a city suffix"""
+    key = normalize_name(name)
+    if not key:
+        return []
+    keys = [key]
+    for suffix in _NAME_SUFFIXES:
+        if key.endswith(suffix) and len(key) > len(suffix) + 1:
+            keys.append(key[: -len(suffix)].strip())
+    return keys
+
+
+def _hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 12742.0 * math.asin(math.sqrt(a))
+
+
+def read_cities_tsv(path: str = TSV_PATH):
+    """geonameid, name, lat, lon, country, population, comma-separated alt-names"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 6:
+                continue
+            alts = [a for a in parts[6].split(",") if a] if len(parts) > 6 else []
+            records.append((parts[1], float(parts[2]), float(parts[3]), parts[4], int(parts[5]), alts))
+    return records
+
+
+def _kd_order(records):
+    """Reorders records so each sub-range's median is its split node (lat/lon alternating)"""
+    out = [None] * len(records)
+
+    def place(items, axis, start):
+        # Slot range layout: [left subtree][median][right subtree]
+        if not items:
+            return
+        items.sort(key=lambda r: r[1 + axis])
+        mid = len(items) // 2
+        place(items[:mid], axis ^ 1, start)
+        out[start + mid] = items[mid]
+        place(items[mid + 1:], axis ^ 1, start + mid + 1)
+
+    place(list(records), 0, 0)
+    return out
+
+
+def build_binary(tsv_path: str = TSV_PATH, bin_path: str = BIN_PATH):
+    """Compiles the TSV into the memory-mappable binary layout"""
+    records = _kd_order(read_cities_tsv(tsv_path))
+    n = len(records)
+
+    lats, lons = array("f"), array("f")
+    pops, name_offsets = array("I"), array("I", [0])
+    countries, names = bytearray(), bytearray()
+    best = {}  # hash -> (population, record index)
+
+    for i, (name, lat, lon, country, pop, alts) in enumerate(records):
+        lats.append(lat)
+        lons.append(lon)
+        pops.append(min(pop, 0xFFFFFFFF))
+        countries += country.encode("ascii", "replace")[:2].ljust(2, b" ")
+        names += name.encode("utf-8")
+        name_offsets.append(len(names))
+        # Ambiguous names ('Springfield') resolve to the most populous match
+        for alias in [name, *alts]:
+            for key in _name_keys(alias):
+                h = _hash_key(key)
+                if h not in best or best[h][0] < pop:
+                    best[h] = (pop, i)
+
+    keys = array("Q", sorted(best))
+    key_idx = array("I", (best[h][1] for h in keys))
+
+    sections = [lats, lons, pops, name_offsets, bytes(countries), bytes(names), keys, key_idx]
+    tmp_path = bin_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, sys.byteorder == "little", n, len(keys), len(names)))
+        for section in sections:
+            f.write(b"\0" * (-f.tell() % 8))  # 8-byte align every array
+            f.write(section.tobytes() if isinstance(section, array) else section)
+    os.replace(tmp_path, bin_path)
+    return n, len(keys)
+
+
+class Gazetteer:
+    """Read-only view over the memory-mapped gazetteer binary"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, little, n, n_keys, names_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or bool(little) != (sys.byteorder == "little"):
+            raise ValueError(f"Incompatible gazetteer binary: {path}")
+
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+
+        def take(nbytes, fmt=None):
+            nonlocal pos
+            pos += -pos % 8
+            section = view[pos:pos + nbytes]
+            pos += nbytes
+            return section.cast(fmt) if fmt else section
+
+        self.size = n
+        self._lat = take(4 * n, "f")
+        self._lon = take(4 * n, "f")
+        self._pop = take(4 * n, "I")
+        self._name_off = take(4 * (n + 1), "I")
+        self._country = take(2 * n)
+        self._names = take(names_len)
+        self._keys = take(8 * n_keys, "Q")
+        self._key_idx = take(4 * n_keys, "I")
+
+    def record(self, i: int):
+        name = bytes(self._names[self._name_off[i]:self._name_off[i + 1]]).decode("utf-8")
+        return {
+            "name": name,
+            "lat": self._lat[i],
+            "lon": self._lon[i],
+            "country": bytes(self._country[2 * i:2 * i + 2]).decode("ascii").strip(),
+            "population": self._pop[i],
+        }
+
+    def _find_key(self, key: str):
+        h = _hash_key(key)
+        pos = bisect.bisect_left(self._keys, h)
+        if pos < len(self._keys) and self._keys[pos] == h:
+            return self._key_idx[pos]
+        return None
+
+    def forward(self, name: str):
+        """'Tokyo' / '東京' / 'São Paulo, Brazil' -> record dict or None"""
+        candidates = [name] + ([name.split(",")[0]] if "," in name else [])
+        for candidate in candidates:
+            for key in _name_keys(candidate):
+                i = self._find_key(key)
+                if i is not None:
+                    return self.record(i)
+        return None
+
+    def _search(self, lat: float, lon: float, radius_km: float = None):
+        """
+        KD-tree walk in an equirectangular metric (degrees, longitude scaled by cos(lat)).
+        Returns (nearest index, indices within radius_km).
+        """
+        lats, lons = self._lat, self._lon
+        coslat = math.cos(math.radians(lat))
+        radius2 = (radius_km / _KM_PER_DEG) ** 2 if radius_km else -1.0
+        best_i, best_d = -1, float("inf")
+        inside = []
+        stack = [(0, self.size, 0, 0.0)]
+        while stack:
+            lo, hi, axis, bound = stack.pop()
+            if lo >= hi or (bound >= best_d and bound > radius2):
+                continue
+            mid = (lo + hi) // 2
+            dlat = lats[mid] - lat
+            dlon = (lons[mid] - lon) * coslat
+            d = dlat * dlat + dlon * dlon
+            if d < best_d:
+                best_i, best_d = mid, d
+            if d <= radius2:
+                inside.append(mid)
+            diff = dlat if axis == 0 else dlon
+            near, far = ((lo, mid), (mid + 1, hi)) if diff > 0 else ((mid + 1, hi), (lo, mid))
+            # Far side first so the near side is popped (and tightens best_d) before it
+            stack.append((far[0], far[1], axis ^ 1, diff * diff))
+            stack.append((near[0], near[1], axis ^ 1, 0.0))
+        return best_i, inside
+
+    def nearest(self, lat: float, lon: float):
+        """Index of the nearest city"""
+        return self._search(lat, lon)[0]
+
+    def reverse(self, lat: float, lon: float, max_km: float = REVERSE_MAX_KM):
+        """(lat, lon) -> city record (largest within CITY_MERGE_KM, else nearest within max_km)"""
+        i, inside = self._search(lat, lon, CITY_MERGE_KM)
+        if inside:
+            i = max(inside, key=lambda j: self._pop[j])
+        if i < 0:
+            return None
+        rec = self.record(i)
+        if _haversine_km(lat, lon, rec["lat"], rec["lon"]) > max_km:
+            return None
+        return rec
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Loads the gazetteer on first use (mmap the binary, building it from the TSV if stale)"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                start = time.perf_counter()
+                stale = not os.path.exists(BIN_PATH) or os.path.getmtime(BIN_PATH) < os.path.getmtime(TSV_PATH)
+                if stale:
+                    build_binary()
+                _gazetteer = Gazetteer(BIN_PATH)
+                print(f"🗺️ Gazetteer loaded: {_gazetteer.size} cities in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return _gazetteer
+
+
+if __name__ == "__main__":
+    # python -m services.gazetteer build
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        records, keys = build_binary()
+        print(f"✅ Wrote {BIN_PATH}: {records} cities, {keys} name keys")
+    else:
+        print("Usage: python -m services.gazetteer build")
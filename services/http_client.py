@@ -0,0 +1,193 @@
+import os
+import random
+import asyncio
+import threading
+import httpx
+from .metrics import span
+from .executor import run_blocking
+from .resilience import guard
+
+# Shared outbound HTTP clients
+# One long-lived pool per upstream so every call reuses DNS / TCP / TLS state instead
+# of paying the handshake again. main.lifespan starts and closes these. The requests
+# sessions (for the sync geocoder library) are created on first use from the worker
+# threads that need them, so requests isn't imported during a cold start.
+
+# Async upstreams (httpx, HTTP/2 where the server negotiates it)
+ASYNC_UPSTREAMS = {
+    "open_meteo": {
+        "base_url": os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com"),
+        "max_connections": 50,
+        "max_keepalive": 20,
+        "keepalive_expiry": 60.0,
+        "timeout": 5.0,
+        "retries": 2,
+    },
+}
+
+# Sync upstreams used through the geocoder library (requests sessions)
+# `origin` is what geocoder calls; if `override` is set (local stand-ins for benchmarks
+# and load tests), requests to the origin are sent there instead.
+SYNC_UPSTREAMS = {
+    "arcgis": {"pool_size": 20, "timeout": 5.0, "retries": 2,
+               "origin": "https://geocode.arcgis.com", "override": os.getenv("ARCGIS_URL")},
+    "ipinfo": {"pool_size": 10, "timeout": 3.0, "retries": 1,
+               "origin": "http://ipinfo.io", "override": os.getenv("IPINFO_URL")},
+}
+
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_async_clients = {}
+_sync_sessions = {}
+_sync_lock = threading.Lock()
+
+
+def _build_async_client(name: str) -> httpx.AsyncClient:
+    cfg = ASYNC_UPSTREAMS[name]
+    return httpx.AsyncClient(
+        base_url=cfg["base_url"],
+        http2=True,
+        timeout=httpx.Timeout(cfg["timeout"]),
+        limits=httpx.Limits(
+            max_connections=cfg["max_connections"],
+            max_keepalive_connections=cfg["max_keepalive"],
+            keepalive_expiry=cfg["keepalive_expiry"],
+        ),
+    )
+
+
+def _build_sync_session(name: str):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class RewriteAdapter(HTTPAdapter):
+        """Sends requests for `origin` to `target` (same path and query)"""
+
+        def __init__(self, origin: str, target: str, **kwargs):
+            super().__init__(**kwargs)
+            self.origin = origin
+            self.target = target.rstrip("/")
+
+        def send(self, request, *args, **kwargs):
+            if request.url.startswith(self.origin):
+                request.url = self.target + request.url[len(self.origin):]
+            return super().send(request, *args, **kwargs)
+
+    cfg = SYNC_UPSTREAMS[name]
+    retry = Retry(
+        total=cfg["retries"],
+        backoff_factor=RETRY_BASE_DELAY,
+        backoff_max=RETRY_MAX_DELAY,
+        backoff_jitter=RETRY_BASE_DELAY,
+        status_forcelist=sorted(RETRY_STATUS),
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cfg["pool_size"], max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if cfg["override"]:
+        print(f"🧪 {name} -> {cfg['override']}")
+        session.mount(cfg["origin"], RewriteAdapter(cfg["origin"], cfg["override"], pool_connections=1,
+                                                    pool_maxsize=cfg["pool_size"], max_retries=retry))
+    return session
+
+
+async def start_http_clients():
+    """Creates the shared client pools (called from main.lifespan)"""
+    for name in ASYNC_UPSTREAMS:
+        if name not in _async_clients:
+            _async_clients[name] = _build_async_client(name)
+    print(f"🌐 HTTP client pools ready: {', '.join(_async_clients)} (+ {', '.join(SYNC_UPSTREAMS)} on first use)")
+
+
+async def close_http_clients():
+    """Closes every pooled connection (called from main.lifespan)"""
+    clients = list(_async_clients.values())
+    _async_clients.clear()
+    await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+    for session in _sync_sessions.values():
+        session.close()
+    _sync_sessions.clear()
+    print("🛑 HTTP client pools closed")
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """Shared async client for an upstream (created on first use outside the app lifespan)"""
+    client = _async_clients.get(name)
+    if client is None or client.is_closed:
+        client = _async_clients[name] = _build_async_client(name)
+    return client
+
+
+def get_http_session(name: str):
+    """Shared requests session for an upstream called through a sync library (blocking on first use)"""
+    session = _sync_sessions.get(name)
+    if session is None:
+        with _sync_lock:
+            session = _sync_sessions.get(name)
+            if session is None:
+                session = _sync_sessions[name] = _build_sync_session(name)
+    return session
+
+
+async def ping_http_pools():
+    """
+    Cheapest possible round trip (HEAD on the upstream root) on every pool that is already
+    open, so idle keep-alive connections are reused or replaced before a user needs them.
+    Returns {name: status code or error}.
+    """
+    async def ping_async(client):
+        response = await client.head("/")
+        return response.status_code
+
+    def ping_sync(name):
+        cfg = SYNC_UPSTREAMS[name]
+        return _sync_sessions[name].head(cfg["origin"], timeout=cfg["timeout"]).status_code
+
+    names, probes = [], []
+    for name, client in list(_async_clients.items()):
+        names.append(name)
+        probes.append(ping_async(client))
+    for name in list(_sync_sessions):
+        names.append(name)
+        probes.append(run_blocking("geocoder", ping_sync, name, upstream=name))
+    results = await asyncio.gather(*probes, return_exceptions=True)
+    return {name: (f"error: {result}" if isinstance(result, BaseException) else result)
+            for name, result in zip(names, results)}
+
+
+def get_http_timeout(name: str) -> float:
+    cfg = ASYNC_UPSTREAMS.get(name) or SYNC_UPSTREAMS[name]
+    return cfg["timeout"]
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+async def request_with_retry(name: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Sends a request on the upstream's pool, retrying transport errors and 429/5xx.
+    Raises httpx.HTTPStatusError if the last attempt is still 429/5xx (counted by the
+    upstream's circuit breaker, like transport errors); other statuses are returned.
+    """
+    client = get_http_client(name)
+    retries = ASYNC_UPSTREAMS[name]["retries"]
+    with span(name):
+        async with guard(name):
+            for attempt in range(retries + 1):
+                try:
+                    resp = await client.request(method, url, **kwargs)
+                    if resp.status_code not in RETRY_STATUS:
+                        return resp
+                    if attempt == retries:
+                        resp.raise_for_status()
+                except httpx.TransportError:
+                    if attempt == retries:
+                        raise
+                await asyncio.sleep(_backoff(attempt))
@@ -0,0 +1,252 @@
+import os
+import csv
+import sys
+import mmap
+import time
+import bisect
+import itertools
+import socket
+import struct
+import functools
+import threading
+import ipaddress
+from array import array
+from .gazetteer import DATA_DIR
+
+# Local IP geolocation
+# Sorted IPv4 and IPv6 range arrays in a memory-mapped binary; a lookup is one binary
+# search (IPv6 is indexed by its /64 prefix, the granularity GeoLite-style databases
+# locate at). Hot client IPs are served from an LRU in front of it. The remote ipinfo
+# lookup in location_service is only a fallback for addresses the index doesn't cover.
+#
+# The index is built once from a downloaded CSV (not bundled, licensing):
+#   python -m services.ip_geo build GeoLite2-City-Blocks-IPv4.csv GeoLite2-City-Blocks-IPv6.csv \
+#       --locations GeoLite2-City-Locations-en.csv
+#   python -m services.ip_geo build dbip-city-lite.csv
+# MaxMind GeoLite2 City blocks (CIDR `network` column, names from the locations file) and
+# DB-IP / IP2Location-style range files (start_ip,end_ip,...,country,...,city,lat,lon)
+# are both accepted. Output: data/ipgeo.bin (IPGEO_PATH).
+
+IPGEO_PATH = os.getenv("IPGEO_PATH", os.path.join(DATA_DIR, "ipgeo.bin"))
+IPGEO_CACHE_SIZE = int(os.getenv("IPGEO_CACHE_SIZE", "4096"))
+
+_MAGIC = b"IPG1"
+_HEADER = struct.Struct("<4sBIIII")  # magic, little-endian flag, v4 ranges, v6 ranges, names, names blob size
+_V6_SHIFT = 64
+
+# DB-IP lite city column order (no header): start, end, continent, country, region, city, lat, lon
+_RANGE_COLUMNS = {"country": 3, "city": 5, "lat": 6, "lon": 7}
+
+_stats = {"lookups": 0, "hits": 0, "misses": 0, "skipped": 0}
+
+
+def _ip_key(ip):
+    """(version, sortable integer key) for an ipaddress object"""
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    if ip.version == 4:
+        return 4, int(ip)
+    return 6, int(ip) >> _V6_SHIFT
+
+
+def _read_locations(path: str):
+    """GeoLite2 locations CSV -> {geoname_id: (city, country ISO code)}"""
+    names = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            names[row["geoname_id"]] = (row.get("city_name") or "", row.get("country_iso_code") or "")
+    return names
+
+
+def _read_ranges(path: str, locations: dict):
+    """Yields (version, start key, end key, lat, lon, city, country) from a blocks or range CSV"""
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            return
+        if first[0] == "network":
+            # GeoLite2 blocks: network,geoname_id,...,latitude,longitude,...
+            columns = {name: i for i, name in enumerate(first)}
+            for row in reader:
+                lat, lon = row[columns["latitude"]], row[columns["longitude"]]
+                if not lat or not lon:
+                    continue
+                network = ipaddress.ip_network(row[columns["network"]], strict=False)
+                version, start = _ip_key(network.network_address)
+                _, end = _ip_key(network.broadcast_address)
+                city, country = locations.get(row[columns["geoname_id"]], ("", ""))
+                yield version, start, end, float(lat), float(lon), city, country
+            return
+
+        try:
+            ipaddress.ip_address(first[0])
+            rows = itertools.chain([first], reader)
+        except ValueError:
+            rows = reader  # Skip a header row
+        for row in rows:
+            try:
+                lat, lon = float(row[_RANGE_COLUMNS["lat"]]), float(row[_RANGE_COLUMNS["lon"]])
+                start_ip, end_ip = ipaddress.ip_address(row[0]), ipaddress.ip_address(row[1])
+            except (ValueError, IndexError):
+                continue
+            version, start = _ip_key(start_ip)
+            _, end = _ip_key(end_ip)
+            yield version, start, end, lat, lon, row[_RANGE_COLUMNS["city"]], row[_RANGE_COLUMNS["country"]]
+
+
+def build_index(csv_paths, locations_path: str = None, out_path: str = IPGEO_PATH):
+    """Compiles range CSVs into the memory-mappable binary; returns (v4 ranges, v6 ranges)"""
+    locations = _read_locations(locations_path) if locations_path else {}
+    ranges = {4: [], 6: []}
+    for path in csv_paths:
+        for version, start, end, lat, lon, city, country in _read_ranges(path, locations):
+            ranges[version].append((start, end, lat, lon, city, country))
+
+    name_ids = {}
+    name_offsets, countries, names = array("I", [0]), bytearray(), bytearray()
+    sections = []
+    for version, code in ((4, "I"), (6, "Q")):
+        starts, ends, lats, lons, name_idx = array(code), array(code), array("f"), array("f"), array("I")
+        last_end = -1
+        for start, end, lat, lon, city, country in sorted(ranges[version]):
+            if start <= last_end:
+                # Overlap (or several IPv6 networks inside one /64): the first one wins
+                continue
+            key = (city, country)
+            if key not in name_ids:
+                name_ids[key] = len(name_ids)
+                countries += country.encode("ascii", "replace")[:2].ljust(2, b" ")
+                names += city.encode("utf-8")
+                name_offsets.append(len(names))
+            starts.append(start)
+            ends.append(end)
+            lats.append(lat)
+            lons.append(lon)
+            name_idx.append(name_ids[key])
+            last_end = end
+        sections.append((starts, ends, lats, lons, name_idx))
+
+    (v4, v6) = sections
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, sys.byteorder == "little", len(v4[0]), len(v6[0]), len(name_ids), len(names)))
+        for section in [*v4, *v6, name_offsets, bytes(countries), bytes(names)]:
+            f.write(b"\0" * (-f.tell() % 8))  # 8-byte align every array
+            f.write(section.tobytes() if isinstance(section, array) else section)
+    os.replace(tmp_path, out_path)
+    return len(v4[0]), len(v6[0])
+
+
+class IPIndex:
+    """Read-only view over the memory-mapped range arrays"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, little, n4, n6, n_names, names_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or bool(little) != (sys.byteorder == "little"):
+            raise ValueError(f"Incompatible IP index: {path}")
+
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+
+        def take(nbytes, fmt=None):
+            nonlocal pos
+            pos += -pos % 8
+            section = view[pos:pos + nbytes]
+            pos += nbytes
+            return section.cast(fmt) if fmt else section
+
+        self.sizes = {4: n4, 6: n6}
+        self._ranges = {}
+        for version, n, width, code in ((4, n4, 4, "I"), (6, n6, 8, "Q")):
+            self._ranges[version] = (take(width * n, code), take(width * n, code),
+                                     take(4 * n, "f"), take(4 * n, "f"), take(4 * n, "I"))
+        self._name_off = take(4 * (n_names + 1), "I")
+        self._country = take(2 * n_names)
+        self._names = take(names_len)
+
+    def lookup(self, ip: str):
+        """'8.8.8.8' / '2a00:1450::1' -> (lat, lon, city, country), or None if not covered"""
+        try:
+            # Fast path for dotted IPv4 (most clients); ipaddress only for IPv6
+            version, key = 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+        except OSError:
+            try:
+                version, key = _ip_key(ipaddress.ip_address(ip))
+            except ValueError:
+                return None
+        starts, ends, lats, lons, name_idx = self._ranges[version]
+        i = bisect.bisect_right(starts, key) - 1
+        if i < 0 or key > ends[i]:
+            return None
+        n = name_idx[i]
+        city = bytes(self._names[self._name_off[n]:self._name_off[n + 1]]).decode("utf-8")
+        country = bytes(self._country[2 * n:2 * n + 2]).decode("ascii").strip()
+        return round(lats[i], 4), round(lons[i], 4), city, country
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_ip_index():
+    """The mmap'd index, or None if it hasn't been built (then only the remote lookup is left)"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                if os.path.exists(IPGEO_PATH):
+                    start = time.perf_counter()
+                    _index = IPIndex(IPGEO_PATH)
+                    print(f"🌐 IP index loaded: {_index.sizes[4]} IPv4 + {_index.sizes[6]} IPv6 ranges "
+                          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+                else:
+                    print(f"⚠️ No IP index at {IPGEO_PATH} (python -m services.ip_geo build ...), using remote lookups")
+                _index_loaded = True
+    return _index
+
+
+@functools.lru_cache(maxsize=IPGEO_CACHE_SIZE)
+def _cached_lookup(ip: str):
+    return _index.lookup(ip)
+
+
+def lookup_ip(ip: str):
+    """(lat, lon, city, country) for a client IP from the local index, or None"""
+    _stats["lookups"] += 1
+    if get_ip_index() is None:
+        _stats["skipped"] += 1
+        return None
+    result = _cached_lookup(ip)
+    _stats["hits" if result else "misses"] += 1
+    return result
+
+
+def get_ipgeo_stats():
+    cache = _cached_lookup.cache_info()
+    return {
+        **_stats,
+        "cache_hits": cache.hits,
+        "cache_misses": cache.misses,
+        "cache_entries": cache.currsize,
+        "ranges_v4": _index.sizes[4] if _index else 0,
+        "ranges_v6": _index.sizes[6] if _index else 0,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the local IP geolocation index")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("csv", nargs="+", help="GeoLite2 City blocks (IPv4/IPv6) or DB-IP style range CSVs")
+    parser.add_argument("--locations", help="GeoLite2 City locations CSV (city / country names)")
+    parser.add_argument("--out", default=IPGEO_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n4, n6 = build_index(args.csv, args.locations, args.out)
+    print(f"✅ Wrote {args.out}: {n4} IPv4 + {n6} IPv6 ranges in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,155 @@
+import json
+
+# Incremental JSON object parser
+# Gemini's JSON-mode output arrives as arbitrary text chunks. This parser consumes them
+# as they come and reports top-level fields of the object as soon as they are readable:
+#   ("delta", key, text)  - newly decoded characters of a string value
+#   ("field", key, value) - a value is complete (strings, numbers, nested objects...)
+# It only tracks what it needs to (top-level keys and string escapes), so each chunk is
+# handled in a single pass with no re-parsing of the accumulated text.
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+# States
+_BEFORE_OBJECT, _BEFORE_KEY, _KEY, _COLON, _BEFORE_VALUE, _STRING, _RAW, _AFTER_VALUE, _DONE = range(9)
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self._state = _BEFORE_OBJECT
+        self._key = None
+        self._buf = []          # current key / string value characters
+        self._escape = None     # None, "" (after backslash) or partial \uXXXX hex digits
+        self._pending_high = None  # high surrogate waiting for its low half
+        self._raw = []          # non-string value text
+        self._depth = 0         # nesting inside a non-string value
+        self._raw_in_string = False
+        self._raw_escape = False
+        self.result = {}
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def _decode_char(self, c: str):
+        """Handles escapes inside a string; returns decoded text (possibly empty)"""
+        if self._escape is None:
+            if c == "\\":
+                self._escape = ""
+                return ""
+            return c
+        if self._escape == "" and c != "u":
+            self._escape = None
+            return _ESCAPES.get(c, c)
+        self._escape += c
+        if len(self._escape) < 5:  # "u" + 4 hex digits
+            return ""
+        code = int(self._escape[1:], 16)
+        self._escape = None
+        if 0xD800 <= code < 0xDC00:
+            self._pending_high = code
+            return ""
+        if 0xDC00 <= code < 0xE000 and self._pending_high is not None:
+            code = 0x10000 + ((self._pending_high - 0xD800) << 10) + (code - 0xDC00)
+            self._pending_high = None
+        return chr(code)
+
+    def feed(self, chunk: str):
+        """Consumes a chunk of text and returns the events it completed"""
+        events = []
+        delta = []
+        for c in chunk:
+            state = self._state
+            if state == _STRING:
+                if self._escape is None and c == '"':
+                    if delta:
+                        events.append(("delta", self._key, "".join(delta)))
+                        delta = []
+                    value = "".join(self._buf)
+                    self.result[self._key] = value
+                    events.append(("field", self._key, value))
+                    self._state = _AFTER_VALUE
+                else:
+                    decoded = self._decode_char(c)
+                    if decoded:
+                        self._buf.append(decoded)
+                        delta.append(decoded)
+            elif state == _KEY:
+                if self._escape is None and c == '"':
+                    self._key = "".join(self._buf)
+                    self._state = _COLON
+                else:
+                    self._buf.append(self._decode_char(c))
+            elif state == _RAW:
+                if self._consume_raw(c, events):
+                    # The terminator belongs to the object, not the value
+                    self._after_value(c, events)
+            elif c.isspace():
+                continue
+            elif state == _BEFORE_OBJECT:
+                if c == "{":
+                    self._state = _BEFORE_KEY
+            elif state == _BEFORE_KEY:
+                if c == '"':
+                    self._buf = []
+                    self._state = _KEY
+                elif c == "}":
+                    self._state = _DONE
+            elif state == _COLON:
+                if c == ":":
+                    self._state = _BEFORE_VALUE
+            elif state == _BEFORE_VALUE:
+                if c == '"':
+                    self._buf = []
+                    self._state = _STRING
+                else:
+                    self._raw = [c]
+                    self._depth = 1 if c in "{[" else 0
+                    self._raw_in_string = False
+                    self._state = _RAW
+            elif state == _AFTER_VALUE:
+                self._after_value(c, events)
+        if delta:
+            events.append(("delta", self._key, "".join(delta)))
+        return events
+
+    def _after_value(self, c: str, events):
+        if c == ",":
+            self._state = _BEFORE_KEY
+        elif c == "}":
+            self._state = _DONE
+
+    def _consume_raw(self, c: str, events) -> bool:
+        """Accumulates a number / literal / nested value; True when c ended it"""
+        if self._raw_in_string:
+            self._raw.append(c)
+            if self._raw_escape:
+                self._raw_escape = False
+            elif c == "\\":
+                self._raw_escape = True
+            elif c == '"':
+                self._raw_in_string = False
+            return False
+        if self._depth == 0 and (c in ",}" or c.isspace()):
+            self._finish_raw(events)
+            if c.isspace():
+                self._state = _AFTER_VALUE
+                return False
+            return True
+        self._raw.append(c)
+        if c == '"':
+            self._raw_in_string = True
+        elif c in "{[":
+            self._depth += 1
+        elif c in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                self._finish_raw(events)
+                self._state = _AFTER_VALUE
+        return False
+
+    def _finish_raw(self, events):
+        value = json.loads("".join(self._raw))
+        self.result[self._key] = value
+        events.append(("field", self._key, value))
+        self._raw = []
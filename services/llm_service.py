@@ -1,123 +1,220 @@
 import os
-import google.generativeai as genai
-from .weather_service import get_current_weather
+import json
+import threading
+from .weather_service import get_current_weather, get_weather_batch
+from .executor import run_blocking, iterate_blocking, BACKENDS
+from .location_intent import detect_location_locally, record_decision, get_automaton, AMBIGUOUS
+from .prompt_builder import SYSTEM_INSTRUCTIONS, build_context, theme_key, record_usage
+from .metrics import span
+from .startup import warmed
+from .chat_cache import make_key, get_or_generate, cached_response, store, record_bypass
+from .appearance import apply_appearance
 
 # Configure API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-# Initialize Model (No tools needed now, so we can force JSON mode safely)
-# Using gemini 2.5 Flash Lite for best JSON compliance
-model = genai.GenerativeModel('gemini-2.5-flash-lite')
-
-SYSTEM_PROMPT = """
-You are TenkiGuide, a helpful AI weather assistant. 
-Your personality depends on the user's chosen 'Theme'.
-You have access to real-time weather data provided in the context.
-
-STRICT JSON OUTPUT REQUIRED:
-You must return a JSON object with these exact fields:
-1. "english_text": The response in English.
-2. "japanese_text": The response in Japanese.
-3. "summary": A concise summary of the conversation so far, ALWAYS including both the last mentioned location AND the current theme. The summary must start with the location, e.g., "In Tokyo (friendly theme), the user asked about activities." Do not include coordinates or specific numbers in the summary.
-4. "hex_color": A hex color code (e.g., #FF5733) representing the mood/weather.
-5. "avatar_state": One of these exact strings: ["neutral", "happy", "sad", "surprised", "wearing_sunglasses", "wearing_scarf", "holding_umbrella", "shivering", "sweating"].
-
-General Logic:
-- Use the provided 'Current Weather Data' and 'Tomorrow's Forecast' to answer questions about current or future weather.
-- ALWAYS include relevant weather details in your response: temperature, weather conditions (e.g., sunny, rainy), wind speed, and humidity for the time period asked (current or tomorrow).
-- Do not mention specific times of day (e.g., 7 PM) unless explicitly provided in the weather data. Use general terms like 'daytime' or 'nighttime' based on is_day.
-- Choose 'hex_color' and 'avatar_state' based on the weather OR the emotional context.
-- IMPORTANT: For 'hex_color', NEVER use dark blue colors (avoid colors like #000080, #00008B, #191970, #00004F, or any hex where blue channel is dominant and the color is dark). Use bright, vibrant, or light colors instead.
-- The summary must always reference the most recent location AND the current theme being used in the conversation.
-
-PLACE RECOMMENDATION RULES (CRITICAL):
-- If you know specific, real places/landmarks/venues in the location, mention 2-3 of them by name.
-- ONLY give generic suggestions (like "explore the city" or "visit a park") if you're uncertain about actual places in that location.
-- NEVER mention specific events, concerts, matches, or performers that you're not certain about.
-- Connect your place suggestions to the weather (e.g., indoor venues for rain, outdoor spots for sunny weather).
-
-THEME-SPECIFIC BEHAVIOR:
-
-**Travel Theme:**
-- Suggest 2-3 well-known tourist attractions, landmarks, or cultural sites in the city (if you know them).
-- Mention how the weather affects sightseeing (e.g., "great weather for walking tours" or "consider indoor museums").
-- Example: "Consider visiting the Senso-ji Temple or taking a stroll through Ueno Park."
-- If unsure about places: Give general travel advice like "explore local neighborhoods" or "visit cultural sites."
-
-**Music Theme:**
-- Suggest music venues, concert halls, jazz clubs, or famous music districts in the city (if you know them).
-- Connect music activities to weather (outdoor street music vs indoor venues).
-- Example: "You could check out live music at Blue Note Tokyo or explore the music shops in Shibuya."
-- NEVER mention specific concerts or performers.
-- If unsure about places: Give general advice like "enjoy some street music" or "visit local music venues."
-
-**Fashion Theme:**
-- Suggest famous fashion districts, shopping streets, markets, or malls in the city (if you know them).
-- Recommend clothing types based on the weather (layers for cold, light fabrics for heat, etc.).
-- Example: "Perfect weather to explore the boutiques in Harajuku or shop at Shibuya 109."
-- If unsure about places: Give general fashion advice like "visit local markets" or "explore shopping districts."
-
-**Sports Theme:**
-- Suggest stadiums, sports complexes, parks suitable for sports, or outdoor activity areas (if you know them).
-- Recommend indoor vs outdoor activities based on weather.
-- Example: "Great day for a run in Yoyogi Park or visiting the Tokyo Dome area."
-- NEVER mention specific matches or sporting events.
-- If unsure about places: Give general sports advice like "perfect for outdoor exercise" or "consider indoor sports facilities."
-
-**Friendly Theme (Default):**
-- Be warm and conversational.
-- Still suggest 2-3 specific places if you know them, weather-appropriate activities, or general exploration tips.
-- Example: "It's a beautiful day! You might enjoy visiting the gardens or grabbing coffee at a local café."
-"""
-
-async def chat_with_gemini(message: str, history_summary: str, city_name: str, lat: float, lon: float, theme: str):
-    
-    # 1. Pre-fetch weather data manually
+# The SDK is imported and configured on first use (or by the startup warm-up), from a
+# worker thread: it is the heaviest import in the app and would delay a cold start.
+# GEMINI_ENDPOINT points the SDK at a local stand-in (benchmarks / load tests) over REST
+GEMINI_ENDPOINT = os.getenv("GEMINI_ENDPOINT")
+MODEL_NAME = 'gemini-2.5-flash-lite'
+# The SDK retries 503s for up to 10 minutes by default, far past the executor's call
+# timeout: keep a short retry budget and let the circuit breaker (services.resilience)
+# fail fast while Gemini is down
+GEMINI_RETRY_BUDGET = float(os.getenv("GEMINI_RETRY_BUDGET", "3"))
+CHAT_TIMEOUT = BACKENDS["gemini"]["timeout"]
+PROBE_TIMEOUT = 10.0
+
+_genai = None
+_retry = None
+_models = {}   # None -> plain model, theme key -> chat model
+_models_lock = threading.Lock()
+
+def _load_genai():
+    global _genai, _retry
+    if _genai is None:
+        import google.generativeai as genai
+        from google.api_core import retry, exceptions
+        _retry = retry.Retry(initial=0.25, maximum=1.0, multiplier=2.0, timeout=GEMINI_RETRY_BUDGET,
+                             predicate=retry.if_exception_type(exceptions.ServiceUnavailable))
+        if GEMINI_ENDPOINT:
+            print(f"🧪 Gemini -> {GEMINI_ENDPOINT}")
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY") or "local", transport="rest",
+                            client_options={"api_endpoint": GEMINI_ENDPOINT})
+        else:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        _genai = genai
+    return _genai
+
+def _get_model(key):
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                genai = _load_genai()
+                if key is None:
+                    # Plain model for short utility prompts (location detection)
+                    model = genai.GenerativeModel(MODEL_NAME)
+                else:
+                    # Initialize Model (No tools needed now, so we can force JSON mode safely)
+                    # Using gemini 2.5 Flash Lite for best JSON compliance
+                    # One model per theme, with the static instructions compiled into its system
+                    # instruction: only the chosen theme's rules are sent, and the prefix stays
+                    # identical across requests (which Gemini's implicit context caching can reuse)
+                    model = genai.GenerativeModel(
+                        MODEL_NAME,
+                        system_instruction=SYSTEM_INSTRUCTIONS[key],
+                        generation_config={"response_mime_type": "application/json"},
+                    )
+                _models[key] = model
+    return model
+
+def get_model():
+    return _get_model(None)
+
+def _request_options(timeout: float):
+    """Per-call SDK options (after _load_genai): bounded retries, per-attempt timeout"""
+    return {"retry": _retry, "timeout": timeout}
+
+def get_chat_model(theme: str):
+    return _get_model(theme_key(theme))
+
+def warm_up_models():
+    """Imports the SDK and builds every model (startup warm-up; blocking)"""
+    get_model()
+    for key in SYSTEM_INSTRUCTIONS:
+        _get_model(key)
+
+async def _chat_weather(lat: float, lon: float, extra_places=()):
+    """
+    Weather for the turn's place, plus [(name, lat, lon, weather)] for any other places
+    asked about (all cells fetched in one Open-Meteo request)
+    """
+    # Pre-fetch weather data manually
     # We do this every time so the AI always has the context to pick colors/avatars
     try:
-        weather_data = await get_current_weather(lat, lon)
-        weather_current = weather_data.get('current', {})
-        weather_daily = weather_data.get('daily', {})
+        with span("weather"):
+            if not extra_places:
+                return await get_current_weather(lat, lon), []
+            weathers = await get_weather_batch([(lat, lon)] + [(p_lat, p_lon) for _, p_lat, p_lon in extra_places])
     except Exception:
-        weather_current = {}
-        weather_daily = {}
+        return {}, []
+    extras = [(name, p_lat, p_lon, weather or {}) for (name, p_lat, p_lon), weather in zip(extra_places, weathers[1:])]
+    return weathers[0] or {}, extras
 
-    # 2. Construct the full prompt
-    full_prompt = f"""
-    System: {SYSTEM_PROMPT}
-    
-    Context:
-    - User Selected Theme: {theme}
-    - Current Location: {city_name} (Lat: {lat}, Lon: {lon})
-    - Current Weather Data: {weather_current}
-    - Tomorrow's Forecast: {weather_daily}
-    - Previous Chat Summary: {history_summary}
-    
-    User Message: {message}
+def _build_chat_prompt(message: str, history_summary: str, city_name: str, lat: float, lon: float, theme: str,
+                       weather_data: dict, extras=()):
+    """Compact per-turn context (the rest is in the theme model's system instruction)"""
+    return build_context(message, history_summary, city_name, lat, lon, theme, weather_data, extras)
+
+def _with_appearance(text: str, weather_data: dict) -> str:
+    """Adds the locally decided avatar_state / hex_color to a JSON answer (left as is if unparseable)"""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return text
+    if not isinstance(data, dict):
+        return text
+    return json.dumps(apply_appearance(data, weather_data), ensure_ascii=False)
+
+def _is_cacheable(text: str) -> bool:
+    """Only complete JSON answers are worth replaying"""
+    try:
+        return isinstance(json.loads(text), dict)
+    except (TypeError, ValueError):
+        return False
+
+async def chat_with_gemini(message: str, history_summary: str, city_name: str, lat: float, lon: float, theme: str,
+                           use_cache: bool = True, extra_places=None):
+    """extra_places: [(name, lat, lon)] of other places in the turn ("Tokyo or Osaka?")"""
+    weather_data, extras = await _chat_weather(lat, lon, extra_places)
+    context = _build_chat_prompt(message, history_summary, city_name, lat, lon, theme, weather_data, extras)
+
+    def generate_content():
+        return get_chat_model(theme).generate_content(context, request_options=_request_options(CHAT_TIMEOUT))
+
+    async def generate():
+        # Send to Gemini (Strict JSON Mode is set on the model)
+        response = await run_blocking("gemini", generate_content)
+        record_usage(response.usage_metadata, theme)
+        return response.text, _is_cacheable(response.text)
+
+    key = make_key(message, history_summary, city_name, lat, lon, theme, weather_data, extras) if use_cache else None
+    if key is None:
+        record_bypass()
+        text, _cacheable = await generate()
+    else:
+        text = await get_or_generate(key, generate)
+    # Decided after the cache, so a cached answer never carries a stale appearance
+    return _with_appearance(text, weather_data)
+
+async def chat_with_gemini_stream(message: str, history_summary: str, city_name: str, lat: float, lon: float, theme: str,
+                                  use_cache: bool = True, extra_places=None):
     """
-    
-    # 3. Send to Gemini with Strict JSON Mode enforcement
-    response = model.generate_content(
-        full_prompt,
-        generation_config={"response_mime_type": "application/json"}
-    )
-    
-    return response.text
+    Same as chat_with_gemini, but yields the JSON text chunk by chunk as Gemini generates it
+    (without avatar_state / hex_color: the caller resolves them with services.appearance)
+    """
+    weather_data, extras = await _chat_weather(lat, lon, extra_places)
+    key = make_key(message, history_summary, city_name, lat, lon, theme, weather_data, extras) if use_cache else None
+    if key is None:
+        record_bypass()
+    else:
+        cached = cached_response(key)
+        if cached is not None:
+            yield cached  # Whole answer in one chunk
+            return
+
+    context = _build_chat_prompt(message, history_summary, city_name, lat, lon, theme, weather_data, extras)
+
+    def generate():
+        response = get_chat_model(theme).generate_content(context, stream=True,
+                                                          request_options=_request_options(CHAT_TIMEOUT))
+        for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+        record_usage(response.usage_metadata, theme)  # Complete once the stream is drained
+
+    chunks = []
+    async for text in iterate_blocking("gemini", generate):
+        chunks.append(text)
+        yield text
+    full_text = "".join(chunks)
+    if key is not None and _is_cacheable(full_text):
+        store(key, full_text)
+
+async def ping_gemini():
+    """Smallest real generation (1 output token) to keep the Gemini path warm"""
+    def probe():
+        return get_model().generate_content("ping", generation_config={"max_output_tokens": 1},
+                                            request_options=_request_options(PROBE_TIMEOUT))
+
+    with span("gemini.ping"):
+        await run_blocking("gemini", probe, call_timeout=PROBE_TIMEOUT)
 
 async def detect_target_location(user_message: str):
     """
-    Ask Gemini if the user mentioned a specific location.
+    Decide if the user mentioned a specific location.
+    The local matcher settles clear cases; Gemini is only asked when it is ambiguous.
     Returns: "Tokyo" or None
     """
+    await warmed("intent", get_automaton)
+    with span("intent.local"):
+        status, location = detect_location_locally(user_message)
+    record_decision(status)
+    if status != AMBIGUOUS:
+        return location
+
     prompt = f"""
     Analyze this message: "{user_message}"
     If the user mentioned a specific city, country, or location (even if not explicitly for weather), return ONLY the location name (e.g., 'Tokyo').
     If no specific location is mentioned, return 'None'.
     Do not output markdown or json, just the plain text string.
     """
+
+    def detect_location():
+        return get_model().generate_content(prompt, request_options=_request_options(PROBE_TIMEOUT))
     
     try:
-        response = model.generate_content(prompt)
+        response = await run_blocking("gemini", detect_location, call_timeout=PROBE_TIMEOUT)
         text = response.text.strip()
         if "None" in text or len(text) > 50: # Safety check
             return None
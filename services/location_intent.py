@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import deque
+from .gazetteer import DATA_DIR, read_cities_tsv
+
+# Local location-intent detector
+# An Aho-Corasick automaton over city (pop >= 100k) and country names in English and
+# Japanese, plus prepositional cues ("in X", "to the X", "Xの天気") and abbreviations
+# ("LA", "NYC"). It settles the common cases locally; only ambiguous messages are sent
+# to Gemini by detect_target_location.
+
+COUNTRIES_PATH = os.path.join(DATA_DIR, "countries.tsv")
+MIN_CITY_POPULATION = 100_000
+# Well-known cities are accepted even when typed in lowercase without a cue ("weather tokyo")
+MAJOR_CITY_POPULATION = 1_000_000
+
+MATCH = "match"
+NO_LOCATION = "none"
+AMBIGUOUS = "ambiguous"
+
+# Place names that are also everyday English words or first names: need a cue ("in Nice")
+STOP_NAMES = {
+    "nice", "mobile", "split", "reading", "bath", "orange", "male", "hope", "surprise", "delta",
+    "independence", "mission", "temple", "wells", "victoria", "florence", "austin", "jackson",
+    "madison", "lincoln", "aurora", "phoenix", "chad", "jordan", "georgia", "turkey", "china",
+    "troy", "eugene", "irving", "tyler", "lawrence", "chandler", "gary", "cary", "ajax", "sale",
+    "brest", "bello", "bole", "cork", "gaya", "hub", "ann", "ho", "bo", "jos", "ise", "ica",
+    "ede", "fes", "gao", "ibb", "itu", "iwo", "ajo", "una", "leon", "york", "derby", "kent",
+    "bonn", "essen", "hamm", "herne", "zug", "mons", "cali", "bari", "beni", "buda", "coro",
+    "dali", "fuji", "goma", "homs", "kandy", "bima", "vila", "brits", "crato", "tver", "salem",
+}
+# Words that follow "in"/"at" without being places
+CUE_STOPWORDS = {
+    "the", "a", "an", "my", "our", "your", "this", "that", "here", "there", "general", "total",
+    "morning", "afternoon", "evening", "night", "today", "tomorrow", "weekend", "summer",
+    "winter", "spring", "autumn", "fall", "january", "february", "march", "april", "may",
+    "june", "july", "august", "september", "october", "november", "december", "monday",
+    "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday", "i", "english",
+    "japanese", "case", "fact", "mind", "time", "town", "city", "area", "bed", "home",
+}
+_EN_CUE = re.compile(r"\b(?:in|at|for|to|near|around|from|visiting|visit|about)\s+$", re.IGNORECASE)
+_EN_CUE_UNKNOWN = re.compile(r"\b(?:in|at|near|around|to|from|visiting|visit)\s+(?:[Tt]he\s+)?([A-Z][\w'\-]+)")
+# Short all-caps tokens are often place abbreviations ("LA", "NYC", "SF"), except these
+_ABBREVIATION = re.compile(r"\b[A-Z]{2,4}\b")
+ABBREVIATION_STOPWORDS = {
+    "OK", "AM", "PM", "UV", "TV", "AC", "AI", "ID", "PS", "FYI", "BTW", "LOL", "OMG", "ASAP", "ETA",
+    "FAQ", "DIY", "BBQ", "GPS", "APP", "MPH", "KMH", "AQI", "SPF",
+}
+_JA_UNKNOWN = re.compile(r"([゠-ヿ一-鿿]{2,})(?:の天気|の気温|の予報|に行|へ行|に旅行|へ旅行)")
+_JA_TIME_WORDS = {
+    "今日", "明日", "明後日", "今週", "来週", "週末", "今夜", "今晩", "午後", "午前", "現在",
+    "地元", "近所", "現地", "近く", "今後", "今年", "来年", "毎日", "一日", "天気", "最近",
+}
+
+
+def _fold(text: str) -> str:
+    """Lowercase without accents, keeping string length (so spans map back to the message)"""
+    out = []
+    for c in text.lower():
+        base = unicodedata.normalize("NFKD", c)[0] if not c.isascii() else c
+        out.append(base if base.isascii() else c)
+    return "".join(out)
+
+
+class _Automaton:
+    """Aho-Corasick automaton over folded patterns -> (canonical name, population, is_latin)"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add(self, pattern: str, value):
+        node = 0
+        for c in pattern:
+            nxt = self.goto[node].get(c)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][c] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(c, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text: str):
+        """Yields (start, end, value) for every pattern occurrence"""
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(c, 0)
+            for length, value in self.out[node]:
+                yield i + 1 - length, i + 1, value
+
+
+def _is_latin(s: str) -> bool:
+    return all(c.isascii() or ord(c) < 0x250 for c in s)
+
+
+def _build_automaton():
+    auto = _Automaton()
+
+    def add(name, canonical, population):
+        pattern = _fold(name.strip())
+        latin = _is_latin(pattern)
+        if len(pattern) < (3 if latin else 2):
+            return
+        auto.add(pattern, (canonical, population, latin))
+
+    for name, _lat, _lon, _country, pop, alts in read_cities_tsv():
+        if pop < MIN_CITY_POPULATION:
+            continue
+        add(name, name, pop)
+        if name.endswith(" City"):
+            add(name[:-5], name, pop)
+        for alt in alts:
+            add(alt, name, pop)
+
+    with open(COUNTRIES_PATH, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            english, _, japanese = line.rstrip("\n").partition("\t")
+            # Countries rank above any city that shares their name
+            add(english, english, 10 ** 10)
+            for alias in filter(None, japanese.split(",")):
+                add(alias, english, 10 ** 10)
+
+    auto.build()
+    return auto
+
+
+_automaton = None
+_automaton_lock = threading.Lock()
+_stats = {"local_match": 0, "local_none": 0, "ambiguous": 0}
+
+
+def get_automaton():
+    """Builds the automaton on first use (the startup warm-up preloads it)"""
+    global _automaton
+    if _automaton is None:
+        with _automaton_lock:
+            if _automaton is None:
+                start = time.perf_counter()
+                _automaton = _build_automaton()
+                print(f"🧭 Location-intent automaton built: {len(_automaton.goto)} states "
+                      f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return _automaton
+
+
+def _longest_matches(folded: str):
+    """Leftmost-longest, non-overlapping, word-bounded (for Latin) matches"""
+    candidates = []
+    for start, end, (name, pop, latin) in get_automaton().find(folded):
+        if latin and ((start > 0 and folded[start - 1].isalnum()) or (end < len(folded) and folded[end].isalnum())):
+            continue
+        candidates.append((start, end, name, pop, latin))
+    candidates.sort(key=lambda m: (m[0], -(m[1] - m[0]), -m[3]))
+    chosen, last_end = [], -1
+    for m in candidates:
+        if m[0] >= last_end:
+            chosen.append(m)
+            last_end = m[1]
+    return chosen
+
+
+def _accepted_places(message: str, folded: str):
+    """(names accepted in order, weak: a stop-name may be a place, covered positions)"""
+    accepted, weak = [], False
+    covered = set()
+    for start, end, name, pop, latin in _longest_matches(folded):
+        covered.update(range(start, end))
+        if not latin:
+            accepted.append(name)
+            continue
+        word = folded[start:end]
+        has_cue = bool(_EN_CUE.search(message[:start]))
+        capitalized = message[start].isupper()
+        if has_cue:
+            accepted.append(name)
+        elif word in STOP_NAMES:
+            weak = weak or capitalized
+        elif (capitalized and len(word) >= 4) or pop >= MAJOR_CITY_POPULATION:
+            accepted.append(name)
+    return list(dict.fromkeys(accepted)), weak, covered
+
+
+def detect_location_locally(message: str):
+    """
+    Returns (MATCH, name), (NO_LOCATION, None) or (AMBIGUOUS, None).
+    AMBIGUOUS means the caller should ask the LLM.
+    """
+    if not message:
+        return NO_LOCATION, None
+    folded = _fold(message)
+    if len(folded) != len(message):
+        return AMBIGUOUS, None
+
+    names, weak, covered = _accepted_places(message, folded)
+    if len(names) == 1 and not weak:
+        return MATCH, names[0]
+    if names or weak:
+        return AMBIGUOUS, None
+
+    # A cue pointing at something we don't know ("in Hogsmeade", "ニセコの天気")
+    for m in _EN_CUE_UNKNOWN.finditer(message):
+        if m.start(1) not in covered and m.group(1).lower() not in CUE_STOPWORDS:
+            return AMBIGUOUS, None
+    for m in _JA_UNKNOWN.finditer(message):
+        if m.start(1) not in covered and not any(w in m.group(1) for w in _JA_TIME_WORDS):
+            return AMBIGUOUS, None
+    # "What about LA?" (unless the whole message is shouted)
+    if not (message.isupper() and len(message.split()) > 2):
+        for m in _ABBREVIATION.finditer(message):
+            if m.start() not in covered and m.group() not in ABBREVIATION_STOPWORDS:
+                return AMBIGUOUS, None
+    return NO_LOCATION, None
+
+
+def mentioned_places(message: str):
+    """Every known place the message clearly names, in order ("Tokyo or Osaka?" -> both)"""
+    if not message:
+        return []
+    folded = _fold(message)
+    if len(folded) != len(message):
+        return []
+    return _accepted_places(message, folded)[0]
+
+
+def record_decision(status: str):
+    _stats[{MATCH: "local_match", NO_LOCATION: "local_none", AMBIGUOUS: "ambiguous"}[status]] += 1
+
+
+def get_intent_stats():
+    """How many detections were settled locally vs. sent to the LLM"""
+    total = sum(_stats.values())
+    return {**_stats, "llm_ratio": round(_stats["ambiguous"] / total, 4) if total else 0.0}
@@ -1,15 +1,102 @@
-import httpx
-import geocoder
+import os
+import time
+from collections import OrderedDict
+from .http_client import get_http_session, get_http_timeout
+from .executor import run_blocking
+from .gazetteer import get_gazetteer
+from .weather_service import snap_to_grid
+from .ip_geo import lookup_ip, get_ip_index
+from .startup import warmed
 
 # Location Coordinates (Fallback)
 FALLBACK_LAT = 12.9165
 FALLBACK_LON = 79.1325
 FALLBACK_CITY = "Vellore"
 
+# geocoder (and requests under it) is imported on first use, inside the worker thread
+def _checked(g):
+    """
+    geocoder swallows HTTP / connection errors into g.error. Transport errors, 5xx and 429 are
+    raised so the circuit breaker sees them; a 4xx or an error in the answer (a point at sea has
+    no address) comes back as a miss (no address / latlng).
+    """
+    if g.error:
+        status = g.status_code if isinstance(g.status_code, int) else None   # 'Unknown': no response
+        if status == 200 and isinstance(g.error, int):
+            status = g.error   # ArcGIS puts the real status in the JSON body
+        if status is None or status >= 500 or status == 429:
+            raise ConnectionError(g.error)
+    return g
+
+def _arcgis_reverse(lat: float, lon: float):
+    import geocoder
+    return _checked(geocoder.arcgis([lat, lon], method='reverse',
+                                    session=get_http_session("arcgis"), timeout=get_http_timeout("arcgis")))
+
+def _arcgis_forward(city_name: str):
+    import geocoder
+    return _checked(geocoder.arcgis(city_name, session=get_http_session("arcgis"), timeout=get_http_timeout("arcgis")))
+
+def _ipinfo(client_ip: str):
+    import geocoder
+    return _checked(geocoder.ip(client_ip, session=get_http_session("ipinfo"), timeout=get_http_timeout("ipinfo")))
+
+def warm_up_geocoder():
+    """Imports geocoder and opens the session pools (startup warm-up; blocking)"""
+    import geocoder  # noqa: F401
+    get_http_session("arcgis")
+    get_http_session("ipinfo")
+
+# Remote ipinfo lookup for client IPs the local index (services.ip_geo) doesn't cover
+IPGEO_REMOTE_FALLBACK = os.getenv("IPGEO_REMOTE_FALLBACK", "1") == "1"
+
+# ArcGIS answers (gazetteer misses) are kept per weather grid cell / city name, so
+# repeat places and the idle warm-up (services.warmup) don't call ArcGIS again.
+# Expired answers stay until evicted: if ArcGIS fails (or its circuit is open), the last
+# good answer is served instead.
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", "86400"))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "1024"))
+_geocode_cache = OrderedDict()   # ("reverse", cell) / ("forward", name) -> (expires_at, value)
+
+def _cached_geocode(key, stale: bool = False):
+    entry = _geocode_cache.get(key)
+    if entry is None or (entry[0] <= time.time() and not stale):
+        return None
+    _geocode_cache.move_to_end(key)
+    return entry[1]
+
+def _store_geocode(key, value):
+    _geocode_cache[key] = (time.time() + GEOCODE_CACHE_TTL, value)
+    _geocode_cache.move_to_end(key)
+    while len(_geocode_cache) > GEOCODE_CACHE_MAX_ENTRIES:
+        _geocode_cache.popitem(last=False)
+
+async def _lookup_offline(lookup):
+    """Runs a gazetteer lookup; any failure just means falling back to ArcGIS"""
+    try:
+        return lookup(await warmed("gazetteer", get_gazetteer))
+    except Exception as e:
+        print(f"Gazetteer Error: {e}")
+        return None
+
 async def get_location_name(lat: float, lon: float):
-    """Reverse geocoding to get City Name using Geocoder (Arcgis)"""
+    """Reverse geocoding to get City Name (offline gazetteer first, Arcgis on a miss)"""
+    city = await _lookup_offline(lambda gazetteer: gazetteer.reverse(lat, lon))
+    if city:
+        return city["name"]
+    key = ("reverse", snap_to_grid(lat, lon))
+    cached = _cached_geocode(key)
+    if cached:
+        return cached
+    name = await _arcgis_location_name(lat, lon)
+    if name:
+        _store_geocode(key, name)
+        return name
+    return _cached_geocode(key, stale=True) or "Unknown Location"
+
+async def _arcgis_location_name(lat: float, lon: float):
     try:
-        g = geocoder.arcgis([lat, lon], method='reverse')
+        g = await run_blocking("geocoder", _arcgis_reverse, lat, lon)
         if g and g.address:
             # Prefer city, then town, then village, then locality
             city = g.city or g.town or g.village
@@ -26,12 +113,12 @@ async def get_location_name(lat: float, lon: float):
                     return part
     except Exception as e:
         print(f"Geocoding Error: {e}")
-    return "Unknown Location"
+    return None
 
-def resolve_coordinates(lat, lon, client_ip):
+async def resolve_coordinates(lat, lon, client_ip):
     """
     1. Prefer GPS (lat/lon provided)
-    2. Fallback to IP Geolocation
+    2. Fallback to IP Geolocation (local index, then ipinfo if IPGEO_REMOTE_FALLBACK)
     3. Fallback to Vellore (Dev mode)
     """
     if lat is not None and lon is not None:
@@ -40,9 +127,14 @@ def resolve_coordinates(lat, lon, client_ip):
     # Try IP-based
     try:
         if client_ip and client_ip != "127.0.0.1":
-            g = geocoder.ip(client_ip)
-            if g.latlng:
-                return g.latlng[0], g.latlng[1]
+            await warmed("ipgeo", get_ip_index)
+            local = lookup_ip(client_ip)
+            if local:
+                return local[0], local[1]
+            if IPGEO_REMOTE_FALLBACK:
+                g = await run_blocking("geocoder", _ipinfo, client_ip, upstream="ipinfo")
+                if g.latlng:
+                    return g.latlng[0], g.latlng[1]
     except Exception:
         pass
     
@@ -52,14 +144,25 @@ def resolve_coordinates(lat, lon, client_ip):
 
 
 async def get_coordinates_from_city(city_name: str):
-    """Converts 'Tokyo' -> (35.6, 139.6) using Geocoder"""
+    """Converts 'Tokyo' -> (35.6, 139.6) (offline gazetteer first, Arcgis on a miss)"""
+    city = await _lookup_offline(lambda gazetteer: gazetteer.forward(city_name))
+    if city:
+        return round(city["lat"], 5), round(city["lon"], 5), city_name
+    key = ("forward", city_name.strip().lower())
+    cached = _cached_geocode(key)
+    if cached:
+        return cached[0], cached[1], city_name
     try:
-        g = geocoder.arcgis(city_name)
+        g = await run_blocking("geocoder", _arcgis_forward, city_name)
         if g and g.latlng:
             lat, lon = g.latlng
+            _store_geocode(key, (lat, lon))
             # Use the city name or first part of address
             name = city_name  # Or g.city if available, but arcgis may not have
             return lat, lon, name
     except Exception as e:
         print(f"Geocoding Error: {e}")
+        stale = _cached_geocode(key, stale=True)
+        if stale:
+            return stale[0], stale[1], city_name
     return None, None, None
\ No newline at end of file
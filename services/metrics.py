@@ -0,0 +1,307 @@
+import os
+import sys
+import time
+import bisect
+import asyncio
+import threading
+import contextvars
+from collections import deque, Counter
+
+# Lightweight latency instrumentation
+# `span(name)` times a stage and records it in a fixed-bucket histogram (one bisect and
+# two increments, no allocation), and, when inside an HTTP request, in that request's
+# Server-Timing header. Percentiles are estimated from the buckets only when /metrics is
+# scraped, so the hot path never sorts or stores samples. MetricsMiddleware is plain
+# ASGI (streaming responses pass straight through).
+#
+# A background task samples event-loop lag (timer overshoot) into the same histograms.
+#
+# Optional slow-request profiling: with SLOW_REQUEST_MS set, a sampler thread records the
+# stacks of every thread every PROFILE_INTERVAL_MS, and requests slower than the
+# threshold dump the samples from their time window as folded stacks (flamegraph.pl /
+# speedscope format) into PROFILE_DIR.
+
+METRIC_PREFIX = "tenki"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 = profiler off
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SERVER_TIMING_MAX_ENTRIES = 24
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000
+
+# Bucket upper bounds in seconds: 1 ms .. ~100 s, x1.25 per step (quantiles within ~12%)
+BUCKETS = tuple(round(0.001 * 1.25 ** i, 6) for i in range(53))
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot: above the largest bucket
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate, interpolated linearly inside the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+_stages = {}          # stage name -> Histogram
+_requests = {}        # route -> Histogram
+_responses = Counter()  # (route, status) -> count
+_stats_sources = {}   # name -> fn() returning a (nested) dict of numbers
+_current = contextvars.ContextVar("request_spans", default=None)
+
+
+def _histogram(table: dict, name: str) -> Histogram:
+    hist = table.get(name)
+    if hist is None:
+        hist = table[name] = Histogram()
+    return hist
+
+
+def observe(name: str, seconds: float):
+    """Records a stage duration measured elsewhere"""
+    _histogram(_stages, name).observe(seconds)
+    spans = _current.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+class span:
+    """
+    Times a stage: `with span("weather"):` or `async with span("gemini"):`.
+    Failed stages are recorded too (as `<name>.error`), so errors don't hide latency.
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name if exc_type is None else f"{self.name}.error", time.perf_counter() - self.start)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def register_stats(name: str, fn):
+    """Exports an existing get_*_stats() dict as gauges on /metrics"""
+    _stats_sources[name] = fn
+
+
+def server_timing(spans, total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans[:SERVER_TIMING_MAX_ENTRIES]]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Per-route request histograms, status counters and the Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        spans = []
+        token = _current.set(spans)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(spans, time.perf_counter() - start).encode("latin-1")
+                message = {**message, "headers": [
+                    *message.get("headers", []), (b"server-timing", header), (b"timing-allow-origin", b"*"),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            _histogram(_requests, route).observe(elapsed)
+            _responses[(route, status)] += 1
+            if _profiler is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+                _profiler.dump(route, start, elapsed, spans)
+
+
+# --- Prometheus text format ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def _histogram_lines(metric: str, label: str, table: dict):
+    lines = [f"# TYPE {metric} histogram"]
+    for name, hist in sorted(table.items()):
+        cumulative = 0
+        for bound, n in zip(BUCKETS, hist.counts):
+            cumulative += n
+            lines.append(f"{metric}_bucket{{{_labels(**{label: name}, le=bound)}}} {cumulative}")
+        lines.append(f"{metric}_bucket{{{_labels(**{label: name}, le='+Inf')}}} {hist.count}")
+        lines.append(f"{metric}_sum{{{_labels(**{label: name})}}} {hist.total:.6f}")
+        lines.append(f"{metric}_count{{{_labels(**{label: name})}}} {hist.count}")
+    lines.append(f"# TYPE {metric}_quantile gauge")
+    for name, hist in sorted(table.items()):
+        for q in (0.5, 0.95, 0.99):
+            lines.append(f"{metric}_quantile{{{_labels(**{label: name}, quantile=q)}}} {hist.quantile(q):.6f}")
+    return lines
+
+
+def _flatten(prefix: str, value, out: dict):
+    if isinstance(value, dict):
+        for key, inner in value.items():
+            _flatten(f"{prefix}_{key}", inner, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+    elif isinstance(value, bool):
+        out[prefix] = int(value)
+
+
+def render_prometheus() -> str:
+    lines = _histogram_lines(f"{METRIC_PREFIX}_stage_seconds", "stage", _stages)
+    lines += _histogram_lines(f"{METRIC_PREFIX}_request_seconds", "route", _requests)
+    lines.append(f"# TYPE {METRIC_PREFIX}_responses_total counter")
+    for (route, status), n in sorted(_responses.items()):
+        lines.append(f"{METRIC_PREFIX}_responses_total{{{_labels(route=route, status=status)}}} {n}")
+    for source, fn in _stats_sources.items():
+        try:
+            values = {}
+            _flatten(f"{METRIC_PREFIX}_{source}", fn(), values)
+        except Exception as e:
+            print(f"⚠️ Metrics source '{source}' failed: {e}")
+            continue
+        for metric, value in values.items():
+            metric = "".join(c if c.isalnum() or c == "_" else "_" for c in metric)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def get_latency_summary():
+    """p50/p95/p99 (ms) per stage and route, for quick JSON inspection"""
+    def summarize(table):
+        return {
+            name: {"count": h.count, **{f"p{int(q * 100)}_ms": round(h.quantile(q) * 1000, 1) for q in (0.5, 0.95, 0.99)},
+                   "max_ms": round(h.max * 1000, 1)}
+            for name, h in sorted(table.items())
+        }
+    return {"stages": summarize(_stages), "routes": summarize(_requests)}
+
+
+# --- Event-loop lag ---
+
+async def _monitor_loop_lag():
+    """How late a timer fires = how long something blocked the event loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = loop.time() - start - LOOP_LAG_INTERVAL
+        _histogram(_stages, "event_loop.lag").observe(max(lag, 0.0))
+
+
+def start_loop_monitor() -> asyncio.Task:
+    """Records event-loop lag as the `event_loop.lag` stage (called from main.lifespan)"""
+    return asyncio.create_task(_monitor_loop_lag(), name="loop-lag-monitor")
+
+
+# --- Slow-request sampling profiler ---
+
+class _SlowRequestProfiler:
+    def __init__(self, interval: float, keep_seconds: float = 120.0):
+        self.interval = interval
+        self.samples = deque(maxlen=int(keep_seconds / interval))  # (time, folded stack)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples.append((now, ";".join(reversed(stack))))
+
+    def dump(self, route: str, start: float, elapsed: float, spans):
+        """Folded stacks sampled while the request ran (all threads: concurrent requests show up too)"""
+        window = Counter(stack for t, stack in list(self.samples) if t >= start)
+        if not window:
+            return
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{route.strip('/').replace('/', '_') or 'root'}-{elapsed * 1000:.0f}ms.folded"
+        path = os.path.join(PROFILE_DIR, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# {route} took {elapsed * 1000:.0f} ms; {server_timing(spans, elapsed)}\n")
+            for stack, n in window.most_common():
+                f.write(f"{stack} {n}\n")
+        print(f"🐢 Slow request {route} ({elapsed * 1000:.0f} ms), profile: {path}")
+
+
+_profiler = None
+
+
+def start_profiler():
+    """Starts the sampler if SLOW_REQUEST_MS is set (called from main.lifespan)"""
+    global _profiler
+    if SLOW_REQUEST_MS > 0 and _profiler is None:
+        _profiler = _SlowRequestProfiler(PROFILE_INTERVAL_MS / 1000).start()
+        print(f"🔬 Slow-request profiler on: > {SLOW_REQUEST_MS:.0f} ms, sampling every {PROFILE_INTERVAL_MS:.0f} ms")
+
+
+def stop_profiler():
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+        _profiler = None
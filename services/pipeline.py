@@ -0,0 +1,59 @@
+import asyncio
+
+# Small dependency-graph executor
+# Stages start as soon as their dependencies finish, independent branches run
+# concurrently, and every stage has its own deadline. A stage that times out or fails
+# resolves to None instead of raising, so callers degrade to a fallback branch.
+
+
+class StageGraph:
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self._stages = {}   # name -> (fn, deps, deadline)
+        self._tasks = {}    # name -> asyncio.Task
+
+    def add(self, name: str, fn, deps=(), deadline: float = None):
+        """
+        fn receives the results of `deps` as positional arguments and returns an awaitable.
+        If any dependency resolved to None the stage is skipped (resolves to None).
+        """
+        self._stages[name] = (fn, tuple(deps), deadline)
+        return self
+
+    async def _run(self, name: str):
+        fn, deps, deadline = self._stages[name]
+        inputs = [await self._tasks[dep] for dep in deps]
+        if any(value is None for value in inputs):
+            return None
+        try:
+            return await asyncio.wait_for(fn(*inputs), deadline)
+        except asyncio.TimeoutError:
+            print(f"⏱️ {self.name}: stage '{name}' missed its {deadline}s deadline")
+        except Exception as e:
+            print(f"⚠️ {self.name}: stage '{name}' failed: {e}")
+        return None
+
+    def start(self):
+        """Schedules every stage; dependencies are awaited inside each stage task"""
+        for name in self._stages:
+            self._tasks[name] = asyncio.create_task(self._run(name), name=f"{self.name}:{name}")
+        return self
+
+    async def result(self, name: str):
+        """Waits for one stage (None if it timed out, failed, was skipped or cancelled)"""
+        try:
+            return await asyncio.shield(self._tasks[name])
+        except asyncio.CancelledError:
+            if self._tasks[name].cancelled():
+                return None
+            raise
+
+    def cancel(self, *names: str):
+        """Cancels losing branches that are still running"""
+        for name in names:
+            task = self._tasks.get(name)
+            if task and not task.done():
+                task.cancel()
+
+    def cancel_all(self):
+        self.cancel(*self._tasks)
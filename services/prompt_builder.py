@@ -0,0 +1,200 @@
+import math
+
+# Chat prompt construction
+# avatar_state / hex_color are decided locally from the weather (services.appearance);
+# the model only sends an emotional avatar_state override.
+# The static rules (output format, general logic, place rules) and the rules for one
+# theme are compiled once per theme into a Gemini system instruction, so each request
+# only carries the per-turn context. Weather goes in pre-decoded and compact: WMO codes
+# as words, units stated once, and tomorrow's values picked out of the daily arrays
+# instead of the raw Open-Meteo dicts.
+
+BASE_INSTRUCTION = """You are TenkiGuide, a helpful AI weather assistant. Your personality depends on the user's chosen theme.
+
+STRICT JSON OUTPUT REQUIRED, with these fields:
+1. "english_text": The response in English.
+2. "japanese_text": The response in Japanese.
+3. "summary": A concise summary of the conversation so far, ALWAYS including both the last mentioned location AND the current theme. It must start with the location, e.g., "In Tokyo (friendly theme), the user asked about activities." No coordinates or specific numbers.
+4. "avatar_state" (OPTIONAL): Omit it; the avatar follows the weather automatically. Only include it as one of ["happy", "sad", "surprised"] when the user's emotional context clearly calls for it (e.g., they share good or bad news).
+
+Context format: "Now" is the current weather, "Today"/"Tomorrow" are daily forecasts. Units: °C, km/h, mm, % humidity.
+Other places the user asked about follow under "Also: <place>" with the same lines; use them to compare places.
+
+General Logic:
+- Use the weather context to answer questions about current or future weather.
+- ALWAYS include relevant weather details: temperature, conditions (e.g., sunny, rainy), wind speed, and humidity for the time period asked (current or tomorrow).
+- Do not mention specific times of day (e.g., 7 PM). Use general terms like 'daytime' or 'nighttime' as given in "Now".
+
+PLACE RECOMMENDATION RULES (CRITICAL):
+- If you know specific, real places/landmarks/venues in the location, mention 2-3 of them by name.
+- ONLY give generic suggestions (like "explore the city") if you're uncertain about actual places in that location.
+- NEVER mention specific events, concerts, matches, or performers that you're not certain about.
+- Connect place suggestions to the weather (indoor venues for rain, outdoor spots for sunny weather).
+"""
+
+THEME_RULES = {
+    "travel": """**Travel Theme:**
+- Suggest 2-3 well-known tourist attractions, landmarks, or cultural sites in the city (if you know them).
+- Mention how the weather affects sightseeing (e.g., "great weather for walking tours" or "consider indoor museums").
+- Example: "Consider visiting the Senso-ji Temple or taking a stroll through Ueno Park."
+- If unsure about places: give general travel advice like "explore local neighborhoods".""",
+    "music": """**Music Theme:**
+- Suggest music venues, concert halls, jazz clubs, or famous music districts in the city (if you know them).
+- Connect music activities to weather (outdoor street music vs indoor venues).
+- Example: "You could check out live music at Blue Note Tokyo or explore the music shops in Shibuya."
+- NEVER mention specific concerts or performers.
+- If unsure about places: give general advice like "visit local music venues".""",
+    "fashion": """**Fashion Theme:**
+- Suggest famous fashion districts, shopping streets, markets, or malls in the city (if you know them).
+- Recommend clothing types based on the weather (layers for cold, light fabrics for heat, etc.).
+- Example: "Perfect weather to explore the boutiques in Harajuku or shop at Shibuya 109."
+- If unsure about places: give general advice like "visit local markets".""",
+    "sports": """**Sports Theme:**
+- Suggest stadiums, sports complexes, parks suitable for sports, or outdoor activity areas (if you know them).
+- Recommend indoor vs outdoor activities based on weather.
+- Example: "Great day for a run in Yoyogi Park or visiting the Tokyo Dome area."
+- NEVER mention specific matches or sporting events.
+- If unsure about places: give general advice like "consider indoor sports facilities".""",
+    "friendly": """**Friendly Theme (Default):**
+- Be warm and conversational.
+- Still suggest 2-3 specific places if you know them, weather-appropriate activities, or general exploration tips.
+- Example: "It's a beautiful day! You might enjoy visiting the gardens or grabbing coffee at a local café."
+""",
+}
+DEFAULT_THEME = "friendly"
+
+# Per-turn context (everything else lives in the system instruction)
+CONTEXT_TEMPLATE = """Theme: {theme}
+Location: {city} ({lat:.2f}, {lon:.2f})
+{weather}
+Previous summary: {summary}
+User: {message}"""
+
+# WMO weather interpretation codes (Open-Meteo `weather_code`)
+WMO_CODES = {
+    0: "clear sky", 1: "mainly clear", 2: "partly cloudy", 3: "overcast",
+    45: "fog", 48: "freezing fog",
+    51: "light drizzle", 53: "drizzle", 55: "dense drizzle",
+    56: "light freezing drizzle", 57: "freezing drizzle",
+    61: "light rain", 63: "rain", 65: "heavy rain",
+    66: "light freezing rain", 67: "freezing rain",
+    71: "light snow", 73: "snow", 75: "heavy snow", 77: "snow grains",
+    80: "light rain showers", 81: "rain showers", 82: "violent rain showers",
+    85: "light snow showers", 86: "heavy snow showers",
+    95: "thunderstorm", 96: "thunderstorm with hail", 99: "thunderstorm with heavy hail",
+}
+
+
+def theme_key(theme: str) -> str:
+    """Maps the UI theme ("Travel", "General", ...) to a compiled template"""
+    key = (theme or "").strip().lower()
+    return key if key in THEME_RULES else DEFAULT_THEME
+
+
+def _compile():
+    return {key: f"{BASE_INSTRUCTION}\nTHEME-SPECIFIC BEHAVIOR:\n\n{rules.strip()}\n" for key, rules in THEME_RULES.items()}
+
+
+# Compiled once at import: theme key -> full system instruction
+SYSTEM_INSTRUCTIONS = _compile()
+
+
+def describe_weather_code(code) -> str:
+    if code is None:
+        return "unknown conditions"
+    return WMO_CODES.get(int(code), f"weather code {int(code)}")
+
+
+def _num(value, digits: int = 0):
+    """Rounded for the prompt; None for missing / NaN values"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    value = round(float(value), digits)
+    return int(value) if digits == 0 else value
+
+
+def _daily_line(label: str, daily: dict, i: int) -> str:
+    def pick(field, digits=0):
+        values = daily.get(field) or []
+        return _num(values[i], digits) if i < len(values) else None
+
+    high, low = pick("temperature_2m_max"), pick("temperature_2m_min")
+    if high is None and low is None:
+        return None
+    parts = [f"{label}: {describe_weather_code(pick('weather_code'))}", f"{low}-{high}°C"]
+    rain = pick("precipitation_sum", 1)
+    if rain:
+        parts.append(f"precip {rain}mm")
+    wind = pick("wind_speed_10m_max")
+    if wind is not None:
+        parts.append(f"wind max {wind}km/h")
+    return ", ".join(parts)
+
+
+def compact_weather(weather: dict) -> str:
+    """Open-Meteo {"current": ..., "daily": ...} -> a few short, pre-decoded lines"""
+    current = weather.get("current") or {}
+    daily = weather.get("daily") or {}
+    lines = []
+    if current:
+        parts = [f"Now: {describe_weather_code(current.get('weather_code'))}"]
+        temperature = _num(current.get("temperature_2m"))
+        if temperature is not None:
+            parts.append(f"{temperature}°C")
+        humidity = _num(current.get("relative_humidity_2m"))
+        if humidity is not None:
+            parts.append(f"humidity {humidity}%")
+        wind = _num(current.get("wind_speed_10m"))
+        if wind is not None:
+            parts.append(f"wind {wind}km/h")
+        rain = _num(current.get("precipitation"), 1)
+        if rain:
+            parts.append(f"precip {rain}mm")
+        if current.get("is_day") is not None:
+            parts.append("daytime" if current["is_day"] else "nighttime")
+        lines.append(", ".join(parts))
+    # forecast_days=2: index 0 is today, 1 is tomorrow
+    for label, i in (("Today", 0), ("Tomorrow", 1)):
+        line = _daily_line(label, daily, i)
+        if line:
+            lines.append(line)
+    return "\n".join(lines) if lines else "Weather: unavailable"
+
+
+def build_context(message: str, history_summary: str, city_name: str, lat: float, lon: float,
+                  theme: str, weather: dict, extra_places=()) -> str:
+    """extra_places: [(name, lat, lon, weather)] for other places asked about in the same turn"""
+    lines = [compact_weather(weather or {})]
+    for name, place_lat, place_lon, place_weather in extra_places:
+        lines.append(f"Also: {name} ({place_lat:.2f}, {place_lon:.2f})")
+        lines.append(compact_weather(place_weather or {}))
+    return CONTEXT_TEMPLATE.format(
+        theme=theme or DEFAULT_THEME, city=city_name, lat=lat, lon=lon,
+        weather="\n".join(lines), summary=history_summary, message=message,
+    )
+
+
+# Token accounting (from Gemini's usage_metadata, no extra count_tokens call)
+_usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "last_prompt_tokens": 0}
+
+
+def record_usage(usage_metadata, theme: str):
+    if usage_metadata is None:
+        return
+    prompt_tokens = usage_metadata.prompt_token_count
+    output_tokens = usage_metadata.candidates_token_count
+    _usage["requests"] += 1
+    _usage["prompt_tokens"] += prompt_tokens
+    _usage["output_tokens"] += output_tokens
+    _usage["last_prompt_tokens"] = prompt_tokens
+    print(f"🧮 Gemini tokens ({theme_key(theme)}): prompt {prompt_tokens}, output {output_tokens}")
+
+
+def get_prompt_stats():
+    requests = _usage["requests"]
+    return {
+        **_usage,
+        "avg_prompt_tokens": round(_usage["prompt_tokens"] / requests, 1) if requests else 0.0,
+        "avg_output_tokens": round(_usage["output_tokens"] / requests, 1) if requests else 0.0,
+        "system_instruction_chars": {key: len(text) for key, text in SYSTEM_INSTRUCTIONS.items()},
+    }
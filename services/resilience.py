@@ -0,0 +1,302 @@
+import os
+import time
+import asyncio
+import httpx
+from .metrics import observe
+
+# Upstream admission control
+# Every outbound call (Gemini, Open-Meteo, ArcGIS, ipinfo, Speech-to-Text, Text-to-Speech)
+# goes through `guard(upstream)`, which applies, in order:
+# - a circuit breaker: after BREAKER_FAILURES consecutive failures the upstream is
+#   "open" and calls fail fast for BREAKER_RECOVERY seconds; then one trial call is let
+#   through ("half_open") and its outcome closes or re-opens the circuit,
+# - a token bucket matched to the upstream's quota: a call waits at most RATE_MAX_WAIT
+#   for a token, otherwise it is rejected instead of queueing behind the quota,
+# - a concurrency limit with a bounded queue, for upstreams called straight from the event
+#   loop (the thread-pool backends in services.executor already have one).
+# Only transport errors, timeouts and 5xx / 429 answers count as failures; a 4xx (bad input,
+# "no address at this point") means the upstream is up, so it never opens the circuit.
+# Rejections raise UpstreamUnavailableError, which main turns into 503 + Retry-After.
+# Callers that have a last good value (weather, geocoding) serve it instead.
+#
+# LoadShedMiddleware sheds the expensive routes once too many are in flight, so a spike
+# gets fast 503s instead of every request slowing down together.
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RECOVERY = float(os.getenv("BREAKER_RECOVERY", "15"))
+RATE_MAX_WAIT = float(os.getenv("RATE_MAX_WAIT", "0.5"))
+
+UPSTREAMS = {
+    # name: requests/second and burst (0 = no rate limit), concurrency / queue (None = pooled elsewhere)
+    "gemini": {"rate": float(os.getenv("GEMINI_RPS", "60")), "burst": 60, "concurrency": None},
+    # Open-Meteo free tier: 600/minute
+    "open_meteo": {"rate": float(os.getenv("OPEN_METEO_RPS", "10")), "burst": 30,
+                   "concurrency": 20, "max_queue": 100},
+    "arcgis": {"rate": float(os.getenv("ARCGIS_RPS", "50")), "burst": 50, "concurrency": None},
+    "ipinfo": {"rate": float(os.getenv("IPINFO_RPS", "5")), "burst": 20, "concurrency": None},
+    "stt": {"rate": float(os.getenv("STT_RPS", "15")), "burst": 15, "concurrency": None},
+    "tts": {"rate": float(os.getenv("TTS_RPS", "15")), "burst": 30, "concurrency": None},
+}
+
+# Routes that hold upstream work; everything else (health, metrics, caches, CORS preflights) is never shed
+SHED_PATHS = {"/chat", "/chat/stream", "/weather/batch", "/location", "/transcribe", "/transcribe/stream", "/tts",
+              "/tts/stream"}
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", "256"))
+SHED_RETRY_AFTER = 1
+
+
+class UpstreamUnavailableError(RuntimeError):
+    """A call refused before reaching the upstream; callers should shed load (503 + Retry-After)"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float = 2.0):
+        super().__init__(f"{upstream} backend is {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = max(1, round(retry_after))
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    pass
+
+
+class RateLimitedError(UpstreamUnavailableError):
+    pass
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def reserve(self, max_wait: float):
+        """Takes a token; returns seconds to wait for it, or None if that exceeds max_wait"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        wait = (1.0 - self.tokens) / self.rate if self.tokens < 1.0 else 0.0
+        if wait > max_wait:
+            return None
+        self.tokens -= 1.0  # May go negative: a reservation for the next refill
+        return wait
+
+
+class CircuitBreaker:
+    __slots__ = ("failures", "state", "opened_at", "trial_running")
+
+    def __init__(self):
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def retry_after(self) -> float:
+        return max(self.opened_at + BREAKER_RECOVERY - time.monotonic(), 1.0)
+
+    def allow(self) -> bool:
+        """Whether a call may go through now (the first one after the recovery time is the trial)"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_RECOVERY:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record(self, ok: bool):
+        """Returns True if this outcome opened the circuit"""
+        self.trial_running = False
+        if ok:
+            self.failures = 0
+            self.state = "closed"
+            return False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= BREAKER_FAILURES:
+            opened = self.state != "open"
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            return opened
+        return False
+
+
+class _Upstream:
+    def __init__(self, name: str, cfg: dict):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.bucket = TokenBucket(cfg["rate"], cfg["burst"]) if cfg["rate"] > 0 else None
+        self.concurrency = cfg["concurrency"]
+        self.capacity = (cfg["concurrency"] + cfg.get("max_queue", 0)) if cfg["concurrency"] else None
+        self.semaphore = None  # Created inside the running loop
+        self.pending = 0
+        self.stats = {"calls": 0, "failures": 0, "opened": 0, "rejected_open": 0, "rate_limited": 0,
+                      "rate_delayed": 0, "shed": 0}
+
+
+_upstreams = {name: _Upstream(name, cfg) for name, cfg in UPSTREAMS.items()}
+
+
+def _status_code(exc: BaseException):
+    """HTTP status behind an httpx / requests HTTP error or a google.api_core error, if any"""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(exc, "code", None)   # GoogleAPICallError.code is the HTTP status
+    return status if isinstance(status, int) else None
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Whether an error says the upstream is down or overloaded (vs. a rejected request)"""
+    if isinstance(exc, UpstreamUnavailableError):
+        return False
+    if isinstance(exc, (OSError, asyncio.TimeoutError, httpx.TransportError)):
+        return True   # Connection errors and timeouts (requests' errors are OSErrors too)
+    status = _status_code(exc)
+    if status is not None:
+        return status >= 500 or status == 429
+    cause = getattr(exc, "cause", None)   # api_core RetryError: the last retried error
+    return isinstance(cause, BaseException) and is_upstream_failure(cause)
+
+
+class _Guard:
+    """async with guard("open_meteo"): ... (one admitted upstream call)"""
+    __slots__ = ("up", "admitted", "reserved", "acquired", "is_trial")
+
+    def __init__(self, up: _Upstream):
+        self.up = up
+        self.admitted = False
+        self.reserved = False
+        self.acquired = False
+        self.is_trial = False
+
+    async def __aenter__(self):
+        up = self.up
+        if not up.breaker.allow():
+            up.stats["rejected_open"] += 1
+            raise CircuitOpenError(up.name, "unavailable (circuit open)", up.breaker.retry_after())
+        self.is_trial = up.breaker.state == "half_open"
+        try:
+            # Saturation first, so a shed call doesn't spend (or wait for) a rate-limit token
+            if up.capacity is not None:
+                if up.pending >= up.capacity:
+                    up.stats["shed"] += 1
+                    raise UpstreamUnavailableError(up.name, "saturated")
+                up.pending += 1
+                self.admitted = True
+            if up.bucket is not None:
+                wait = up.bucket.reserve(RATE_MAX_WAIT)
+                if wait is None:
+                    up.stats["rate_limited"] += 1
+                    raise RateLimitedError(up.name, "rate limited", (1.0 - up.bucket.tokens) / up.bucket.rate)
+                self.reserved = True
+                if wait:
+                    up.stats["rate_delayed"] += 1
+                    observe(f"{up.name}.rate_wait", wait)
+                    await asyncio.sleep(wait)
+            if up.capacity is not None:
+                if up.semaphore is None:
+                    up.semaphore = asyncio.Semaphore(up.concurrency)
+                await up.semaphore.acquire()
+                self.acquired = True
+        except BaseException:
+            self._release()
+            if self.reserved:
+                up.bucket.tokens += 1.0   # Never sent (cancelled while waiting): give the token back
+            if self.is_trial:
+                up.breaker.trial_running = False
+            raise
+        up.stats["calls"] += 1
+        return self
+
+    def _release(self):
+        if self.acquired:
+            self.up.semaphore.release()
+        if self.admitted:
+            self.up.pending -= 1
+
+    def _record_success(self):
+        # A call admitted before the circuit opened doesn't close it: only the trial does
+        if self.is_trial or self.up.breaker.state == "closed":
+            self.up.breaker.record(True)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._release()
+        up = self.up
+        if exc_type is None:
+            self._record_success()
+        elif not issubclass(exc_type, Exception) or issubclass(exc_type, UpstreamUnavailableError):
+            if self.is_trial:
+                # Cancelled / abandoned trial: let the next call try instead
+                up.breaker.trial_running = False
+        elif not is_upstream_failure(exc):
+            self._record_success()   # Answered (a 4xx, bad input): the upstream is up
+        else:
+            up.stats["failures"] += 1
+            if up.breaker.record(False):
+                up.stats["opened"] += 1
+                print(f"⛔ {up.name} circuit open after {up.breaker.failures} failures "
+                      f"({exc_type.__name__}); retrying in {BREAKER_RECOVERY:.0f} s")
+        return False
+
+
+def guard(upstream: str) -> _Guard:
+    return _Guard(_upstreams[upstream])
+
+
+def is_available(upstream: str) -> bool:
+    """False while the upstream's circuit is open (callers can skip straight to a fallback)"""
+    breaker = _upstreams[upstream].breaker
+    return breaker.state != "open" or time.monotonic() - breaker.opened_at >= BREAKER_RECOVERY
+
+
+_inflight_requests = 0
+_shed_requests = 0
+
+
+class LoadShedMiddleware:
+    """
+    503 + Retry-After for SHED_PATHS beyond MAX_INFLIGHT_REQUESTS concurrent requests
+    (a WebSocket is refused at the handshake instead)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _inflight_requests, _shed_requests
+        if scope["type"] not in ("http", "websocket") or scope.get("path") not in SHED_PATHS:
+            return await self.app(scope, receive, send)
+        if scope.get("method") == "OPTIONS":   # CORS preflight: cheap, and the browser needs it
+            return await self.app(scope, receive, send)
+        if _inflight_requests >= MAX_INFLIGHT_REQUESTS:
+            _shed_requests += 1
+            if scope["type"] == "websocket":
+                return await send({"type": "websocket.close", "code": 1013})  # Try again later
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"retry-after", str(SHED_RETRY_AFTER).encode())]})
+            return await send({"type": "http.response.body", "body": b'{"detail":"Server is overloaded"}'})
+        _inflight_requests += 1
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            _inflight_requests -= 1
+
+
+def get_resilience_stats():
+    """Per-upstream breaker state and admission counters, plus route-level shedding"""
+    upstreams = {}
+    for name, up in _upstreams.items():
+        upstreams[name] = {
+            "state": up.breaker.state,
+            "open": int(up.breaker.state != "closed"),
+            "consecutive_failures": up.breaker.failures,
+            **up.stats,
+            "tokens": round(up.bucket.tokens, 2) if up.bucket else None,
+            "pending": up.pending,
+        }
+    return {"upstreams": upstreams, "inflight_requests": _inflight_requests, "shed_requests": _shed_requests,
+            "max_inflight_requests": MAX_INFLIGHT_REQUESTS}
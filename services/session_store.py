@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Conversation session store
+# Keyed by the client's ChatRequest.session_id, a session remembers where the
+# conversation is (resolved coordinates and name), its theme, the device's grid cell and
+# the last weather snapshot, so follow-up turns skip location resolution (and, on another
+# worker, the weather fetch) instead of re-geocoding the place parsed out of chat_summary.
+# A loaded session the turn can't use (another place named, device moved) is counted as
+# "bypassed", not as a hit.
+#
+# SESSION_STORE selects the backend:
+# - "memory" (default): per-process LRU dict, SESSION_TTL / SESSION_MAX_ENTRIES bounded
+# - "sqlite": a WAL-mode SQLite file (SESSION_DB_PATH), so sessions survive restarts and
+#   are shared by every uvicorn worker on the host
+# - "off": no sessions (every turn resolves its location as before)
+# Async code uses `await store.load(id)` / `await store.save(session)`; the SQLite store runs
+# them on its own worker thread, so disk I/O and lock waits never stall the event loop.
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(tempfile.gettempdir(), "tenki_sessions.db"))
+SQLITE_PRUNE_EVERY = 200  # writes between expiry / size sweeps
+
+
+class Session:
+    """
+    Where a conversation is; weather_expires_at says until when the snapshot is current.
+    device_cell is the grid cell of the client's GPS on the last turn (None without GPS).
+    """
+    __slots__ = ("session_id", "lat", "lon", "location_name", "theme", "weather", "weather_expires_at",
+                 "device_cell", "updated_at")
+
+    def __init__(self, session_id: str, lat: float, lon: float, location_name: str, theme: str,
+                 weather: dict = None, weather_expires_at: float = 0.0, device_cell: tuple = None,
+                 updated_at: float = None):
+        self.session_id = session_id
+        self.lat = lat
+        self.lon = lon
+        self.location_name = location_name
+        self.theme = theme
+        self.weather = weather
+        self.weather_expires_at = weather_expires_at
+        self.device_cell = device_cell
+        self.updated_at = updated_at if updated_at is not None else time.time()
+
+
+class MemorySessionStore:
+    name = "memory"
+
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()   # session_id -> Session, least recently updated first
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "expired": 0, "evictions": 0}
+
+    def get(self, session_id: str):
+        session = self._sessions.get(session_id)
+        if session is None:
+            self.stats["misses"] += 1
+            return None
+        if session.updated_at + self.ttl <= time.time():
+            del self._sessions[session_id]
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        return session
+
+    def put(self, session: Session):
+        session.updated_at = time.time()
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        self.stats["stores"] += 1
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def load(self, session_id: str):
+        return self.get(session_id)
+
+    async def save(self, session: Session):
+        self.put(session)
+
+    def record_use(self, used: bool):
+        """Whether the session returned by get() was used for the turn (hit) or bypassed"""
+        self.stats["hits" if used else "bypassed"] += 1
+
+    def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Same interface, one row per session; expired rows and overflow are swept periodically"""
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "expired": 0, "evictions": 0}
+        self._writes = 0
+        # Row count for the stats endpoints: tracked per write, re-counted on every prune
+        # (which also picks up rows written by other workers)
+        self._entries = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions-sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, lat REAL, lon REAL, "
+            "location_name TEXT, theme TEXT, weather TEXT, weather_expires_at REAL, updated_at REAL, "
+            "device_lat REAL, device_lon REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sessions)")}
+        for column in ("device_lat", "device_lon"):
+            if column not in columns:   # Database from before the device cell was stored
+                self._db.execute(f"ALTER TABLE sessions ADD COLUMN {column} REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._entries = self._count()
+
+    def _count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    async def load(self, session_id: str):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, session_id)
+
+    async def save(self, session: Session):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.put, session)
+
+    def record_use(self, used: bool):
+        """Whether the session returned by get() was used for the turn (hit) or bypassed"""
+        self.stats["hits" if used else "bypassed"] += 1
+
+    def get(self, session_id: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT lat, lon, location_name, theme, weather, weather_expires_at, updated_at, device_lat, "
+                "device_lon FROM sessions WHERE session_id = ?", (session_id,),
+            ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        lat, lon, location_name, theme, weather, weather_expires_at, updated_at, device_lat, device_lon = row
+        if updated_at + self.ttl <= time.time():
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        return Session(session_id, lat, lon, location_name, theme, json.loads(weather) if weather else None,
+                       weather_expires_at, (device_lat, device_lon) if device_lat is not None else None, updated_at)
+
+    def put(self, session: Session):
+        session.updated_at = time.time()
+        weather = json.dumps(session.weather, separators=(",", ":")) if session.weather else None
+        with self._lock:
+            device_lat, device_lon = session.device_cell or (None, None)
+            new = self._db.execute("SELECT 1 FROM sessions WHERE session_id = ?",
+                                   (session.session_id,)).fetchone() is None
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, lat, lon, location_name, theme, weather, "
+                "weather_expires_at, updated_at, device_lat, device_lon) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session.session_id, session.lat, session.lon, session.location_name, session.theme,
+                 weather, session.weather_expires_at, session.updated_at, device_lat, device_lon),
+            )
+            self.stats["stores"] += 1
+            self._entries += new
+            self._writes += 1
+            if self._writes % SQLITE_PRUNE_EVERY == 0:
+                self._prune()
+
+    def _prune(self):
+        expired = self._db.execute("DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.ttl,)).rowcount
+        self._entries = self._count()
+        overflow = self._entries - self.max_entries
+        if overflow > 0:
+            self._db.execute("DELETE FROM sessions WHERE session_id IN "
+                             "(SELECT session_id FROM sessions ORDER BY updated_at LIMIT ?)", (overflow,))
+            self.stats["evictions"] += overflow
+            self._entries -= overflow
+        self.stats["expired"] += max(expired, 0)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._entries -= self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount
+
+    def __len__(self):
+        return self._entries
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """The configured store (built on first use), or None with SESSION_STORE=off"""
+    global _store
+    if _store is None and SESSION_STORE != "off":
+        with _store_lock:
+            if _store is None:
+                if SESSION_STORE == "sqlite":
+                    _store = SQLiteSessionStore()
+                    print(f"💾 Session store: SQLite ({SESSION_DB_PATH})")
+                else:
+                    _store = MemorySessionStore()
+    return _store
+
+
+def get_session_stats():
+    store = _store   # Not built here: stats must not open the database on the event loop
+    if store is None:
+        return {"backend": "off" if SESSION_STORE == "off" else SESSION_STORE, "entries": 0}
+    lookups = store.stats["hits"] + store.stats["misses"] + store.stats["bypassed"]
+    return {
+        "backend": store.name,
+        **store.stats,
+        "hit_ratio": round(store.stats["hits"] / lookups, 4) if lookups else 0.0,
+        "entries": len(store),
+        "ttl_seconds": store.ttl,
+        "max_entries": store.max_entries,
+    }
@@ -0,0 +1,200 @@
+import os
+import re
+import sys
+import time
+import asyncio
+import subprocess
+from collections import defaultdict
+
+# Startup phases, liveness and readiness
+# The process binds its port right away: the heavy SDK imports, Google client construction,
+# lookup tables and ffmpeg workers are built by a background warm-up task once the server
+# is listening (and lazily on first use if a request gets there first). /healthz only says
+# the process is alive; /readyz says whether the warm-up has finished, so a load balancer
+# can hold traffic back without the platform restarting a slow-starting instance.
+# Async code reaches the lazily built components through `warmed(name, loader)`, which
+# waits for the warm-up step instead of blocking the event loop on the loader's lock.
+#
+# Profile the cold start:
+#   python -m services.startup profile [--top 25] [--port 8011]
+# prints the slowest imports of `import main` (python -X importtime), per-package totals,
+# and the time until a fresh server answers /healthz and /readyz.
+
+STARTING, WARMING, READY, DEGRADED = "starting", "warming", "ready", "degraded"
+
+_state = {"phase": STARTING, "started_at": time.time(), "ready_at": None}
+_components = {}   # name -> {"status": ..., "seconds": ..., "error": ...}
+_tasks = {}        # name -> the step's task (warm-up, or a later retry)
+_retry_at = {}     # name -> monotonic time before which a failed step is not retried
+
+# A component whose warm-up failed is rebuilt on demand, at most this often
+WARM_UP_RETRY_INTERVAL = float(os.getenv("WARM_UP_RETRY_INTERVAL", "30"))
+
+
+async def _run_step(name: str, step):
+    """Runs one warm-up step (async, or sync in a worker thread) and records how it went"""
+    _components[name] = {"status": WARMING}
+    start = time.perf_counter()
+    try:
+        if asyncio.iscoroutinefunction(step):
+            await step()
+        else:
+            await asyncio.to_thread(step)
+        _components[name] = {"status": READY, "seconds": round(time.perf_counter() - start, 3)}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # The component still initializes lazily on first use, so the app stays up
+        _components[name] = {"status": DEGRADED, "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+        _retry_at[name] = time.monotonic() + WARM_UP_RETRY_INTERVAL
+        print(f"⚠️ Warm-up of {name} failed: {e}")
+
+
+async def _warm_up(tasks: list):
+    _state["phase"] = WARMING
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    failed = [name for name, c in _components.items() if c["status"] == DEGRADED]
+    _state["phase"] = DEGRADED if failed else READY
+    _state["ready_at"] = time.time()
+    print(f"🔥 Warm-up finished in {(time.perf_counter() - start) * 1000:.0f} ms"
+          + (f" (degraded: {', '.join(failed)})" if failed else ""))
+
+
+def start_warm_up(steps: dict) -> asyncio.Task:
+    """
+    Starts the background warm-up (called from main.lifespan). `steps` maps a component
+    name to a callable; coroutine functions are awaited, plain functions run in a thread.
+    All steps run concurrently.
+    """
+    for name, step in steps.items():
+        _components[name] = {"status": STARTING}
+        _tasks[name] = asyncio.create_task(_run_step(name, step), name=f"warm-up:{name}")
+    return asyncio.create_task(_warm_up(list(_tasks.values())), name="warm-up")
+
+
+async def warmed(name: str, load):
+    """
+    `load()` (a lazy loader such as get_gazetteer) from async code: waits for the component's
+    warm-up step if it is still running; if it never ran or failed, builds it in a thread
+    (one build at a time, failures retried every WARM_UP_RETRY_INTERVAL at most).
+    """
+    if _components.get(name, {}).get("status") == READY:
+        return load()
+    task = _tasks.get(name)
+    if task is None or (task.done() and time.monotonic() >= _retry_at.get(name, 0.0)):
+        task = _tasks[name] = asyncio.create_task(_run_step(name, load), name=f"warm-up:{name}")
+    await asyncio.shield(task)
+    component = _components[name]
+    if component["status"] != READY:
+        raise RuntimeError(f"{name} is unavailable: {component.get('error')}")
+    return load()
+
+
+def is_live() -> bool:
+    return True
+
+
+def readiness():
+    """(ready, details); degraded still counts as ready, failed parts load lazily"""
+    now = time.time()
+    details = {
+        "status": _state["phase"],
+        "uptime_seconds": round(now - _state["started_at"], 3),
+        "warm_up_seconds": round(_state["ready_at"] - _state["started_at"], 3) if _state["ready_at"] else None,
+        "components": dict(_components),
+    }
+    return _state["phase"] in (READY, DEGRADED), details
+
+
+# --- Cold-start profile ---
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(module: str = "main"):
+    """[(cumulative_us, self_us, depth, module)] from `python -X importtime -c "import <module>"`"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, "PYTHONPATH": os.getcwd()},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            rows.append((int(match.group(2)), int(match.group(1)), len(match.group(3)) // 2, match.group(4)))
+    return rows
+
+
+def _report_imports(rows, top: int):
+    total = next((cumulative for cumulative, _, depth, name in rows if depth == 0 and name == "main"), 0)
+    print(f"\n⏱️ import main: {total / 1000:.0f} ms")
+    print(f"\nTop {top} imports (cumulative, including their own imports):")
+    for cumulative, own, depth, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {own / 1000:7.1f} ms self  {name}")
+
+    packages = defaultdict(int)
+    for _, own, _, name in rows:
+        parts = name.split(".")
+        packages[".".join(parts[:2]) if parts[0] == "google" else parts[0]] += own
+    print("\nSelf time per top-level package:")
+    for package, own in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {own / 1000:8.1f} ms  {package}")
+
+
+def _probe_server(port: int, timeout: float = 120.0):
+    """Starts uvicorn and times the first /healthz and the first 200 from /readyz"""
+    import httpx
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    live_at = ready_at = None
+    details = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=2) as client:
+            while time.perf_counter() - start < timeout and ready_at is None:
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with {server.returncode}")
+                try:
+                    if live_at is None and client.get("/healthz").status_code == 200:
+                        live_at = time.perf_counter() - start
+                    if live_at is not None:
+                        response = client.get("/readyz")
+                        if response.status_code == 200:
+                            ready_at = time.perf_counter() - start
+                            details = response.json()
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"\n🚦 Fresh server on :{port}")
+    print(f"  live  (/healthz 200): {live_at * 1000:.0f} ms" if live_at else "  live: not reached")
+    print(f"  ready (/readyz 200):  {ready_at * 1000:.0f} ms" if ready_at else "  ready: not reached")
+    if details:
+        for name, component in details["components"].items():
+            seconds = component.get("seconds")
+            print(f"    {name:12} {component['status']:9} {seconds * 1000 if seconds is not None else 0:7.0f} ms"
+                  + (f"  ({component['error']})" if component.get("error") else ""))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cold-start profile of the backend")
+    parser.add_argument("command", choices=["profile"])
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--no-server", action="store_true", help="Only profile imports")
+    args = parser.parse_args()
+
+    _report_imports(profile_imports("main"), args.top)
+    if not args.no_server:
+        _probe_server(args.port)
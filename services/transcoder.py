@@ -0,0 +1,131 @@
+import os
+import shutil
+import asyncio
+
+# Audio transcoding engine
+# Browser uploads (WebM/Opus, WAV, ...) are piped through ffmpeg's stdin/stdout straight
+# into raw 16 kHz mono LINEAR16 (s16le), which is what Google STT takes, so there is no
+# WAV container round-trip and no copy through pydub. ffmpeg runs as its own process,
+# so the decoding CPU never touches the event loop.
+#
+# Process start-up (fork + exec + codec init) is taken off the request path by keeping a
+# few ffmpeg workers pre-spawned and waiting on stdin. Each worker handles one stream (an
+# ffmpeg process can't be rewound) and a replacement is spawned in the background.
+#
+# Whole uploads are read through ffmpeg's cache: protocol so the input is seekable (MP4 /
+# M4A from Safari and iOS MediaRecorder keep the moov atom at the end); live streams are
+# read straight from the pipe, so decoding starts with the first chunk.
+
+SAMPLE_RATE = 16000
+POOL_SIZE = int(os.getenv("TRANSCODE_POOL_SIZE", "2"))
+MAX_CONCURRENT = int(os.getenv("TRANSCODE_MAX_CONCURRENT", "4"))
+TRANSCODE_TIMEOUT = float(os.getenv("TRANSCODE_TIMEOUT", "20"))
+
+# On Windows development, use local ffmpeg.exe if available
+# On Linux (Render/Production), it uses system-installed ffmpeg
+FFMPEG_BIN = os.path.abspath("ffmpeg.exe") if os.path.exists("ffmpeg.exe") else (shutil.which("ffmpeg") or "ffmpeg")
+
+FFMPEG_INPUTS = {
+    "file": ["-read_ahead_limit", "-1", "-i", "cache:pipe:0"],
+    "stream": ["-i", "pipe:0"],
+}
+FFMPEG_OUTPUT = ["-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+FFMPEG_ARGS = ["-hide_banner", "-loglevel", "error", *FFMPEG_INPUTS["file"], *FFMPEG_OUTPUT]
+FFMPEG_STREAM_ARGS = ["-hide_banner", "-loglevel", "error", *FFMPEG_INPUTS["stream"], *FFMPEG_OUTPUT]
+_ARGS = {"file": FFMPEG_ARGS, "stream": FFMPEG_STREAM_ARGS}
+
+_idle = {"file": [], "stream": []}   # pre-spawned ffmpeg processes waiting for input, per input mode
+_refills = set()    # background spawn tasks
+_semaphore = None
+_stats = {"transcodes": 0, "prespawned_used": 0, "cold_spawns": 0, "errors": 0}
+
+
+class TranscodeError(RuntimeError):
+    pass
+
+
+async def _spawn(mode: str):
+    return await asyncio.create_subprocess_exec(
+        FFMPEG_BIN, *_ARGS[mode],
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+
+async def _refill(mode: str):
+    try:
+        while len(_idle[mode]) < POOL_SIZE:
+            _idle[mode].append(await _spawn(mode))
+    except Exception as e:
+        print(f"⚠️ Could not pre-spawn ffmpeg: {e}")
+
+
+def _schedule_refill(mode: str):
+    task = asyncio.create_task(_refill(mode))
+    _refills.add(task)
+    task.add_done_callback(_refills.discard)
+
+
+async def acquire_ffmpeg(mode: str = "file"):
+    """
+    A ready ffmpeg process (pre-spawned if available) for a whole file ("file") or a live
+    stream ("stream"); the pool refills in the background
+    """
+    idle = _idle[mode]
+    while idle:
+        proc = idle.pop()
+        if proc.returncode is None:
+            _stats["prespawned_used"] += 1
+            _schedule_refill(mode)
+            return proc
+    _stats["cold_spawns"] += 1
+    proc = await _spawn(mode)
+    _schedule_refill(mode)
+    return proc
+
+
+async def start_transcoder():
+    """Pre-spawns the worker pool (startup warm-up; a request may have created the semaphore already)"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    for mode in _idle:
+        await _refill(mode)
+    print(f"🎛️ Transcoder ready: {sum(map(len, _idle.values()))} ffmpeg workers pre-spawned ({FFMPEG_BIN})")
+
+
+async def stop_transcoder():
+    for task in list(_refills):
+        task.cancel()
+    for idle in _idle.values():
+        while idle:
+            proc = idle.pop()
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+
+async def to_linear16(data: bytes) -> bytes:
+    """Any ffmpeg-readable audio -> raw 16 kHz mono 16-bit PCM"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+    async with _semaphore:
+        proc = await acquire_ffmpeg("file")
+        try:
+            pcm, err = await asyncio.wait_for(proc.communicate(data), TRANSCODE_TIMEOUT)
+        except BaseException:
+            proc.kill()
+            await proc.wait()
+            _stats["errors"] += 1
+            raise
+    if proc.returncode != 0:
+        _stats["errors"] += 1
+        raise TranscodeError(f"ffmpeg exited with {proc.returncode}: {err.decode(errors='replace').strip()}")
+    _stats["transcodes"] += 1
+    return pcm
+
+
+def get_transcoder_stats():
+    return {**_stats, "idle_workers": sum(map(len, _idle.values()))}
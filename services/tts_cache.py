@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+# Content-addressed TTS audio cache
+# Synthesized audio is stored on disk under sha256(text, language, voice, audio config).
+# Entries are evicted least-recently-used once the directory exceeds TTS_CACHE_MAX_BYTES;
+# file mtimes record recency so the LRU order survives restarts. Writes go to a temp
+# file in the same directory and are renamed into place, so readers never see a
+# partial file. Hits are returned as paths and served straight from disk. All disk work
+# (the startup directory scan, mtime updates, unlinks) runs in worker threads.
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tenki_tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+_index = None          # key -> size in bytes, least recently used first
+_index_task = None     # the one directory scan building it
+_total_bytes = 0
+_inflight = {}         # key -> asyncio.Task (concurrent misses synthesize once)
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+
+def cache_key(text: str, language_code: str, voice_name: str, audio_config: dict) -> str:
+    payload = json.dumps(
+        {"text": text, "language_code": language_code, "voice": voice_name, "audio_config": audio_config},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(TTS_CACHE_DIR, key[:2], f"{key}.mp3")
+
+
+def _scan():
+    """Cache directory entries, oldest mtime first (blocking)"""
+    entries = []
+    os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+    for root, _dirs, files in os.walk(TTS_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(".tmp"):
+                os.unlink(path)  # Leftover from an interrupted write
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+    entries.sort()
+    return entries
+
+
+async def load_index():
+    """The in-memory index, built once by scanning the directory in a thread (also the startup warm-up)"""
+    global _index, _index_task, _total_bytes
+    if _index is None:
+        if _index_task is None:
+            _index_task = asyncio.ensure_future(asyncio.to_thread(_scan))
+        try:
+            entries = await asyncio.shield(_index_task)
+        except BaseException:
+            if _index_task.done():
+                _index_task = None  # Failed scan: the next caller tries again
+            raise
+        if _index is None:
+            _index = OrderedDict((key, size) for _mtime, key, size in entries)
+            _total_bytes = sum(_index.values())
+    return _index
+
+
+def _unlink_all(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+async def _evict():
+    global _total_bytes
+    index = await load_index()
+    # Never evict the newest entry: it is the one about to be served
+    evicted = []
+    while _total_bytes > TTS_CACHE_MAX_BYTES and len(index) > 1:
+        key, size = index.popitem(last=False)
+        _total_bytes -= size
+        _stats["evictions"] += 1
+        evicted.append(_path(key))
+    if evicted:
+        await asyncio.to_thread(_unlink_all, evicted)
+
+
+def _write(key: str, audio: bytes) -> str:
+    """Atomic write: temp file in the same directory, then rename"""
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+async def lookup(key: str):
+    """Path of a cached entry (marked as recently used), or None"""
+    index = await load_index()
+    if key not in index:
+        return None
+    path = _path(key)
+    try:
+        await asyncio.to_thread(os.utime, path)
+    except FileNotFoundError:
+        # Removed behind our back
+        forget(key)
+        return None
+    if key in index:
+        index.move_to_end(key)
+    return path
+
+
+def forget(key: str):
+    """Drops an entry whose file has disappeared (e.g. evicted by another worker)"""
+    global _total_bytes
+    if _index is not None and key in _index:
+        _total_bytes -= _index.pop(key)
+
+
+async def _store(key: str, audio: bytes) -> str:
+    global _total_bytes
+    path = await asyncio.to_thread(_write, key, audio)
+    index = await load_index()
+    _total_bytes += len(audio) - index.pop(key, 0)
+    index[key] = len(audio)
+    await _evict()
+    return path
+
+
+async def get_or_synthesize(key: str, synthesize) -> str:
+    """
+    Returns the cached file path for key, calling `await synthesize()` (-> bytes) on a miss.
+    Concurrent misses for the same key share one synthesis.
+    """
+    path = await lookup(key)
+    if path:
+        _stats["hits"] += 1
+        return path
+
+    task = _inflight.get(key)
+    if task is not None:
+        _stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    _stats["misses"] += 1
+
+    async def fill():
+        return await _store(key, await synthesize())
+
+    task = asyncio.ensure_future(fill())
+    _inflight[key] = task
+    task.add_done_callback(lambda t: _on_filled(key, t))
+    return await asyncio.shield(task)
+
+
+def _on_filled(key, task):
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # Mark as retrieved even if every waiter went away
+
+
+def get_tts_cache_stats():
+    index = _index or {}  # Not scanned yet: nothing counted
+    lookups = _stats["hits"] + _stats["misses"] + _stats["coalesced"]
+    return {
+        **_stats,
+        "hit_ratio": round((_stats["hits"] + _stats["coalesced"]) / lookups, 4) if lookups else 0.0,
+        "entries": len(index),
+        "bytes": _total_bytes,
+        "max_bytes": TTS_CACHE_MAX_BYTES,
+        "dir": TTS_CACHE_DIR,
+    }
+
+
+async def warm_from_file(path: str):
+    """Pre-synthesizes phrases listed one per line as `<lang>\\t<text>` (lang: en / ja)"""
+    from .audio_service import generate_tts_cached
+
+    count = 0
+    start = time.perf_counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            lang, sep, text = line.rstrip("\n").partition("\t")
+            if not sep or not text.strip():
+                continue
+            await generate_tts_cached(text, lang)
+            count += 1
+    print(f"✅ Warmed {count} phrases in {time.perf_counter() - start:.1f}s: {get_tts_cache_stats()}")
+
+
+if __name__ == "__main__":
+    # python -m services.tts_cache warm phrases.tsv
+    # python -m services.tts_cache stats
+    if len(sys.argv) > 2 and sys.argv[1] == "warm":
+        asyncio.run(warm_from_file(sys.argv[2]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "stats":
+        asyncio.run(load_index())
+        print(get_tts_cache_stats())
+    else:
+        print("Usage: python -m services.tts_cache warm <phrases.tsv> | stats")
@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+from .weather_service import snap_to_grid, get_current_weather
+from .location_service import get_location_name, get_coordinates_from_city
+from .llm_service import ping_gemini
+from .http_client import ping_http_pools
+from .metrics import span
+
+# Idle warm-up scheduler
+# Replaces the old fixed keep-alive loop (a full chat generation every 10 minutes, traffic
+# or not). Nothing runs while users are active: their own requests keep every pool and
+# cache warm. After WARMUP_IDLE_SECONDS without a user request, one warm-up round runs:
+# - the cheapest probes: a HEAD on each open connection pool and a 1-token Gemini call,
+# - weather and geocoding prefetch for the most requested places (the weather cache only
+#   refetches cells whose quarter-hour has expired, geocoding hits the gazetteer or the
+#   ArcGIS answer cache).
+# While the idle period lasts, rounds are spaced out exponentially up to
+# WARMUP_MAX_INTERVAL; the next user request resets the schedule.
+
+WARMUP_IDLE_SECONDS = float(os.getenv("WARMUP_IDLE_SECONDS", "240"))
+WARMUP_MAX_INTERVAL = float(os.getenv("WARMUP_MAX_INTERVAL", "1800"))
+WARMUP_CHECK_INTERVAL = min(15.0, WARMUP_IDLE_SECONDS / 4)
+WARMUP_TOP_LOCATIONS = int(os.getenv("WARMUP_TOP_LOCATIONS", "5"))
+POPULARITY_HALF_LIFE = 6 * 3600.0   # a request counts half as much after 6 hours
+POPULARITY_MAX_TRACKED = 256
+
+# Probe and monitoring traffic doesn't count as user activity
+PASSIVE_PATHS = {"/", "/healthz", "/readyz", "/keepalive", "/metrics", "/metrics/latency", "/docs", "/redoc",
+                 "/openapi.json", "/weather/cache", "/tts/cache", "/chat/cache", "/prompt/stats", "/warmup",
+                 "/ipgeo/stats", "/chat/sessions", "/resilience"}
+
+_last_activity = time.time()
+_active_requests = 0
+_popular = {}   # grid cell -> [score, scored_at, lat, lon, name]
+_stats = {"rounds": 0, "skipped_active": 0, "weather_prefetched": 0, "geocodes_prefetched": 0,
+          "probe_errors": 0, "last_round_at": None, "last_round_ms": None, "last_probes": {}}
+
+
+def record_activity():
+    global _last_activity
+    _last_activity = time.time()
+
+
+class ActivityMiddleware:
+    """Marks user traffic (HTTP and WebSocket) so warm-ups only happen when idle"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _active_requests
+        if scope["type"] not in ("http", "websocket") or scope.get("path") in PASSIVE_PATHS:
+            return await self.app(scope, receive, send)
+        # A long request (streaming chat, live transcription) is activity until it ends
+        _active_requests += 1
+        record_activity()
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            _active_requests -= 1
+            record_activity()
+
+
+def _decayed(score: float, scored_at: float, now: float) -> float:
+    return score * 0.5 ** ((now - scored_at) / POPULARITY_HALF_LIFE)
+
+
+def record_location(lat: float, lon: float, name: str):
+    """Counts a place a user asked about (exponentially decayed request count per grid cell)"""
+    now = time.time()
+    cell = snap_to_grid(lat, lon)
+    entry = _popular.get(cell)
+    if entry is None:
+        if len(_popular) >= POPULARITY_MAX_TRACKED:
+            del _popular[min(_popular, key=lambda c: _decayed(_popular[c][0], _popular[c][1], now))]
+        _popular[cell] = [1.0, now, lat, lon, name]
+    else:
+        entry[0] = _decayed(entry[0], entry[1], now) + 1.0
+        entry[1] = now
+        entry[2], entry[3], entry[4] = lat, lon, name
+
+
+def popular_locations(n: int = WARMUP_TOP_LOCATIONS):
+    """[(lat, lon, name, score)] of the most requested places, best first"""
+    now = time.time()
+    ranked = sorted(_popular.values(), key=lambda e: -_decayed(e[0], e[1], now))[:n]
+    return [(lat, lon, name, round(_decayed(score, at, now), 3)) for score, at, lat, lon, name in ranked]
+
+
+async def _prefetch(lat: float, lon: float, name: str):
+    await get_current_weather(lat, lon)
+    _stats["weather_prefetched"] += 1
+    await get_location_name(lat, lon)
+    # Follow-up turns resolve the place by name from the chat summary ("In <name>, ...")
+    if name and name != "Unknown Location":
+        await get_coordinates_from_city(name)
+    _stats["geocodes_prefetched"] += 1
+
+
+async def run_probes():
+    """Connection-pool pings and a 1-token Gemini call; {probe: "ok" | status | error}"""
+    async def gemini():
+        await ping_gemini()
+        return "ok"
+
+    pools, model = await asyncio.gather(ping_http_pools(), gemini(), return_exceptions=True)
+    probes = dict(pools) if isinstance(pools, dict) else {"http": f"error: {pools}"}
+    probes["gemini"] = f"error: {model}" if isinstance(model, BaseException) else model
+    _stats["probe_errors"] += sum(1 for v in probes.values() if isinstance(v, str) and v.startswith("error"))
+    return probes
+
+
+async def warm_up_round():
+    """One idle warm-up: probes plus prefetch of the most requested places"""
+    start = time.perf_counter()
+    with span("warmup"):
+        probes, *prefetched = await asyncio.gather(
+            run_probes(),
+            *(_prefetch(lat, lon, name) for lat, lon, name, _ in popular_locations()),
+            return_exceptions=True,
+        )
+    failed = [p for p in prefetched if isinstance(p, BaseException)]
+    _stats["rounds"] += 1
+    _stats["last_round_at"] = time.time()
+    _stats["last_round_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    _stats["last_probes"] = probes if isinstance(probes, dict) else {"error": str(probes)}
+    print(f"🌡️ Idle warm-up: {len(prefetched)} places prefetched"
+          + (f" ({len(failed)} failed)" if failed else "") + f", probes {_stats['last_probes']}")
+    return _stats["last_probes"]
+
+
+async def _scheduler():
+    interval = WARMUP_IDLE_SECONDS
+    last_round = 0.0
+    while True:
+        await asyncio.sleep(WARMUP_CHECK_INTERVAL)
+        now = time.time()
+        if _active_requests or now - _last_activity < WARMUP_IDLE_SECONDS:
+            interval = WARMUP_IDLE_SECONDS
+            _stats["skipped_active"] += 1
+            continue
+        if last_round > _last_activity and now - last_round < interval:
+            continue
+        if last_round > _last_activity:
+            # Still the same idle period: back off
+            interval = min(interval * 2, WARMUP_MAX_INTERVAL)
+        try:
+            await warm_up_round()
+        except Exception as e:
+            print(f"⚠️ Idle warm-up failed: {e}")
+        last_round = time.time()
+
+
+def start_warmup_scheduler() -> asyncio.Task:
+    """Starts the idle warm-up loop (called from main.lifespan)"""
+    print(f"🌡️ Idle warm-up scheduler started (after {WARMUP_IDLE_SECONDS:.0f} s idle, "
+          f"up to every {WARMUP_MAX_INTERVAL:.0f} s)")
+    return asyncio.create_task(_scheduler(), name="warmup-scheduler")
+
+
+def get_warmup_stats():
+    return {
+        **_stats,
+        "idle_seconds": round(time.time() - _last_activity, 1),
+        "active_requests": _active_requests,
+        "tracked_locations": len(_popular),
+        "popular": [{"lat": lat, "lon": lon, "name": name, "score": score}
+                    for lat, lon, name, score in popular_locations()],
+    }
@@ -1,21 +1,236 @@
-import httpx
+import os
+import time
+import asyncio
+from .http_client import request_with_retry
 
-async def get_current_weather(lat: float, lon: float):
-    """Fetches current weather and tomorrow's forecast from Open-Meteo"""
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": "temperature_2m,relative_humidity_2m,is_day,precipitation,weather_code,wind_speed_10m",
-        "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,weather_code,wind_speed_10m_max",
-        "forecast_days": 2  # Today and tomorrow
+# Weather cache settings
+# Open-Meteo refreshes its models every 15 minutes, so anything fetched inside the
+# same quarter hour for the same grid cell is identical and can be shared.
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.05"))  # ~5 km cells
+MODEL_REFRESH_SECONDS = 15 * 60
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "4096"))
+# Cells per multi-coordinate Open-Meteo request (comma-separated latitude/longitude lists)
+WEATHER_BATCH_MAX = int(os.getenv("WEATHER_BATCH_MAX", "50"))
+# Past its quarter hour, a cell is still served (and refreshed in the background) for
+# WEATHER_STALE_WHILE_REVALIDATE seconds, and for WEATHER_STALE_IF_ERROR seconds if
+# Open-Meteo fails or its circuit is open
+WEATHER_STALE_WHILE_REVALIDATE = float(os.getenv("WEATHER_STALE_WHILE_REVALIDATE", "120"))
+WEATHER_STALE_IF_ERROR = float(os.getenv("WEATHER_STALE_IF_ERROR", "21600"))
+
+WEATHER_PARAMS = {
+    "current": "temperature_2m,relative_humidity_2m,is_day,precipitation,weather_code,wind_speed_10m",
+    "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,weather_code,wind_speed_10m_max",
+    "forecast_days": 2  # Today and tomorrow
+}
+
+_weather_cache = {}   # (cell_lat, cell_lon) -> (expires_at, data)
+_inflight = {}        # (cell_lat, cell_lon) -> asyncio.Task
+_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0, "batch_requests": 0, "batched_cells": 0,
+                "stale_revalidated": 0, "stale_on_error": 0}
+
+
+def snap_to_grid(lat: float, lon: float):
+    """Snaps coordinates to the center of their cache grid cell"""
+    grid = WEATHER_GRID_DEG
+    return round(round(lat / grid) * grid, 4), round(round(lon / grid) * grid, 4)
+
+
+def _next_refresh(now: float) -> float:
+    """Wall-clock time of the next Open-Meteo model refresh (quarter-hour boundary)"""
+    return (now // MODEL_REFRESH_SECONDS + 1) * MODEL_REFRESH_SECONDS
+
+
+def _store(key, data):
+    now = time.time()
+    if len(_weather_cache) >= WEATHER_CACHE_MAX_ENTRIES:
+        # Drop expired cells first, then the ones closest to expiry
+        for k in [k for k, (exp, _) in _weather_cache.items() if exp <= now]:
+            del _weather_cache[k]
+        while len(_weather_cache) >= WEATHER_CACHE_MAX_ENTRIES:
+            del _weather_cache[min(_weather_cache, key=lambda k: _weather_cache[k][0])]
+    _weather_cache[key] = (_next_refresh(now), data)
+
+
+def peek_weather(lat: float, lon: float):
+    """(expires_at, data) for the cell if cached and current, without counting a lookup"""
+    cached = _weather_cache.get(snap_to_grid(lat, lon))
+    if cached and cached[0] > time.time():
+        return cached
+    return None
+
+
+def prime_weather(lat: float, lon: float, data: dict, expires_at: float):
+    """Seeds the cache with a snapshot fetched elsewhere (e.g. a session saved by another worker)"""
+    key = snap_to_grid(lat, lon)
+    now = time.time()
+    cached = _weather_cache.get(key)
+    if expires_at > now and (cached is None or cached[0] <= now):
+        _store(key, data)
+        _weather_cache[key] = (expires_at, data)
+
+
+def get_weather_cache_stats():
+    """Hit/miss/coalesced counters used to size the grid"""
+    lookups = _cache_stats["hits"] + _cache_stats["misses"] + _cache_stats["coalesced"] + _cache_stats["stale_revalidated"]
+    served = _cache_stats["hits"] + _cache_stats["coalesced"] + _cache_stats["stale_revalidated"]
+    return {
+        **_cache_stats,
+        "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+        "entries": len(_weather_cache),
+        "inflight": len(_inflight),
+        "grid_deg": WEATHER_GRID_DEG,
     }
-    
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, params=params)
-        data = resp.json()
-        
+
+
+def _parse(data: dict):
     return {
         "current": data.get("current", {}),
         "daily": data.get("daily", {})
-    }
\ No newline at end of file
+    }
+
+
+async def _fetch_weather(lat: float, lon: float):
+    """Fetches current weather and tomorrow's forecast from Open-Meteo"""
+    url = "/v1/forecast"
+    params = {"latitude": lat, "longitude": lon, **WEATHER_PARAMS}
+
+    resp = await request_with_retry("open_meteo", "GET", url, params=params)
+    resp.raise_for_status()
+    return _parse(resp.json())
+
+
+async def _fetch_weather_many(keys):
+    """One Open-Meteo request for several cells; results in the same order as keys"""
+    params = {
+        "latitude": ",".join(str(lat) for lat, _ in keys),
+        "longitude": ",".join(str(lon) for _, lon in keys),
+        **WEATHER_PARAMS,
+    }
+    resp = await request_with_retry("open_meteo", "GET", "/v1/forecast", params=params)
+    resp.raise_for_status()
+    data = resp.json()
+    # A single coordinate comes back as an object, several as a list in request order
+    items = data if isinstance(data, list) else [data]
+    if len(items) != len(keys):
+        raise ValueError(f"Open-Meteo returned {len(items)} locations for {len(keys)}")
+    _cache_stats["batch_requests"] += 1
+    _cache_stats["batched_cells"] += len(keys)
+    return [_parse(item) for item in items]
+
+
+def _stale(cached, now: float, max_age: float):
+    """The cached data if it expired less than max_age seconds ago"""
+    if cached and now - cached[0] < max_age:
+        return cached[1]
+    return None
+
+
+def _fetch_in_background(key):
+    """Single-flight fetch of one cell; the task stores its own result"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_weather(*key))
+        _inflight[key] = task
+        # Store from the task itself so the result is cached even if the caller is cancelled
+        task.add_done_callback(lambda t: _on_fetched(key, t))
+    return task
+
+
+async def get_current_weather(lat: float, lon: float):
+    """Cached weather for the grid cell containing (lat, lon)"""
+    key = snap_to_grid(lat, lon)
+    now = time.time()
+
+    cached = _weather_cache.get(key)
+    if cached and cached[0] > now:
+        _cache_stats["hits"] += 1
+        return cached[1]
+
+    # Just past the quarter hour: answer now, refresh behind the request
+    stale = _stale(cached, now, WEATHER_STALE_WHILE_REVALIDATE)
+    if stale is not None:
+        _cache_stats["stale_revalidated"] += 1
+        _fetch_in_background(key)
+        return stale
+
+    # Single-flight: concurrent misses for the same cell share one upstream request
+    if key in _inflight:
+        _cache_stats["coalesced"] += 1
+    else:
+        _cache_stats["misses"] += 1
+    try:
+        return await asyncio.shield(_fetch_in_background(key))
+    except Exception:
+        stale = _stale(cached, now, WEATHER_STALE_IF_ERROR)
+        if stale is None:
+            raise
+        _cache_stats["stale_on_error"] += 1
+        return stale
+
+
+def _on_fetched(key, task):
+    _inflight.pop(key, None)
+    if not task.cancelled() and task.exception() is None:
+        _store(key, task.result())
+
+
+async def _pick(batch, i: int):
+    return (await batch)[i]
+
+
+async def _single(key):
+    return [await _fetch_weather(*key)]
+
+
+async def get_weather_batch(locations):
+    """
+    Cached weather for many (lat, lon) pairs, in the same order.
+    Cells that are cached or already being fetched are reused; all the others are fetched
+    together in multi-coordinate requests (WEATHER_BATCH_MAX cells each). Recently expired
+    cells are answered from the cache and refreshed in the same requests without waiting.
+    A failed lookup falls back to the last good value, or None, instead of failing the
+    whole batch.
+    """
+    keys = [snap_to_grid(lat, lon) for lat, lon in locations]
+    now = time.time()
+    results, waiting, missing, refresh = {}, {}, [], []
+    for key in dict.fromkeys(keys):
+        cached = _weather_cache.get(key)
+        stale = _stale(cached, now, WEATHER_STALE_WHILE_REVALIDATE)
+        if cached and cached[0] > now:
+            _cache_stats["hits"] += 1
+            results[key] = cached[1]
+        elif stale is not None:
+            _cache_stats["stale_revalidated"] += 1
+            results[key] = stale
+            if key not in _inflight:
+                refresh.append(key)
+        elif key in _inflight:
+            _cache_stats["coalesced"] += 1
+            waiting[key] = _inflight[key]
+        else:
+            _cache_stats["misses"] += 1
+            missing.append(key)
+
+    fetch = missing + refresh
+    for i in range(0, len(fetch), WEATHER_BATCH_MAX):
+        chunk = fetch[i:i + WEATHER_BATCH_MAX]
+        batch = asyncio.ensure_future(_fetch_weather_many(chunk) if len(chunk) > 1 else _single(chunk[0]))
+        for j, key in enumerate(chunk):
+            # Per-cell tasks, so concurrent get_current_weather calls coalesce onto the batch
+            task = asyncio.ensure_future(_pick(batch, j))
+            _inflight[key] = task
+            task.add_done_callback(lambda t, key=key: _on_fetched(key, t))
+            if key not in results:
+                waiting[key] = task
+
+    if waiting:
+        done = await asyncio.gather(*(asyncio.shield(t) for t in waiting.values()), return_exceptions=True)
+        for key, value in zip(waiting, done):
+            if isinstance(value, BaseException):
+                print(f"⚠️ Weather for {key} failed: {value}")
+                value = _stale(_weather_cache.get(key), now, WEATHER_STALE_IF_ERROR)
+                if value is not None:
+                    _cache_stats["stale_on_error"] += 1
+            results[key] = value
+    return [results[key] for key in keys]